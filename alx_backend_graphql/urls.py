@@ -16,10 +16,14 @@ Including another URLconf
 """
 from django.contrib import admin
 from django.urls import path
-from graphene_django.views import GraphQLView
+from crm.views import AsyncCRMGraphQLView, CRMGraphQLView, ExportView, metrics_view
 from django.views.decorators.csrf import csrf_exempt
 
 urlpatterns = [
     path('admin/', admin.site.urls),
-    path('graphql/', csrf_exempt(GraphQLView.as_view(graphiql=True))),
+    path('graphql/', csrf_exempt(CRMGraphQLView.as_view(graphiql=True))),
+    # Runs on the event loop when served over ASGI (asgi.py)
+    path('graphql/async/', csrf_exempt(AsyncCRMGraphQLView.as_view(graphiql=True))),
+    path('export/<slug:resource>/', ExportView.as_view()),
+    path('metrics/', metrics_view),
 ]
@@ -83,6 +83,9 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
+        # On disk, so concurrent test threads wait for the write lock; the
+        # shared in-memory database fails them with "table is locked"
+        'TEST': {'NAME': BASE_DIR / 'test_db.sqlite3'},
     }
 }
 
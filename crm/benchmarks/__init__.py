@@ -0,0 +1,46 @@
+"""
+crm/benchmarks
+Stand-alone benchmarks for the CRM app.
+
+Each module runs with ``python -m crm.benchmarks.<name>`` against a throwaway
+test database built from the configured DATABASES, so SQLite and Postgres
+can both be measured without touching real data.
+"""
+
+import os
+import tempfile
+from contextlib import contextmanager
+
+
+def setup_django():
+    # Importing crm runs crm/celery.py, which already defaults the settings
+    # module to crm.settings, so pin the project settings explicitly
+    os.environ["DJANGO_SETTINGS_MODULE"] = os.environ.get(
+        "CRM_BENCHMARK_SETTINGS", "alx_backend_graphql_crm.settings"
+    )
+    import django
+    django.setup()
+
+
+@contextmanager
+def test_database(on_disk=False):
+    """
+    Create the test database for the duration of the block. ``on_disk`` puts
+    a SQLite test database in a temp file so several threads can share it.
+    """
+    from django.conf import settings
+    from django.test.runner import DiscoverRunner
+
+    database = settings.DATABASES["default"]
+    if on_disk and database["ENGINE"].endswith("sqlite3"):
+        database.setdefault("TEST", {})["NAME"] = os.path.join(
+            tempfile.mkdtemp(prefix="crm-bench-"), "bench.sqlite3"
+        )
+        database.setdefault("OPTIONS", {}).setdefault("timeout", 30)
+
+    runner = DiscoverRunner(verbosity=0)
+    old_config = runner.setup_databases()
+    try:
+        yield
+    finally:
+        runner.teardown_databases(old_config)
@@ -0,0 +1,205 @@
+"""
+Sustained-load comparison of the WSGI and ASGI GraphQL views.
+
+Concurrent clients send the same query for a fixed time to the sync view
+(``/graphql/``, one thread per client as under a threaded WSGI server) and
+to the async view (``/graphql/async/``, one task per client on a single
+event loop), then report requests per second and latency percentiles.
+
+    python -m crm.benchmarks.asgi_load --clients 32 --duration 10
+
+By default both run in-process through Django's test clients against a
+seeded throwaway database. The views need a settings module whose
+GRAPHENE["SCHEMA"] imports:
+
+    CRM_BENCHMARK_SETTINGS=alx_backend_graphql.settings \\
+        python -m crm.benchmarks.asgi_load
+
+To measure real servers instead, start e.g.
+``gunicorn --threads 32 alx_backend_graphql.wsgi`` and
+``uvicorn alx_backend_graphql.asgi:application`` and pass their URLs:
+
+    python -m crm.benchmarks.asgi_load \\
+        --wsgi-url http://localhost:8000/graphql/ \\
+        --asgi-url http://localhost:8001/graphql/async/
+"""
+
+import argparse
+import asyncio
+import json
+import threading
+import time
+import urllib.request
+
+from . import setup_django, test_database
+
+# The limit is inlined: QueryCostRule prices a variable limit at the maximum page
+QUERY = """
+    query {
+      orders(limit: %d) { totalAmount customer { email } products { name } }
+    }
+"""
+
+
+def percentile(latencies, fraction):
+    if not latencies:
+        return None
+    ordered = sorted(latencies)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+def summarize(name, latencies, errors, elapsed):
+    return {
+        "path": name,
+        "requests": len(latencies),
+        "errors": errors,
+        "rps": round(len(latencies) / elapsed, 1),
+        "p50_ms": round(percentile(latencies, 0.50) * 1000, 2) if latencies else None,
+        "p99_ms": round(percentile(latencies, 0.99) * 1000, 2) if latencies else None,
+    }
+
+
+def run_threads(name, send, clients, duration):
+    """Call ``send()`` from ``clients`` threads until ``duration`` runs out."""
+    from django.db import connection
+
+    latencies = []
+    errors = []
+    deadline = time.perf_counter() + duration
+
+    def client():
+        try:
+            while time.perf_counter() < deadline:
+                started = time.perf_counter()
+                ok = send()
+                latencies.append(time.perf_counter() - started)
+                if not ok:
+                    errors.append(1)
+        finally:
+            connection.close()
+
+    workers = [threading.Thread(target=client) for _ in range(clients)]
+    started = time.perf_counter()
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    return summarize(name, latencies, len(errors), time.perf_counter() - started)
+
+
+def run_tasks(name, send, clients, duration):
+    """Await ``send()`` from ``clients`` tasks on one event loop."""
+    latencies = []
+    errors = []
+
+    async def client(deadline):
+        while time.perf_counter() < deadline:
+            started = time.perf_counter()
+            ok = await send()
+            latencies.append(time.perf_counter() - started)
+            if not ok:
+                errors.append(1)
+
+    async def main():
+        deadline = time.perf_counter() + duration
+        await asyncio.gather(*(client(deadline) for _ in range(clients)))
+
+    started = time.perf_counter()
+    asyncio.run(main())
+    return summarize(name, latencies, len(errors), time.perf_counter() - started)
+
+
+def ok_response(status, content):
+    return status == 200 and "errors" not in json.loads(content)
+
+
+def in_process(clients, duration, body):
+    from django.test import AsyncClient, Client
+
+    local = threading.local()
+
+    def wsgi_send():
+        if not hasattr(local, "client"):
+            local.client = Client()
+        response = local.client.post("/graphql/", body, content_type="application/json")
+        return ok_response(response.status_code, response.content)
+
+    async_client = AsyncClient()
+
+    async def asgi_send():
+        response = await async_client.post("/graphql/async/", body, content_type="application/json")
+        return ok_response(response.status_code, response.content)
+
+    return [
+        run_threads("wsgi", wsgi_send, clients, duration),
+        run_tasks("asgi", asgi_send, clients, duration),
+    ]
+
+
+def over_http(clients, duration, body, wsgi_url, asgi_url):
+    def sender(url):
+        def send():
+            request = urllib.request.Request(
+                url, data=body.encode(), headers={"Content-Type": "application/json"}
+            )
+            try:
+                with urllib.request.urlopen(request) as response:
+                    return ok_response(response.status, response.read())
+            except OSError:
+                return False
+        return send
+
+    results = []
+    for name, url in (("wsgi", wsgi_url), ("asgi", asgi_url)):
+        if url:
+            results.append(run_threads(name, sender(url), clients, duration))
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--clients", type=int, default=16, help="concurrent clients")
+    parser.add_argument("--duration", type=float, default=5.0, help="seconds per path")
+    parser.add_argument("--limit", type=int, default=20, help="orders per response")
+    parser.add_argument("--customers", type=int, default=200)
+    parser.add_argument("--orders", type=int, default=1000)
+    parser.add_argument("--cache", action="store_true", help="keep the response cache on")
+    parser.add_argument("--wsgi-url")
+    parser.add_argument("--asgi-url")
+    parser.add_argument("--output", help="also write the JSON report to this file")
+    args = parser.parse_args()
+
+    body = json.dumps({"query": QUERY % args.limit})
+    if args.wsgi_url or args.asgi_url:
+        results = over_http(args.clients, args.duration, body, args.wsgi_url, args.asgi_url)
+        vendor = None
+    else:
+        setup_django()
+        from django.conf import settings
+        from django.db import connection
+        from django.test.utils import setup_test_environment
+
+        from .seed import seed
+
+        setup_test_environment()
+        if not args.cache:
+            settings.CRM_RESPONSE_CACHE = None
+        with test_database(on_disk=True):
+            seed(customers=args.customers, products=50, orders=args.orders)
+            vendor = connection.vendor
+            results = in_process(args.clients, args.duration, body)
+
+    report = {
+        "vendor": vendor,
+        "clients": args.clients,
+        "duration": args.duration,
+        "results": results,
+    }
+    print(json.dumps(report, indent=2))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,119 @@
+"""
+Sequential vs batched GraphQL requests.
+
+Sends the same small operations (the dashboard-style queries below) once as
+separate POSTs and once as a single JSON-array POST, and reports the wall
+time of each. ``--rtt-ms`` adds a simulated network round trip per HTTP
+request, which is where most of the saving comes from on a real network.
+
+    CRM_BENCHMARK_SETTINGS=alx_backend_graphql.settings \\
+        python -m crm.benchmarks.batching --rounds 50 --rtt-ms 5
+
+Pass ``--url`` to measure a running server instead of the in-process view.
+"""
+
+import argparse
+import json
+import statistics
+import time
+import urllib.request
+
+from . import setup_django, test_database
+
+OPERATIONS = [
+    {"query": "{ hello }"},
+    {"query": "{ crmStats { totalCustomers totalOrders totalRevenue } }"},
+    {"query": "{ orders(limit: 10) { totalAmount customer { email } } }"},
+    {"query": "{ products(limit: 10) { name stock } }"},
+    {"query": "{ allCustomers(first: 10) { totalCount edges { node { email } } } }"},
+]
+
+
+def in_process_sender(rtt):
+    from django.test import Client
+
+    client = Client()
+
+    def send(body):
+        time.sleep(rtt)
+        response = client.post("/graphql/", body, content_type="application/json")
+        assert response.status_code == 200, response.content
+        return json.loads(response.content)
+    return send
+
+
+def http_sender(url, rtt):
+    def send(body):
+        time.sleep(rtt)
+        request = urllib.request.Request(
+            url, data=body.encode(), headers={"Content-Type": "application/json"}
+        )
+        with urllib.request.urlopen(request) as response:
+            return json.loads(response.read())
+    return send
+
+
+def run(send, rounds):
+    sequential = []
+    batched = []
+    for _ in range(rounds):
+        started = time.perf_counter()
+        for operation in OPERATIONS:
+            send(json.dumps(operation))
+        sequential.append(time.perf_counter() - started)
+
+        started = time.perf_counter()
+        send(json.dumps(OPERATIONS))
+        batched.append(time.perf_counter() - started)
+
+    def summary(samples):
+        return {
+            "mean_ms": round(statistics.mean(samples) * 1000, 2),
+            "p50_ms": round(statistics.median(samples) * 1000, 2),
+        }
+
+    return {
+        "operations": len(OPERATIONS),
+        "rounds": rounds,
+        "sequential": summary(sequential),
+        "batched": summary(batched),
+        "saved_ms": round((statistics.mean(sequential) - statistics.mean(batched)) * 1000, 2),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--rounds", type=int, default=30)
+    parser.add_argument("--rtt-ms", type=float, default=0.0,
+                        help="simulated network round trip added per request")
+    parser.add_argument("--cache", action="store_true", help="keep the response cache on")
+    parser.add_argument("--url", help="measure this running endpoint instead")
+    parser.add_argument("--output", help="also write the JSON report to this file")
+    args = parser.parse_args()
+
+    rtt = args.rtt_ms / 1000
+    if args.url:
+        report = run(http_sender(args.url, rtt), args.rounds)
+    else:
+        setup_django()
+        from django.conf import settings
+        from django.test.utils import setup_test_environment
+
+        from .seed import seed
+
+        setup_test_environment()
+        if not args.cache:
+            settings.CRM_RESPONSE_CACHE = None
+        with test_database():
+            seed(customers=200, products=50, orders=1000)
+            report = run(in_process_sender(rtt), args.rounds)
+
+    report["rtt_ms"] = args.rtt_ms
+    print(json.dumps(report, indent=2))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
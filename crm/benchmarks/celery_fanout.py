@@ -0,0 +1,155 @@
+"""
+Range-partitioned Celery chords at increasing worker concurrency.
+
+Seeds a throwaway test database, then runs the CRM report and the order
+reminders of crm/tasks.py on an in-process worker with an in-memory broker
+and result backend, once for every ``--concurrency``. Each job runs as a
+single task over every id (the serial baseline, at concurrency 1) and as a
+chord of ``--chunk-size`` id ranges. The report gives the median wall time
+of a run and its speed-up over the serial one:
+
+    python -m crm.benchmarks.celery_fanout --customers 20000 --orders 100000 \\
+        --concurrency 1 2 4 8
+
+The worker uses the threads pool, so SQLite serialises the reminders'
+writes and the GIL caps the Python side; point CRM_BENCHMARK_SETTINGS at
+Postgres settings to see how the database work scales.
+"""
+
+import argparse
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+from contextlib import contextmanager
+
+from celery.backends.cache import CacheBackend
+
+from . import setup_django, test_database
+
+
+class MemoryBackend(CacheBackend):
+    """
+    The ``cache+memory://`` result backend, polling at 1 ms. A chord's
+    callback is started from a join that otherwise always sleeps 0.5s,
+    which would hide the time the range tasks themselves take.
+    """
+
+    def get_many(self, task_ids, **kwargs):
+        return super().get_many(task_ids, **dict(kwargs, interval=0.001))
+
+
+@contextmanager
+def memory_app(**conf):
+    """
+    A Celery app with an in-memory broker and result backend, current for
+    the block so the crm tasks run on it. Pass ``task_always_eager=True``
+    to run them in the calling thread instead of on a worker.
+    """
+    from celery import Celery, current_app
+
+    previous = current_app._get_current_object()
+    app = Celery("crm-fanout", broker="memory://", backend=f"{__name__}:MemoryBackend",
+                 set_as_current=True)
+    app.conf.cache_backend = "memory"
+    # The memory transport otherwise checks for new messages once a second
+    app.conf.broker_transport_options = {"polling_interval": 0.001}
+    # An in-process worker stops reading the memory transport for 2s each
+    # time its prefetch limit is reached; let it hold every range at once
+    app.conf.worker_prefetch_multiplier = 64
+    app.conf.update(conf)
+    try:
+        yield app
+    finally:
+        previous.set_current()
+        app.close()
+
+
+def jobs():
+    from crm import tasks
+    from crm.models import Order
+
+    def reset_reminders():
+        Order.objects.update(reminder_sent_at=None)
+
+    # name: (fan-out function, called before every run)
+    return {
+        "report": (tasks.fan_out_crm_report, lambda: None),
+        "reminders": (tasks.fan_out_order_reminders, reset_reminders),
+    }
+
+
+def measure(app, fan_out, reset, chunk_size, concurrency, repeat):
+    from celery.contrib.testing.worker import start_worker
+
+    samples = []
+    with start_worker(app, pool="threads", concurrency=concurrency,
+                      perform_ping_check=False, loglevel="WARNING"):
+        for _ in range(repeat):
+            reset()
+            started = time.perf_counter()
+            result = fan_out(chunk_size).get(timeout=600, interval=0.001)
+            samples.append(time.perf_counter() - started)
+    return round(statistics.median(samples) * 1000, 3), result
+
+
+def run(concurrencies, chunk_size, repeat, log_dir):
+    from crm import tasks
+
+    tasks.LOG_FILE = os.path.join(log_dir, "report.log")
+    tasks.REMINDERS_LOG_FILE = os.path.join(log_dir, "reminders.log")
+
+    report = {}
+    with memory_app() as app:
+        for name, (fan_out, reset) in jobs().items():
+            # One range covering every id is the serial task
+            serial_ms, expected = measure(app, fan_out, reset, sys.maxsize, 1, repeat)
+            runs = {}
+            for concurrency in concurrencies:
+                median_ms, result = measure(app, fan_out, reset, chunk_size, concurrency, repeat)
+                if result != expected:
+                    raise AssertionError(f"{name} at concurrency {concurrency}: {result} != {expected}")
+                runs[concurrency] = {"median_ms": median_ms, "speedup": round(serial_ms / median_ms, 2)}
+            report[name] = {"serial_ms": serial_ms, "result": expected, "chords": runs}
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--customers", type=int, default=5000)
+    parser.add_argument("--products", type=int, default=100)
+    parser.add_argument("--orders", type=int, default=20000)
+    parser.add_argument("--chunk-size", type=int, default=2000, help="ids per range task")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 2, 4, 8],
+                        help="worker threads to measure")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--output", help="also write the JSON report to this file")
+    args = parser.parse_args()
+
+    setup_django()
+    from django.conf import settings
+
+    from .seed import seed
+
+    settings.CRM_RESPONSE_CACHE = None
+    with test_database(on_disk=True), tempfile.TemporaryDirectory() as log_dir:
+        # Every order inside the reminders' 7-day window
+        seed(customers=args.customers, products=args.products, orders=args.orders, days=6)
+        report = {
+            "customers": args.customers,
+            "orders": args.orders,
+            "chunk_size": args.chunk_size,
+            "repeat": args.repeat,
+            "jobs": run(args.concurrency, args.chunk_size, args.repeat, log_dir),
+        }
+
+    print(json.dumps(report, indent=2))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,114 @@
+"""
+Query plans and latency of every crm/filters.py lookup, without and with
+the indexes from migration 0003.
+
+    python -m crm.benchmarks.filter_indexes --orders 1000000 --output indexes.json
+"""
+
+import argparse
+import importlib
+import json
+import statistics
+import time
+from datetime import timedelta
+
+from . import setup_django, test_database
+
+index_migration = None
+
+
+def filter_cases():
+    from django.utils import timezone
+    from crm.filters import CustomerFilter, ProductFilter, OrderFilter
+
+    today = timezone.now().date()
+    last_week = (today - timedelta(days=7)).isoformat()
+    last_month = (today - timedelta(days=30)).isoformat()
+    return [
+        ("OrderFilter order_date range", OrderFilter,
+         {"order_date_gte": last_week, "order_date_lte": today.isoformat()}),
+        ("OrderFilter total_amount range", OrderFilter,
+         {"total_amount_gte": "100", "total_amount_lte": "120"}),
+        ("OrderFilter customer_name", OrderFilter, {"customer_name": "customer 4242"}),
+        ("OrderFilter product_name", OrderFilter, {"product_name": "product 17"}),
+        ("ProductFilter price range", ProductFilter, {"price_gte": "10", "price_lte": "20"}),
+        ("ProductFilter stock_lte", ProductFilter, {"stock_lte": "5"}),
+        ("ProductFilter name", ProductFilter, {"name": "Product 17"}),
+        ("CustomerFilter createdAt range", CustomerFilter, {"createdAtGte": last_month}),
+        ("CustomerFilter phonePattern", CustomerFilter, {"phonePattern": "+2547001"}),
+        ("CustomerFilter name", CustomerFilter, {"name": "customer 4242"}),
+    ]
+
+
+def measure(queryset, repeat):
+    page, count = [], []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        list(queryset.values_list("pk", flat=True)[:100])
+        page.append(time.perf_counter() - started)
+        started = time.perf_counter()
+        queryset.count()
+        count.append(time.perf_counter() - started)
+    return {
+        "page_ms": round(statistics.median(page) * 1000, 3),
+        "count_ms": round(statistics.median(count) * 1000, 3),
+        "plan": queryset.explain(),
+    }
+
+
+def set_indexes(enabled):
+    from django.db import connection
+    from crm.models import Customer, Product, Order
+
+    with connection.schema_editor() as editor:
+        for model in (Customer, Product, Order):
+            for index in model._meta.indexes:
+                (editor.add_index if enabled else editor.remove_index)(model, index)
+        if enabled:
+            index_migration.create_trigram_indexes(None, editor)
+        else:
+            index_migration.drop_trigram_indexes(None, editor)
+    with connection.cursor() as cursor:
+        cursor.execute("ANALYZE")
+
+
+def run(customers, products, orders, repeat):
+    from .seed import seed
+
+    global index_migration
+    index_migration = importlib.import_module("crm.migrations.0003_filter_indexes")
+
+    seeded = seed(customers=customers, products=products, orders=orders)
+    cases = filter_cases()
+    results = {name: {} for name, _, _ in cases}
+    for label, enabled in (("before", False), ("after", True)):
+        set_indexes(enabled)
+        for name, filterset_class, data in cases:
+            filterset = filterset_class(data=data, queryset=filterset_class._meta.model.objects.all())
+            results[name][label] = measure(filterset.qs, repeat)
+    return {"seeded": seeded, "filters": results}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--customers", type=int, default=100000)
+    parser.add_argument("--products", type=int, default=1000)
+    parser.add_argument("--orders", type=int, default=200000)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--output", help="write the JSON report here instead of stdout")
+    args = parser.parse_args()
+
+    setup_django()
+    with test_database(on_disk=True):
+        report = run(args.customers, args.products, args.orders, args.repeat)
+
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output + "\n")
+    else:
+        print(output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,216 @@
+"""
+Pooled GraphQL client vs a new transport per job.
+
+Sends the job documents of crm/queries.py to a local stub server. The
+first pass works the old way, as a gql RequestsHTTPTransport built per
+call did: a new TCP connection and a fresh parse of the document every
+time. The second pass goes through the keep-alive client of crm/graphql_client.py. The
+report gives the connections each pass opened and the mean latency per job.
+``--connect-delay-ms`` makes the stub slow to accept connections, standing
+in for a TLS handshake or a remote network:
+
+    python -m crm.benchmarks.graphql_client --rounds 200 --connect-delay-ms 5
+
+No database or Django setup is needed.
+"""
+
+import argparse
+import json
+import re
+import statistics
+import threading
+import time
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from crm.queries import (
+    CRM_REPORT, HEARTBEAT, MARK_REMINDERS_SENT, PENDING_REMINDERS, PERSISTED_QUERIES, UPDATE_LOW_STOCK,
+)
+
+OPERATION_RE = re.compile(r"\b(?:query|mutation)\s+(\w+)")
+
+RESPONSES = {
+    "Heartbeat": {"hello": "Hello, GraphQL!"},
+    "UpdateLowStock": {"updateLowStockProducts": {
+        "success": True, "message": "Restocked 1 low-stock products.",
+        "updatedProducts": [{"id": "UHJvZHVjdFR5cGU6MQ==", "name": "Pen", "price": 2.5, "stock": 12}],
+    }},
+    "CrmReport": {"crmStats": {"totalCustomers": 3, "totalOrders": 5, "totalRevenue": 42.5}},
+    "MarkRemindersSent": {"markOrderRemindersSent": {"marked": 1}},
+    "PendingReminders": {"allOrders": {"edges": [
+        {"node": {"id": "T3JkZXJUeXBlOjE=", "orderDate": "2025-01-02T00:00:00+00:00",
+                  "customer": {"email": "ann@example.com"}}},
+    ]}},
+}
+
+# The requests each job sends per run
+JOBS = {
+    "log_crm_heartbeat": [(HEARTBEAT, None)],
+    "update_low_stock": [(UPDATE_LOW_STOCK, None)],
+    "generate_crm_report": [(CRM_REPORT, None)],
+    "send_order_reminders": [
+        (PENDING_REMINDERS, {"since": "2025-01-01"}),
+        (MARK_REMINDERS_SENT, {"orderIds": ["T3JkZXJUeXBlOjE="]}),
+    ],
+}
+
+
+class StubServer:
+    """
+    Threaded HTTP/1.1 server answering the job documents with canned data.
+    It counts accepted connections, keeps the payloads it received, and
+    answers with each status queued in ``statuses`` before succeeding.
+    """
+
+    def __init__(self, connect_delay=0.0, persisted=True):
+        self.connect_delay = connect_delay
+        self.persisted = persisted
+        self.connections = 0
+        self.payloads = []
+        self.statuses = deque()
+        self._lock = threading.Lock()
+        self.server = self.build_server()
+
+    @property
+    def url(self):
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}/graphql"
+
+    def build_server(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            # Headers and body go out in separate writes; without this a
+            # kept-alive connection waits on delayed ACKs
+            disable_nagle_algorithm = True
+
+            def do_POST(self):
+                payload = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+                status, body = stub.respond(payload)
+                data = json.dumps(body).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, *args):
+                pass
+
+        class Server(ThreadingHTTPServer):
+            daemon_threads = True
+
+            def verify_request(self, request, client_address):
+                with stub._lock:
+                    stub.connections += 1
+                time.sleep(stub.connect_delay)
+                return True
+
+        return Server(("127.0.0.1", 0), Handler)
+
+    def respond(self, payload):
+        with self._lock:
+            self.payloads.append(payload)
+            status = self.statuses.popleft() if self.statuses else 200
+        if status != 200:
+            return status, {"errors": [{"message": f"HTTP {status}"}]}
+
+        query = payload.get("query")
+        if query is None:
+            sha256 = ((payload.get("extensions") or {}).get("persistedQuery") or {}).get("sha256Hash")
+            query = PERSISTED_QUERIES.get(sha256) if self.persisted else None
+            if query is None:
+                return 200, {"errors": [{
+                    "message": "PersistedQueryNotFound",
+                    "extensions": {"code": "PERSISTED_QUERY_NOT_FOUND"},
+                }]}
+        match = OPERATION_RE.search(query)
+        name = payload.get("operationName") or (match.group(1) if match else None)
+        if name not in RESPONSES:
+            return 400, {"errors": [{"message": f"Unknown operation {name}"}]}
+        return 200, {"data": RESPONSES[name]}
+
+    def __enter__(self):
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+def transport_per_job(endpoint):
+    """
+    What the jobs did before. gql's RequestsHTTPTransport opens a new
+    requests.Session on every connect and parses the document with gql()
+    each time. This does the same with requests and graphql-core directly,
+    so the baseline runs without gql's optional transport dependencies.
+    """
+    import requests
+    from graphql import parse, print_ast
+
+    def execute(document, variables=None):
+        query = print_ast(parse(document))
+        with requests.Session() as session:
+            response = session.post(endpoint, json={"query": query, "variables": variables})
+        response.raise_for_status()
+        return response.json()["data"]
+    return execute
+
+
+def pooled(endpoint):
+    from crm.graphql_client import GraphQLClient
+
+    client = GraphQLClient(endpoint)
+    return lambda document, variables=None: client.execute(document, variables)
+
+
+def run(make_execute, rounds, connect_delay):
+    timings = {name: [] for name in JOBS}
+    with StubServer(connect_delay=connect_delay) as stub:
+        execute = make_execute(stub.url)
+        for _ in range(rounds):
+            for name, calls in JOBS.items():
+                started = time.perf_counter()
+                for document, variables in calls:
+                    execute(document, variables)
+                timings[name].append(time.perf_counter() - started)
+        return {
+            "connections": stub.connections,
+            "requests": len(stub.payloads),
+            "jobs": {
+                name: round(statistics.mean(samples) * 1000, 3)
+                for name, samples in timings.items()
+            },
+        }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--rounds", type=int, default=100, help="runs of every job")
+    parser.add_argument("--connect-delay-ms", type=float, default=0.0,
+                        help="delay the stub adds to each new connection")
+    parser.add_argument("--output", help="also write the JSON report to this file")
+    args = parser.parse_args()
+
+    delay = args.connect_delay_ms / 1000
+    before = run(transport_per_job, args.rounds, delay)
+    after = run(pooled, args.rounds, delay)
+    report = {
+        "rounds": args.rounds,
+        "connect_delay_ms": args.connect_delay_ms,
+        "per_job_transport": before,
+        "pooled_client": after,
+        "saved_ms_per_job": {
+            name: round(before["jobs"][name] - after["jobs"][name], 3) for name in before["jobs"]
+        },
+    }
+    print(json.dumps(report, indent=2))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,102 @@
+"""
+Synthetic CRM data for the benchmarks.
+
+Rows are written with chunked bulk_create so a million orders can be seeded
+in minutes, with dates spread over a window so range filters are selective.
+"""
+
+import random
+from contextlib import contextmanager
+from datetime import timedelta
+from decimal import Decimal
+
+from django.db import transaction
+from django.utils import timezone
+
+from crm.catalog import invalidate_products
+from crm.customer_stats import record_orders
+from crm.models import Customer, Product, Order
+
+
+@contextmanager
+def explicit_dates(*fields):
+    # auto_now_add would stamp every seeded row with the same instant
+    for field in fields:
+        field.auto_now_add = False
+    try:
+        yield
+    finally:
+        for field in fields:
+            field.auto_now_add = True
+
+
+def _chunks(count, size):
+    for start in range(0, count, size):
+        yield start, min(size, count - start)
+
+
+def seed(customers=1000, products=100, orders=5000, products_per_order=3,
+         days=365, batch_size=5000, random_seed=0):
+    """Insert the requested number of rows and return the counts written."""
+    rng = random.Random(random_seed)
+    now = timezone.now()
+    offset = Customer.objects.count()
+
+    def past_date():
+        return now - timedelta(seconds=rng.randrange(days * 24 * 3600))
+
+    with explicit_dates(Customer._meta.get_field("created_at"),
+                        Order._meta.get_field("order_date")), transaction.atomic():
+        product_rows = Product.objects.bulk_create([
+            Product(
+                name=f"Product {i}",
+                price=Decimal(rng.randrange(100, 100000)) / 100,
+                stock=rng.randrange(0, 200),
+            )
+            for i in range(products)
+        ], batch_size=batch_size)
+        # bulk_create sends no post_save, and ids may be reused after a rollback
+        invalidate_products(product.pk for product in product_rows)
+        prices = {product.pk: product.price for product in product_rows}
+        product_ids = list(prices)
+
+        customer_ids = []
+        for start, size in _chunks(customers, batch_size):
+            rows = []
+            for i in range(offset + start, offset + start + size):
+                if i % 4:
+                    phone = f"+2547{rng.randrange(10 ** 8):08d}"
+                else:
+                    phone = f"{rng.randrange(200, 999)}-555-{rng.randrange(10 ** 4):04d}"
+                rows.append(Customer(
+                    name=f"Customer {i}",
+                    email=f"customer{i}@example.com",
+                    phone=phone,
+                    created_at=past_date(),
+                ))
+            customer_ids.extend(c.pk for c in Customer.objects.bulk_create(rows))
+
+        OrderProduct = Order.products.through
+        per_order = min(products_per_order, len(product_ids))
+        for _, size in _chunks(orders if customer_ids and per_order else 0, batch_size):
+            picks = [rng.sample(product_ids, per_order) for _ in range(size)]
+            order_rows = Order.objects.bulk_create([
+                Order(
+                    customer_id=rng.choice(customer_ids),
+                    total_amount=sum(prices[pid] for pid in pick),
+                    order_date=past_date(),
+                )
+                for pick in picks
+            ])
+            OrderProduct.objects.bulk_create([
+                OrderProduct(order_id=order.pk, product_id=pid)
+                for order, pick in zip(order_rows, picks)
+                for pid in pick
+            ], batch_size=batch_size)
+            record_orders(order_rows)
+
+    return {
+        "customers": len(customer_ids),
+        "products": len(product_ids),
+        "orders": orders if customer_ids and per_order else 0,
+    }
@@ -0,0 +1,99 @@
+"""
+Concurrent CreateOrder stress test.
+
+Several threads place single-product orders against one product until its
+stock runs out, then report throughput and whether anything was oversold.
+The run fails when no order was placed or when stock was oversold.
+
+    python -m crm.benchmarks.stock_reservation --threads 16 --stock 500
+"""
+
+import argparse
+import json
+import sys
+import threading
+import time
+from decimal import Decimal
+from types import SimpleNamespace
+
+from . import setup_django, test_database
+
+CREATE_ORDER = """
+    mutation ($customerId: ID!, $productIds: [ID!]!) {
+      createOrder(input: {customerId: $customerId, productIds: $productIds}) {
+        order { id }
+      }
+    }
+"""
+
+
+def run(threads, attempts, stock):
+    from django.db import connection
+    from alx_backend_graphql.schema import schema
+    from crm.models import Customer, Product, Order
+
+    customer = Customer.objects.create(name="Bench", email="bench@example.com")
+    product = Product.objects.create(name="Bench product", price=Decimal("1.00"), stock=stock)
+    variables = {"customerId": str(customer.pk), "productIds": [str(product.pk)]}
+    placed = []
+    failed = []
+    first_error = []
+
+    def place_orders():
+        try:
+            for _ in range(attempts):
+                result = schema.execute(
+                    CREATE_ORDER, variable_values=variables, context_value=SimpleNamespace()
+                )
+                if result.errors and not first_error:
+                    first_error.append(result.errors[0].message)
+                (failed if result.errors else placed).append(1)
+        finally:
+            connection.close()
+
+    workers = [threading.Thread(target=place_orders) for _ in range(threads)]
+    started = time.perf_counter()
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    elapsed = time.perf_counter() - started
+
+    product.refresh_from_db()
+    return {
+        "vendor": connection.vendor,
+        "threads": threads,
+        "attempts": threads * attempts,
+        "placed": len(placed),
+        "rejected": len(failed),
+        "orders_in_db": Order.objects.count(),
+        "final_stock": product.stock,
+        "oversold": max(0, len(placed) - stock),
+        "seconds": round(elapsed, 4),
+        "attempts_per_second": round(threads * attempts / elapsed, 1),
+        "first_error": first_error[0] if first_error else None,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--threads", type=int, default=8)
+    parser.add_argument("--attempts", type=int, default=50, help="orders tried per thread")
+    parser.add_argument("--stock", type=int, default=200)
+    args = parser.parse_args()
+
+    setup_django()
+    with test_database(on_disk=True):
+        report = run(args.threads, args.attempts, args.stock)
+    print(json.dumps(report, indent=2))
+
+    if not report["placed"]:
+        print(f"FAILED no order was placed: {report['first_error']}", file=sys.stderr)
+        sys.exit(1)
+    if report["oversold"] or report["orders_in_db"] != report["placed"]:
+        print("FAILED stock was oversold", file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,377 @@
+"""
+Regression suite: every query and mutation in crm/schema.py, every filter in
+crm/filters.py and every cron job, run against seeded synthetic data.
+
+Each case is run once to warm up, then ``--repeat`` times with its SQL
+queries counted and timed, then once more under tracemalloc for its peak
+memory. Every run, queries included, happens inside a transaction that is
+rolled back, so each repetition sees the same data. The JSON report can be
+compared with an earlier one to catch regressions between commits:
+
+    python -m crm.benchmarks.suite --output before.json
+    git checkout my-branch
+    python -m crm.benchmarks.suite --compare before.json
+
+``--compare`` exits with status 1 when a case runs more queries, or is
+slower or heavier by more than ``--tolerance`` (and ``--min-delta-ms`` for
+latency). ``--existing`` runs against the configured database (see the
+seed_crm management command) instead of a freshly seeded test database.
+"""
+
+import argparse
+import contextlib
+import importlib.util
+import io
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import timedelta
+
+from . import setup_django, test_database
+
+QUERIES = {
+    "hello": "{ hello }",
+    "customers": "{ customers(limit: 100) { id name email phone totalSpent } }",
+    "products": "{ products(limit: 100) { id name price stock } }",
+    "orders": """{
+        orders(limit: 100) {
+          id totalAmount orderDate customer { name email } products { name price }
+        }
+    }""",
+    "allCustomers": """{
+        allCustomers(first: 100) { totalCount edges { node { id name email } } }
+    }""",
+    "allProducts": """{
+        allProducts(first: 100) { totalCount edges { node { id name price stock } } }
+    }""",
+    "allOrders": """{
+        allOrders(first: 100) {
+          totalCount
+          edges { node { id totalAmount customer { email } products { name } } }
+        }
+    }""",
+    "allOrders keyset": """{
+        allOrders(first: 100, keyset: true) { edges { cursor node { id totalAmount } } }
+    }""",
+    "crmStats": "{ crmStats { totalCustomers totalOrders totalRevenue } }",
+    "crmStats buckets": """{
+        crmStats(groupBy: WEEK) { buckets { period orders revenue customers } }
+    }""",
+}
+
+MUTATIONS = {
+    "createCustomer": """
+        mutation ($input: CreateCustomerInput!) {
+          createCustomer(input: $input) { customer { id } message }
+        }
+    """,
+    "bulkCreateCustomers": """
+        mutation ($input: [CustomerInput!]!) {
+          bulkCreateCustomers(input: $input) { customers { id } errors }
+        }
+    """,
+    "createProduct": """
+        mutation ($input: CreateProductInput!) {
+          createProduct(input: $input) { product { id } }
+        }
+    """,
+    "createOrder": """
+        mutation ($input: CreateOrderInput!) {
+          createOrder(input: $input) { order { id totalAmount } }
+        }
+    """,
+    "bulkCreateOrders": """
+        mutation ($input: [CreateOrderInput!]!) {
+          bulkCreateOrders(input: $input) {
+            orders { id totalAmount customer { email } products { name } }
+            errors
+          }
+        }
+    """,
+    "markOrderRemindersSent": """
+        mutation ($orderIds: [OrderID!]!) {
+          markOrderRemindersSent(orderIds: $orderIds) { marked }
+        }
+    """,
+    "updateLowStockProducts": """
+        mutation {
+          updateLowStockProducts(threshold: 10, increment: 10) {
+            success updatedProducts { id stock }
+          }
+        }
+    """,
+}
+
+FILTER_CONNECTIONS = {
+    "CustomerFilter": "allCustomers",
+    "ProductFilter": "allProducts",
+    "OrderFilter": "allOrders",
+}
+
+
+def filter_arguments():
+    """(filterset, GraphQL argument, literal) for every filter in crm/filters.py."""
+    from django.utils import timezone
+
+    today = timezone.now().date()
+    last_week = f'"{(today - timedelta(days=7)).isoformat()}"'
+    last_month = f'"{(today - timedelta(days=30)).isoformat()}"'
+    return [
+        ("CustomerFilter", "name", '"customer 42"'),
+        ("CustomerFilter", "email", '"customer42"'),
+        ("CustomerFilter", "createdAtGte", last_month),
+        ("CustomerFilter", "createdAtLte", last_month),
+        ("CustomerFilter", "phonePattern", '"+2547"'),
+        ("CustomerFilter", "totalSpentGte", "1000"),
+        ("CustomerFilter", "totalSpentLte", "100"),
+        ("CustomerFilter", "orderCountGte", "5"),
+        ("CustomerFilter", "lastOrderDateGte", last_week),
+        ("CustomerFilter", "lastOrderDateLte", last_month),
+        ("ProductFilter", "name", '"Product 7"'),
+        ("ProductFilter", "priceGte", "100"),
+        ("ProductFilter", "priceLte", "20"),
+        ("ProductFilter", "stockGte", "150"),
+        ("ProductFilter", "stockLte", "10"),
+        ("OrderFilter", "totalAmountGte", "1500"),
+        ("OrderFilter", "totalAmountLte", "300"),
+        ("OrderFilter", "orderDateGte", last_week),
+        ("OrderFilter", "orderDateLte", last_month),
+        ("OrderFilter", "customerName", '"customer 42"'),
+        ("OrderFilter", "productName", '"product 7"'),
+        ("OrderFilter", "reminderPending", "true"),
+        ("OrderFilter", "customerId", '"42"'),
+    ]
+
+
+def filter_document(filterset, argument, literal):
+    return (
+        f"{{ {FILTER_CONNECTIONS[filterset]}(first: 100, {argument}: {literal}) "
+        f"{{ totalCount edges {{ node {{ id }} }} }} }}"
+    )
+
+
+def mutation_variables(count=100):
+    """Variables for each MUTATIONS document, using rows already in the database."""
+    from crm.models import Customer, Order, Product
+
+    customer_ids = [str(pk) for pk in Customer.objects.order_by("pk").values_list("pk", flat=True)[:count]]
+    product_ids = [
+        str(pk) for pk in
+        Product.objects.filter(stock__gte=count).order_by("pk").values_list("pk", flat=True)[:3]
+    ]
+    order_ids = [str(pk) for pk in Order.objects.order_by("-pk").values_list("pk", flat=True)[:count]]
+    orders = [
+        {"customerId": customer_ids[i % len(customer_ids)], "productIds": product_ids}
+        for i in range(count)
+    ]
+    return {
+        "createCustomer": {"input": {
+            "name": "Bench Customer", "email": "bench@example.com", "phone": "+254700000000",
+        }},
+        "bulkCreateCustomers": {"input": [
+            {"name": f"Bench {i}", "email": f"bench{i}@example.com"} for i in range(count)
+        ]},
+        "createProduct": {"input": {"name": "Bench Product", "price": 9.99, "stock": 10}},
+        "createOrder": {"input": orders[0]},
+        "bulkCreateOrders": {"input": orders},
+        "markOrderRemindersSent": {"orderIds": order_ids},
+        "updateLowStockProducts": None,
+    }
+
+
+def load_script(path, name):
+    spec = importlib.util.spec_from_file_location(name, path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def cron_jobs(log_dir):
+    """The cron and Celery jobs, with their log files moved into ``log_dir``."""
+    import crm
+    from crm import cron, tasks
+
+    reminders = load_script(
+        os.path.join(os.path.dirname(crm.__file__), "cron_jobs", "send_order_reminders.py"),
+        "crm_send_order_reminders",
+    )
+    cron.LOG_FILE = os.path.join(log_dir, "heartbeat.log")
+    cron.LOG_LOW_PROD_FILE = os.path.join(log_dir, "low_stock.log")
+    tasks.LOG_FILE = os.path.join(log_dir, "report.log")
+    reminders.LOG_FILE = os.path.join(log_dir, "reminders.log")
+
+    def send_order_reminders():
+        with contextlib.redirect_stdout(io.StringIO()):
+            reminders.main()
+
+    return {
+        "log_crm_heartbeat": cron.log_crm_heartbeat,
+        "update_low_stock": cron.update_low_stock,
+        "generate_crm_report": tasks.generate_crm_report,
+        "send_order_reminders": send_order_reminders,
+    }
+
+
+def build_cases(executor, log_dir):
+    """(group, name, callable) for every benchmarked operation."""
+    cases = [
+        ("query", name, lambda document=document: executor.execute(document))
+        for name, document in QUERIES.items()
+    ]
+    variables = mutation_variables()
+    cases += [
+        ("mutation", name,
+         lambda document=document, values=variables[name]: executor.execute(document, values))
+        for name, document in MUTATIONS.items()
+    ]
+    cases += [
+        ("filter", f"{filterset}.{argument}",
+         lambda document=filter_document(filterset, argument, literal): executor.execute(document))
+        for filterset, argument, literal in filter_arguments()
+    ]
+    cases += [("cron", name, job) for name, job in cron_jobs(log_dir).items()]
+    return cases
+
+
+def run_once(call):
+    """Run ``call`` in a rolled-back transaction; return (seconds, queries)."""
+    from django.db import connection, transaction
+    from django.test.utils import CaptureQueriesContext
+
+    with transaction.atomic():
+        with CaptureQueriesContext(connection) as queries:
+            started = time.perf_counter()
+            call()
+            elapsed = time.perf_counter() - started
+        transaction.set_rollback(True)
+    return elapsed, len(queries)
+
+
+def measure(call, repeat):
+    run_once(call)
+    timings = []
+    for _ in range(repeat):
+        elapsed, query_count = run_once(call)
+        timings.append(elapsed)
+
+    tracemalloc.start()
+    try:
+        run_once(call)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    timings.sort()
+    return {
+        "queries": query_count,
+        "median_ms": round(statistics.median(timings) * 1000, 3),
+        "p95_ms": round(timings[min(len(timings) - 1, int(0.95 * len(timings)))] * 1000, 3),
+        "peak_kib": round(peak / 1024, 1),
+    }
+
+
+def run(repeat, only=None):
+    from crm.executor import LocalExecutor
+
+    executor = LocalExecutor()
+    results = {}
+    with tempfile.TemporaryDirectory(prefix="crm-bench-logs-") as log_dir:
+        for group, name, call in build_cases(executor, log_dir):
+            if only and not any(pattern in name for pattern in only):
+                continue
+            results[f"{group}:{name}"] = measure(call, repeat)
+    return results
+
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True, text=True, check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(baseline, report, tolerance, min_delta_ms):
+    """Return one line per case that regressed against ``baseline``."""
+    regressions = []
+    for key, current in report["cases"].items():
+        before = baseline["cases"].get(key)
+        if before is None:
+            continue
+        if current["queries"] > before["queries"]:
+            regressions.append(f"{key}: {before['queries']} -> {current['queries']} queries")
+        delta = current["median_ms"] - before["median_ms"]
+        if delta > min_delta_ms and current["median_ms"] > before["median_ms"] * (1 + tolerance):
+            regressions.append(f"{key}: {before['median_ms']} -> {current['median_ms']} ms")
+        if current["peak_kib"] > before["peak_kib"] * (1 + tolerance):
+            regressions.append(f"{key}: {before['peak_kib']} -> {current['peak_kib']} KiB peak")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--customers", type=int, default=2000)
+    parser.add_argument("--products", type=int, default=200)
+    parser.add_argument("--orders", type=int, default=10000)
+    parser.add_argument("--repeat", type=int, default=10)
+    parser.add_argument("--only", action="append",
+                        help="run only cases whose name contains this (repeatable)")
+    parser.add_argument("--existing", action="store_true",
+                        help="use the configured database instead of seeding a test database")
+    parser.add_argument("--output", help="write the JSON report here instead of stdout")
+    parser.add_argument("--compare", help="baseline JSON report to check for regressions")
+    parser.add_argument("--tolerance", type=float, default=0.2,
+                        help="allowed relative slowdown or memory growth (default 0.2)")
+    parser.add_argument("--min-delta-ms", type=float, default=1.0,
+                        help="ignore latency changes smaller than this")
+    args = parser.parse_args()
+
+    setup_django()
+    from django.conf import settings
+    from django.db import connection
+
+    settings.CRM_RESPONSE_CACHE = None
+    with contextlib.ExitStack() as stack:
+        if args.existing:
+            seeded = None
+        else:
+            from .seed import seed
+
+            stack.enter_context(test_database(on_disk=True))
+            seeded = seed(customers=args.customers, products=args.products, orders=args.orders)
+        report = {
+            "commit": git_commit(),
+            "python": platform.python_version(),
+            "vendor": connection.vendor,
+            "seeded": seeded,
+            "repeat": args.repeat,
+            "cases": run(args.repeat, args.only),
+        }
+
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output + "\n")
+    else:
+        print(output)
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        regressions = compare(baseline, report, args.tolerance, args.min_delta_ms)
+        for line in regressions:
+            print(f"REGRESSION {line}", file=sys.stderr)
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,174 @@
+"""
+crm/cache.py
+Response cache for read-only GraphQL operations.
+
+Results are keyed on the normalized query document (printed from its AST,
+see crm/persisted.py), the variables and the operation name. Any write to
+Customer, Product or Order bumps the cache generation (see
+crm/signals.py), which drops every cached response at once.
+
+The cache is off until the CRM_RESPONSE_CACHE setting turns it on:
+
+    CRM_RESPONSE_CACHE = {
+        "BACKEND": "django",     # a CACHES alias, or "memory" for an in-process LRU
+        "CACHE_ALIAS": "default",  # used by the "django" backend (e.g. Redis)
+        "TTL": 30,               # seconds
+        "MAX_ENTRIES": 1024,     # LRU size of the memory backend
+    }
+
+Writes also come from other processes (the cron jobs and Celery tasks), so
+the generation must be shared: the "django" backend refuses a
+process-local alias (LocMemCache, DummyCache) with ImproperlyConfigured.
+The "memory" backend only sees writes made by its own process; use it only
+where one process serves and writes everything.
+"""
+
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.db import transaction
+
+DEFAULT_SETTINGS = {
+    "BACKEND": "django",
+    "CACHE_ALIAS": "default",
+    "TTL": 30,
+    "MAX_ENTRIES": 1024,
+}
+
+
+class MemoryResponseCache:
+    """Thread-safe in-process LRU with a per-entry TTL."""
+
+    def __init__(self, ttl, max_entries):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._generation = 0
+        self._lock = threading.Lock()
+
+    def generation(self):
+        return self._generation
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires, value = entry
+            if expires < time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value, generation):
+        with self._lock:
+            # A write landed while this result was computed; it may be stale
+            if generation != self._generation:
+                return
+            self._entries[key] = (time.monotonic() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._generation += 1
+            self._entries.clear()
+
+
+class DjangoResponseCache:
+    """
+    Stores responses in a Django cache alias. Clearing bumps a generation
+    counter that is part of every key, so old entries are never read again
+    and expire on their own.
+    """
+
+    GENERATION_KEY = "crm:graphql:generation"
+
+    def __init__(self, ttl, alias):
+        from django.core.cache import caches
+        from django.core.cache.backends.dummy import DummyCache
+        from django.core.cache.backends.locmem import LocMemCache
+
+        self.ttl = ttl
+        self.cache = caches[alias]
+        if isinstance(self.cache, (LocMemCache, DummyCache)):
+            raise ImproperlyConfigured(
+                f"CRM_RESPONSE_CACHE needs a cache shared by every process; "
+                f"the {alias!r} cache is {type(self.cache).__name__}"
+            )
+
+    def generation(self):
+        generation = self.cache.get(self.GENERATION_KEY)
+        if generation is None:
+            self.cache.add(self.GENERATION_KEY, 0, timeout=None)
+            generation = self.cache.get(self.GENERATION_KEY, 0)
+        return generation
+
+    def get(self, key):
+        return self.cache.get(f"crm:graphql:{self.generation()}:{key}")
+
+    def set(self, key, value, generation):
+        self.cache.set(f"crm:graphql:{generation}:{key}", value, timeout=self.ttl)
+
+    def clear(self):
+        try:
+            self.cache.incr(self.GENERATION_KEY)
+        except ValueError:
+            self.cache.set(self.GENERATION_KEY, 1, timeout=None)
+
+
+_response_cache = None
+_response_cache_lock = threading.Lock()
+
+
+def get_response_cache():
+    """Return the configured response cache, or None when it is disabled."""
+    global _response_cache
+    config = getattr(settings, "CRM_RESPONSE_CACHE", None)
+    if config is None:
+        return None
+    if _response_cache is None:
+        with _response_cache_lock:
+            if _response_cache is None:
+                config = {**DEFAULT_SETTINGS, **config}
+                if config["BACKEND"] == "django":
+                    _response_cache = DjangoResponseCache(config["TTL"], config["CACHE_ALIAS"])
+                elif config["BACKEND"] == "memory":
+                    _response_cache = MemoryResponseCache(config["TTL"], config["MAX_ENTRIES"])
+                else:
+                    raise ValueError(f"Unknown CRM_RESPONSE_CACHE backend: {config['BACKEND']}")
+    return _response_cache
+
+
+def reset_response_cache():
+    """Forget the configured cache so the next call rebuilds it from settings."""
+    global _response_cache
+    _response_cache = None
+
+
+def invalidate_response_cache(**kwargs):
+    """
+    Signal receiver: drop every cached response after a CRM write. Also
+    called directly after bulk_create/update, which send no signals.
+    """
+    cache = get_response_cache()
+    if cache is not None:
+        # Clear once the write is visible to other connections
+        transaction.on_commit(cache.clear)
+
+
+def response_cache_key(normalized_query, variables, operation_name):
+    payload = json.dumps(
+        [normalized_query, variables or {}, operation_name],
+        sort_keys=True,
+        separators=(",", ":"),
+        default=str,
+    )
+    return hashlib.sha256(payload.encode()).hexdigest()
@@ -0,0 +1,227 @@
+"""
+crm/catalog.py
+Process-local cache of the product catalog.
+
+Orders only need a product's id, name and price, and those change far less
+often than orders are placed. Each process keeps them as compact
+``ProductRecord`` objects keyed by id, so CreateOrder, BulkCreateOrders and
+``Order.products`` read prices from memory instead of re-reading Product
+rows. Stock is not cached: it changes with every order, stays authoritative
+in the database (see reserve_stock) and is batch-loaded when a query asks
+for it (crm.loaders.Loaders.product_stock).
+
+Staying fresh across processes:
+
+* every change to a product bumps a version counter in a Django cache
+  alias, and the changed ids are stored under that version;
+* before each lookup a process compares its version with the shared one and
+  reloads only the products changed in between, in one query;
+* when the change log has gaps (expired, evicted, or too far behind) the
+  process drops its whole catalog and refills it lazily.
+
+The catalog is off, and products are read from the database every time,
+until it is given a cache alias that every process shares:
+
+    CRM_PRODUCT_CATALOG = {
+        "CACHE_ALIAS": "default",  # shared by every process, e.g. Redis
+        "CHANGE_TTL": 3600,        # seconds a version's changed ids are kept
+        "MAX_CHANGES": 500,        # versions to replay before a full reset
+    }
+
+A process-local alias (LocMemCache, DummyCache) is refused with
+ImproperlyConfigured: other processes would never see its version counter
+and would keep serving old prices.
+"""
+
+import threading
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.db import transaction
+
+from .models import Product
+
+DEFAULT_SETTINGS = {
+    "CACHE_ALIAS": "default",
+    "CHANGE_TTL": 3600,
+    "MAX_CHANGES": 500,
+}
+
+
+class ProductRecord:
+    """The cached, read-only fields of a Product."""
+
+    __slots__ = ("id", "name", "price", "price_float")
+
+    def __init__(self, id, name, price):
+        self.id = id
+        self.name = name
+        self.price = price
+        self.price_float = float(price)
+
+    @property
+    def pk(self):
+        return self.id
+
+    def __repr__(self):
+        return f"<ProductRecord {self.id}: {self.name} {self.price}>"
+
+
+class ProductCatalog:
+    """Versioned, incrementally refreshed map of product id -> ProductRecord."""
+
+    VERSION_KEY = "crm:catalog:version"
+
+    def __init__(self, alias, change_ttl, max_changes):
+        from django.core.cache import caches
+        from django.core.cache.backends.dummy import DummyCache
+        from django.core.cache.backends.locmem import LocMemCache
+
+        self.cache = caches[alias]
+        if isinstance(self.cache, (LocMemCache, DummyCache)):
+            raise ImproperlyConfigured(
+                f"CRM_PRODUCT_CATALOG needs a cache shared by every process; "
+                f"the {alias!r} cache is {type(self.cache).__name__}"
+            )
+        self.change_ttl = change_ttl
+        self.max_changes = max_changes
+        self.version = None
+        self._records = {}
+        self._stale = set()
+        self._lock = threading.Lock()
+
+    def change_key(self, version):
+        return f"crm:catalog:changes:{version}"
+
+    def shared_version(self):
+        version = self.cache.get(self.VERSION_KEY)
+        if version is None:
+            self.cache.add(self.VERSION_KEY, 0, timeout=None)
+            version = self.cache.get(self.VERSION_KEY, 0)
+        return version
+
+    def sync(self):
+        """Mark every product changed since our version as stale."""
+        version = self.shared_version()
+        if version == self.version:
+            return
+        behind = None if self.version is None else version - self.version
+        changes = {}
+        if behind is not None and 0 < behind <= self.max_changes:
+            keys = [self.change_key(v) for v in range(self.version + 1, version + 1)]
+            changes = self.cache.get_many(keys)
+            if len(changes) != len(keys):
+                behind = None
+        with self._lock:
+            if behind is None or behind < 0:
+                self._records.clear()
+                self._stale.clear()
+            else:
+                for product_ids in changes.values():
+                    self._stale.update(product_ids)
+            self.version = version
+
+    def get_many(self, product_ids):
+        """Return {id: ProductRecord} for the ids that exist."""
+        self.sync()
+        with self._lock:
+            missing = [pid for pid in product_ids if pid not in self._records or pid in self._stale]
+        if missing:
+            rows = Product.objects.filter(id__in=missing).values_list("id", "name", "price")
+            loaded = {pid: ProductRecord(pid, name, price) for pid, name, price in rows}
+            with self._lock:
+                for pid in missing:
+                    self._stale.discard(pid)
+                    if pid in loaded:
+                        self._records[pid] = loaded[pid]
+                    else:
+                        self._records.pop(pid, None)
+        records = self._records
+        return {pid: records[pid] for pid in product_ids if pid in records}
+
+    def forget(self, product_ids):
+        """Drop products from this process so the next lookup re-reads them."""
+        with self._lock:
+            self._stale.update(product_ids)
+
+    def publish(self, product_ids):
+        """Record a change to ``product_ids`` for every other process."""
+        try:
+            version = self.cache.incr(self.VERSION_KEY)
+        except ValueError:
+            self.cache.add(self.VERSION_KEY, 0, timeout=None)
+            version = self.cache.incr(self.VERSION_KEY)
+        self.cache.set(self.change_key(version), list(product_ids), timeout=self.change_ttl)
+
+    def clear(self):
+        with self._lock:
+            self._records.clear()
+            self._stale.clear()
+            self.version = None
+
+
+_catalog = None
+_catalog_lock = threading.Lock()
+
+
+def get_product_catalog():
+    """Return the configured catalog, or None when it is disabled."""
+    global _catalog
+    config = getattr(settings, "CRM_PRODUCT_CATALOG", None)
+    if config is None:
+        return None
+    if _catalog is None:
+        with _catalog_lock:
+            if _catalog is None:
+                config = {**DEFAULT_SETTINGS, **config}
+                _catalog = ProductCatalog(
+                    config["CACHE_ALIAS"], config["CHANGE_TTL"], config["MAX_CHANGES"]
+                )
+    return _catalog
+
+
+def reset_product_catalog():
+    """Forget the configured catalog so the next call rebuilds it from settings."""
+    global _catalog
+    _catalog = None
+
+
+def catalog_serves(model):
+    """True when rows of ``model`` should be taken from the catalog."""
+    return model is Product and get_product_catalog() is not None
+
+
+def get_products(product_ids):
+    """
+    Return {id: product} for the ids that exist: ProductRecords from the
+    catalog, or Product rows when the catalog is disabled.
+    """
+    catalog = get_product_catalog()
+    if catalog is None:
+        return Product.objects.in_bulk(product_ids)
+    return catalog.get_many(product_ids)
+
+
+def invalidate_products(product_ids):
+    """
+    Drop changed products from this process now and from every other one
+    once the write commits. Call it after bulk_create/update, which send no
+    signals.
+    """
+    catalog = get_product_catalog()
+    if catalog is None:
+        return
+    product_ids = list(product_ids)
+    catalog.forget(product_ids)
+    transaction.on_commit(lambda: catalog.publish(product_ids))
+
+
+def product_changed(sender, instance, **kwargs):
+    """post_save/post_delete receiver for Product."""
+    invalidate_products([instance.pk])
+
+
+def price_as_float(product):
+    if isinstance(product, ProductRecord):
+        return product.price_float
+    return float(product.price)
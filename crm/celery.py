@@ -10,6 +10,9 @@ app = Celery("crm")
 # Configure Celery to use Redis as the broker
 app.conf.broker_url = "redis://localhost:6379/0"
 
+# Chords (the *_parallel tasks) need a result backend to collect their parts
+app.conf.result_backend = "redis://localhost:6379/1"
+
 # Load task settings from Django settings, with CELERY_ prefix
 app.config_from_object("django.conf:settings", namespace="CELERY")
 
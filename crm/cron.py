@@ -4,87 +4,53 @@ crm/cron.py
 Defines cron job helpers for the CRM app.
 """
 
-from datetime import datetime
-from gql import gql, Client
-from gql.transport.requests import RequestsHTTPTransport
+from crm.executor import execute
+from crm.joblog import get_job_log
+from crm.queries import HEARTBEAT, UPDATE_LOW_STOCK
 
 LOG_FILE = "/tmp/crm_heartbeat_log.txt"
 LOG_LOW_PROD_FILE = '/tmp/low_stock_updates_log.txt'
-GRAPHQL_ENDPOINT = "http://localhost:8000/graphql"
 
 
 def log_crm_heartbeat():
     """
-    Logs a heartbeat message to confirm CRM cron is alive.
-    Format: DD/MM/YYYY-HH:MM:SS CRM is alive
+    Logs a heartbeat record to confirm CRM cron is alive.
+    Message: CRM is alive | GraphQL hello: <hello>
     Optionally queries the GraphQL 'hello' field to verify endpoint responsiveness.
     """
-    # Current timestamp
-    timestamp = datetime.now().strftime("%d/%m/%Y-%H:%M:%S")
-    message = f"{timestamp} CRM is alive"
+    log = get_job_log(LOG_FILE)
+    message = "CRM is alive"
 
     try:
-        transport = RequestsHTTPTransport(
-            url=GRAPHQL_ENDPOINT,
-            verify=True,
-            retries=3,
-        )
-
-        client = Client(transport=transport, fetch_schema_from_transport=False)
-
-        query = gql("{ hello }")
-        result = client.execute(query)
+        result = execute(HEARTBEAT)
 
         hello_value = result.get("hello")
         if hello_value:
             message += f" | GraphQL hello: {hello_value}"
         else:
             message += " | GraphQL responded but no hello field"
+        log.write("crm_heartbeat", message, hello=hello_value)
     except Exception as e:
-        message += f" | GraphQL check failed: {e}"
+        log.error("crm_heartbeat", f"{message} | GraphQL check failed: {e}")
 
-    # Append log
-    with open(LOG_FILE, "a") as f:
-        f.write(message + "\n")
+    log.flush()
 
 
 def update_low_stock():
+    log = get_job_log(LOG_LOW_PROD_FILE)
     try:
-        transport = RequestsHTTPTransport(
-            url=GRAPHQL_ENDPOINT,
-            verify=True,
-            retries=3,
-        )
-
-        client = Client(transport=transport, fetch_schema_from_transport=False)
-
-        mutation = gql(
-            """
-            mutation {
-                updateLowStockProducts {
-                    success
-                    message
-                    updatedProducts {
-                    id
-                    name
-                    price
-                    stock
-                    }
-                }
-            }
-            """
-        )
-        result = client.execute(mutation)
+        result = execute(UPDATE_LOW_STOCK)
         data = result.get("updateLowStockProducts", {})
-        timestamp = datetime.now().strftime("%d/%m/%Y-%H:%M:%S")
 
-        with open(LOG_LOW_PROD_FILE, "a") as f:
-            for product in data.get("updatedProducts", []):
-                log_message = f"{timestamp}: {product['name']} has {product['stock']} in stock"
-                f.write(log_message + "\n")
+        for product in data.get("updatedProducts", []):
+            log.write(
+                "update_low_stock",
+                f"{product['name']} has {product['stock']} in stock",
+                product=product["name"],
+                stock=product["stock"],
+            )
 
     except Exception as e:
-        timestamp = datetime.now().strftime("%d/%m/%Y-%H:%M:%S")
-        error_message = f"{timestamp}: An error occurred in update_low_stock - {e}"
-        with open(LOG_LOW_PROD_FILE, "a") as f:
-            f.write(error_message + "\n")
+        log.error("update_low_stock", f"An error occurred in update_low_stock - {e}")
+
+    log.flush()
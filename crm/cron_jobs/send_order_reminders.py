@@ -1,60 +1,69 @@
 #!/usr/bin/env python3
 """
 send_order_reminders.py
-Queries recent orders via GraphQL and logs order IDs + customer emails.
+Logs order IDs + customer emails for orders from the last 7 days that have
+not been reminded yet, then marks them reminded (Order.reminder_sent_at).
+Each run only reads the orders placed since the previous one, a page at a
+time. Set CRM_GRAPHQL_EXECUTOR=http to query the running server instead of
+the database directly.
 """
 
+import os
 import sys
 from datetime import datetime, timedelta, timezone
-from gql import gql, Client
-from gql.transport.requests import RequestsHTTPTransport
+
+# Run from cron as a plain script; make the project importable and pick the
+# project settings before crm/celery.py defaults them
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "alx_backend_graphql_crm.settings")
+
+from crm.executor import execute
+from crm.joblog import get_job_log
+from crm.queries import MARK_REMINDERS_SENT, PENDING_REMINDERS
 
 LOG_FILE = "/tmp/order_reminders_log.txt"
-GRAPHQL_ENDPOINT = "http://localhost:8000/graphql"
 
 
-def main():
-    transport = RequestsHTTPTransport(
-        url=GRAPHQL_ENDPOINT,
-        verify=True,
-        retries=3,
-    )
-    client = Client(transport=transport, fetch_schema_from_transport=True)
+def log_reminders(orders):
+    # One append per page, not per order
+    log = get_job_log(LOG_FILE)
+    for order in orders:
+        order_id = order.get("id")
+        email = order.get("customer", {}).get("email")
+        if order_id and email:
+            log.write(
+                "order_reminders",
+                f"Order ID: {order_id}, Customer Email: {email}",
+                order_id=order_id,
+                email=email,
+            )
+    log.flush()
+
 
+def main():
     # Date threshold (7 days)
     seven_days_ago = (datetime.now(timezone.utc) - timedelta(days=7)).date().isoformat()
 
-    # GraphQL query
-    query = gql(
-        """
-        query GetRecentOrders($since: Date) {
-          allOrders(orderDate_Gte: $since) {
-            id
-            orderDate
-            customer {
-              email
-            }
-          }
-        }
-        """
-    )
-
+    seen = set()
     try:
-        result = client.execute(query, variable_values={"since": seven_days_ago})
-        orders = result.get("allOrders", [])
+        while True:
+            # Runs in this process, or over HTTP when Django cannot be set up
+            result = execute(PENDING_REMINDERS, {"since": seven_days_ago})
+            orders = [
+                edge["node"] for edge in result["allOrders"]["edges"]
+                if edge["node"]["id"] not in seen
+            ]
+            if not orders:
+                break
+            order_ids = [order["id"] for order in orders]
+            # Log before marking: a crash in between repeats a page, never skips one
+            log_reminders(orders)
+            execute(MARK_REMINDERS_SENT, {"orderIds": order_ids})
+            seen.update(order_ids)
     except Exception as e:
         print(f"Error querying GraphQL: {e}", file=sys.stderr)
         sys.exit(1)
 
-    # Log results
-    timestamp = datetime.now(timezone.utc).strftime("%Y-%m-%d %H:%M:%S %Z")
-    with open(LOG_FILE, "a") as f:
-        for order in orders:
-            order_id = order.get("id")
-            email = order.get("customer", {}).get("email")
-            if order_id and email:
-                f.write(f"[{timestamp}] Order ID: {order_id}, Customer Email: {email}\n")
-
     print("Order reminders processed!")
 
 
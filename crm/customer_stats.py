@@ -0,0 +1,116 @@
+"""
+crm/customer_stats.py
+Maintains the per-customer order statistics stored on Customer
+(order_count, total_spent, last_order_date).
+
+New orders are added incrementally with ``F()`` deltas, so concurrent
+writers never lose an update and no query scans Order. The rebuild and
+check helpers behind the ``rebuild_customer_stats`` and
+``check_customer_stats`` management commands recompute the same values
+from Order, one chunk of customers at a time.
+"""
+
+from collections import defaultdict
+from decimal import Decimal
+
+from django.db.models import (
+    Case, Count, DateTimeField, DecimalField, F, IntegerField, Max, OuterRef,
+    Subquery, Sum, Value, When,
+)
+from django.db.models.functions import Coalesce
+
+from .models import Customer, Order
+
+STATS_BATCH_SIZE = 500
+STATS_FIELDS = ("order_count", "total_spent", "last_order_date")
+
+
+def record_orders(orders):
+    """Add newly created ``orders`` to their customers' statistics."""
+    stats = defaultdict(lambda: [0, Decimal("0"), None])
+    for order in orders:
+        entry = stats[order.customer_id]
+        entry[0] += 1
+        entry[1] += order.total_amount
+        if entry[2] is None or order.order_date > entry[2]:
+            entry[2] = order.order_date
+
+    customer_ids = sorted(stats)
+    for start in range(0, len(customer_ids), STATS_BATCH_SIZE):
+        chunk = customer_ids[start:start + STATS_BATCH_SIZE]
+        # One UPDATE per chunk; CASE picks each customer's delta
+        Customer.objects.filter(pk__in=chunk).update(
+            order_count=F("order_count") + Case(
+                *(When(pk=pk, then=Value(stats[pk][0])) for pk in chunk),
+                output_field=IntegerField(),
+            ),
+            total_spent=F("total_spent") + Case(
+                *(When(pk=pk, then=Value(stats[pk][1])) for pk in chunk),
+                output_field=DecimalField(max_digits=12, decimal_places=2),
+            ),
+            last_order_date=Case(
+                *(When(pk=pk, last_order_date__gte=stats[pk][2], then=F("last_order_date"))
+                  for pk in chunk),
+                *(When(pk=pk, then=Value(stats[pk][2])) for pk in chunk),
+                output_field=DateTimeField(),
+            ),
+        )
+
+
+def computed_stats():
+    """Expressions that recompute each statistic from Order for OuterRef("pk")."""
+    orders = Order.objects.filter(customer=OuterRef("pk")).order_by().values("customer")
+    return {
+        "order_count": Coalesce(
+            Subquery(orders.annotate(value=Count("pk")).values("value")), 0
+        ),
+        "total_spent": Coalesce(
+            Subquery(orders.annotate(value=Sum("total_amount")).values("value")),
+            Value(Decimal("0")),
+            output_field=DecimalField(max_digits=12, decimal_places=2),
+        ),
+        "last_order_date": Subquery(orders.annotate(value=Max("order_date")).values("value")),
+    }
+
+
+def iter_customer_chunks(chunk_size, queryset=None):
+    """Yield lists of customer ids in primary-key order, ``chunk_size`` at a time."""
+    queryset = Customer.objects.all() if queryset is None else queryset
+    last_pk = 0
+    while True:
+        chunk = list(
+            queryset.filter(pk__gt=last_pk).order_by("pk").values_list("pk", flat=True)[:chunk_size]
+        )
+        if not chunk:
+            return
+        yield chunk
+        last_pk = chunk[-1]
+
+
+def refresh_customer_stats(customer_ids):
+    """Recompute the statistics of ``customer_ids`` from their orders."""
+    return Customer.objects.filter(pk__in=customer_ids).update(**computed_stats())
+
+
+def rebuild_customer_stats(chunk_size=STATS_BATCH_SIZE):
+    """Recompute every customer's statistics; returns the number of customers."""
+    updated = 0
+    for chunk in iter_customer_chunks(chunk_size):
+        updated += refresh_customer_stats(chunk)
+    return updated
+
+
+def check_customer_stats(chunk_size=STATS_BATCH_SIZE):
+    """Yield ``(customer_id, field, stored, actual)`` for every stale statistic."""
+    expressions = {f"actual_{name}": expression for name, expression in computed_stats().items()}
+    for chunk in iter_customer_chunks(chunk_size):
+        rows = (
+            Customer.objects.filter(pk__in=chunk)
+            .annotate(**expressions)
+            .values("pk", *STATS_FIELDS, *expressions)
+            .order_by("pk")
+        )
+        for row in rows:
+            for name in STATS_FIELDS:
+                if row[name] != row[f"actual_{name}"]:
+                    yield row["pk"], name, row[name], row[f"actual_{name}"]
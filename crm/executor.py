@@ -0,0 +1,105 @@
+"""
+crm/executor.py
+Runs the crm/queries.py documents for the cron jobs and Celery tasks.
+
+The jobs already run inside a Django process (django-crontab, the Celery
+worker), so by default they execute against the schema in that process:
+no HTTP round trip, no JSON encoding and no introspection. Documents come
+from the parsed-document cache (crm/persisted.py), so each job parses its
+query once per process.
+
+When Django cannot be set up, or with CRM_GRAPHQL_EXECUTOR=http in the
+environment, the jobs fall back to posting to the running server at
+CRM_GRAPHQL_ENDPOINT (http://localhost:8000/graphql by default) through the
+pooled client of crm/graphql_client.py.
+"""
+
+import logging
+import os
+from types import SimpleNamespace
+
+logger = logging.getLogger(__name__)
+
+GRAPHQL_ENDPOINT = "http://localhost:8000/graphql"
+
+
+class GraphQLExecutionError(Exception):
+    """Raised when a document comes back with errors."""
+
+    def __init__(self, errors):
+        self.errors = errors
+        super().__init__("; ".join(str(error) for error in errors))
+
+
+class LocalExecutor:
+    """Executes documents with the graphql-core schema in this process."""
+
+    def __init__(self, schema=None):
+        if schema is None:
+            from alx_backend_graphql.schema import schema
+        self.schema = schema
+
+    def execute(self, document, variables=None, operation_name=None):
+        from graphql import execute
+        from graphql.validation import specified_rules
+
+        from .loaders import Loaders
+        from .persisted import get_document_registry
+
+        graphql_schema = self.schema.graphql_schema
+        entry, errors = get_document_registry(graphql_schema, specified_rules).resolve(document)
+        if errors:
+            raise GraphQLExecutionError(errors)
+
+        result = execute(
+            graphql_schema,
+            entry.document,
+            variable_values=variables,
+            operation_name=operation_name,
+            context_value=SimpleNamespace(loaders=Loaders()),
+        )
+        if result.errors:
+            raise GraphQLExecutionError(result.errors)
+        return result.data
+
+
+class HttpExecutor:
+    """Posts documents to a running GraphQL server (see crm/graphql_client.py)."""
+
+    def __init__(self, endpoint=GRAPHQL_ENDPOINT):
+        from .graphql_client import get_client
+
+        # Shared by every job in this process, with its connections kept alive
+        self.client = get_client(endpoint)
+
+    def execute(self, document, variables=None, operation_name=None):
+        return self.client.execute(document, variables, operation_name)
+
+
+def setup_django():
+    """Configure Django if it is not already running; raises when it cannot."""
+    from django.apps import apps
+
+    if apps.ready:
+        return
+    os.environ.setdefault("DJANGO_SETTINGS_MODULE", "alx_backend_graphql_crm.settings")
+    import django
+    django.setup()
+
+
+def get_executor():
+    """Return a LocalExecutor, or an HttpExecutor when it is requested or Django is unavailable."""
+    endpoint = os.environ.get("CRM_GRAPHQL_ENDPOINT", GRAPHQL_ENDPOINT)
+    if os.environ.get("CRM_GRAPHQL_EXECUTOR", "local") == "http":
+        return HttpExecutor(endpoint)
+    try:
+        setup_django()
+        return LocalExecutor()
+    except Exception as e:
+        logger.warning("Running GraphQL jobs over HTTP, Django is unavailable: %s", e)
+        return HttpExecutor(endpoint)
+
+
+def execute(document, variables=None, operation_name=None):
+    """Run a document with the executor picked by get_executor()."""
+    return get_executor().execute(document, variables, operation_name)
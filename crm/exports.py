@@ -0,0 +1,127 @@
+"""
+crm/exports.py
+Rows and encoders for the streaming exports served by crm.views.ExportView.
+
+Rows are read with ``QuerySet.iterator(chunk_size=...)`` (a server-side
+cursor on Postgres) and encoded one chunk at a time, so memory stays flat
+however many rows match. Orders prefetch their products per chunk.
+"""
+
+import csv
+import io
+import json
+
+from django.db.models import Prefetch
+
+from .filters import CustomerFilter, OrderFilter
+from .models import Customer, Order, Product
+
+
+class CustomerExport:
+    model = Customer
+    filterset_class = CustomerFilter
+    columns = ("id", "name", "email", "phone", "created_at")
+
+    def queryset(self, filterset):
+        return filterset.qs.order_by("pk").only(*self.columns)
+
+    def row(self, customer):
+        return (
+            customer.id,
+            customer.name,
+            customer.email,
+            customer.phone,
+            customer.created_at.isoformat(),
+        )
+
+
+class OrderExport:
+    model = Order
+    filterset_class = OrderFilter
+    columns = (
+        "id", "order_date", "total_amount",
+        "customer_id", "customer_name", "customer_email",
+        "product_ids", "product_names",
+    )
+
+    def queryset(self, filterset):
+        queryset = filterset.qs
+        # product_name joins the products table, one row per matching product
+        if filterset.form.cleaned_data.get("product_name"):
+            queryset = queryset.distinct()
+        return (
+            queryset.order_by("pk")
+            .select_related("customer")
+            .only("id", "order_date", "total_amount",
+                  "customer__id", "customer__name", "customer__email")
+            .prefetch_related(Prefetch(
+                "products", queryset=Product.objects.only("id", "name").order_by("pk")
+            ))
+        )
+
+    def row(self, order):
+        products = order.products.all()
+        return (
+            order.id,
+            order.order_date.isoformat(),
+            str(order.total_amount),
+            order.customer.id,
+            order.customer.name,
+            order.customer.email,
+            [product.id for product in products],
+            [product.name for product in products],
+        )
+
+
+EXPORTS = {
+    "customers": CustomerExport(),
+    "orders": OrderExport(),
+}
+
+
+def iter_chunks(export, queryset, chunk_size):
+    """Yield lists of at most ``chunk_size`` rows."""
+    chunk = []
+    for obj in queryset.iterator(chunk_size=chunk_size):
+        chunk.append(export.row(obj))
+        if len(chunk) >= chunk_size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def ndjson_lines(export, queryset, chunk_size):
+    columns = export.columns
+    for chunk in iter_chunks(export, queryset, chunk_size):
+        yield "".join(
+            json.dumps(dict(zip(columns, row)), separators=(",", ":")) + "\n"
+            for row in chunk
+        )
+
+
+def csv_lines(export, queryset, chunk_size):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+
+    def flush():
+        value = buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+        return value
+
+    writer.writerow(export.columns)
+    yield flush()
+    for chunk in iter_chunks(export, queryset, chunk_size):
+        writer.writerows(
+            # Product lists become "1|2|3" cells
+            ["|".join(map(str, value)) if isinstance(value, list) else value for value in row]
+            for row in chunk
+        )
+        yield flush()
+
+
+FORMATS = {
+    "ndjson": ("application/x-ndjson", ndjson_lines),
+    "csv": ("text/csv", csv_lines),
+}
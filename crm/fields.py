@@ -0,0 +1,254 @@
+"""
+crm/fields.py
+Connection fields shared by the CRM schema.
+"""
+
+import json
+from functools import lru_cache, partial
+
+import graphene
+from asgiref.sync import sync_to_async
+from django.db.models import Q
+from graphene.relay import PageInfo
+from graphene.utils.str_converters import to_camel_case
+from graphene_django import DjangoConnectionField, DjangoListField, DjangoObjectType
+from graphene_django.filter import DjangoFilterConnectionField
+from graphql_relay.utils import base64, unbase64
+
+from .loaders import running_async
+from .optimizer import connection_node_fields, optimize_queryset
+
+KEYSET_CURSOR_PREFIX = "keyset:"
+
+
+class CountableConnection(graphene.relay.Connection):
+    """Connection with a ``totalCount`` that is only counted when selected."""
+
+    class Meta:
+        abstract = True
+
+    total_count = graphene.Int()
+
+    def resolve_total_count(root, info):
+        if getattr(root, "length", None) is None:
+            if running_async():
+                return acount(root)
+            root.length = root.iterable.count()
+        return root.length
+
+
+async def acount(connection):
+    connection.length = await connection.iterable.acount()
+    return connection.length
+
+
+async def alist(queryset, on_load=None):
+    """Evaluate ``queryset`` with the async ORM, passing the rows to ``on_load``."""
+    rows = [row async for row in queryset]
+    if on_load is not None:
+        on_load(rows)
+    return rows
+
+
+def encode_keyset_cursor(values):
+    return base64(KEYSET_CURSOR_PREFIX + json.dumps(values))
+
+
+def decode_keyset_cursor(cursor, fields):
+    try:
+        raw = unbase64(cursor)
+        assert raw.startswith(KEYSET_CURSOR_PREFIX)
+        values = json.loads(raw[len(KEYSET_CURSOR_PREFIX):])
+        assert isinstance(values, list) and len(values) == len(fields)
+        return [field.to_python(value) for field, value in zip(fields, values)]
+    except Exception:
+        raise ValueError(f"Invalid keyset cursor: {cursor}")
+
+
+def keyset_filter(ordering, values, forward):
+    """
+    Rows strictly after (or before) ``values`` in ``ordering``, written as
+    ``(a < x) OR (a = x AND b < y) ...`` so it can use a composite index.
+    """
+    condition = Q()
+    for i, name in enumerate(ordering):
+        descending = name.startswith("-")
+        lookup = "lt" if descending == forward else "gt"
+        clause = Q(**{f"{name.lstrip('-')}__{lookup}": values[i]})
+        for previous, value in zip(ordering[:i], values[:i]):
+            clause &= Q(**{previous.lstrip("-"): value})
+        condition |= clause
+    return condition
+
+
+class BatchedFilterConnectionField(DjangoFilterConnectionField):
+    """
+    DjangoFilterConnectionField that shapes the filtered queryset after the
+    requested ``edges { node }`` fields and hands the resolved page to the
+    node type's ``prime_loaders`` hook, so nested fields are batch loaded.
+
+    Passing ``keyset_ordering`` adds an opt-in ``keyset: true`` argument that
+    pages by the last seen ordering values instead of OFFSET/LIMIT, so deep
+    pages cost the same as the first one and no COUNT(*) runs unless
+    ``totalCount`` is selected.
+    """
+
+    def __init__(self, type_, *args, keyset_ordering=None, **kwargs):
+        self.keyset_ordering = tuple(keyset_ordering or ())
+        if self.keyset_ordering:
+            kwargs.setdefault("keyset", graphene.Boolean(default_value=False))
+        super().__init__(type_, *args, **kwargs)
+
+    @classmethod
+    def resolve_queryset(cls, connection, iterable, info, args,
+                         filtering_args, filterset_class):
+        queryset = super().resolve_queryset(
+            connection, iterable, info, args, filtering_args, filterset_class
+        )
+        return optimize_queryset(
+            queryset, info, connection_node_fields(info, info.field_nodes)
+        )
+
+    @classmethod
+    def connection_resolver(cls, resolver, connection, default_manager,
+                            queryset_resolver, max_limit, enforce_first_or_last,
+                            root, info, keyset_ordering=(), **args):
+        if running_async():
+            # Filtering and slicing run through graphene-django's sync code;
+            # the page it returns is fully loaded, so nested fields go async
+            return sync_to_async(cls.connection_resolver)(
+                resolver, connection, default_manager, queryset_resolver,
+                max_limit, enforce_first_or_last, root, info,
+                keyset_ordering=keyset_ordering, **args
+            )
+        if keyset_ordering and args.get("keyset"):
+            result = cls.keyset_connection_resolver(
+                resolver, connection, default_manager, queryset_resolver,
+                max_limit, keyset_ordering, root, info, **args
+            )
+        else:
+            result = super().connection_resolver(
+                resolver, connection, default_manager, queryset_resolver,
+                max_limit, enforce_first_or_last, root, info, **args
+            )
+        prime_loaders = getattr(connection._meta.node, "prime_loaders", None)
+        if prime_loaders is not None:
+            prime_loaders([edge.node for edge in result.edges], info)
+        return result
+
+    @classmethod
+    def keyset_connection_resolver(cls, resolver, connection, default_manager,
+                                   queryset_resolver, max_limit, ordering,
+                                   root, info, **args):
+        first, last = args.get("first"), args.get("last")
+        after, before = args.get("after"), args.get("before")
+        if args.get("offset") is not None:
+            raise ValueError("offset cannot be combined with keyset pagination")
+        if first is not None and last is not None:
+            raise ValueError("Pass either first or last with keyset pagination, not both")
+        for limit in (first, last):
+            if limit is not None and (limit < 0 or (max_limit and limit > max_limit)):
+                raise ValueError(
+                    f"Requesting {limit} records on the `{info.field_name}` connection "
+                    f"is outside the limit of {max_limit} records."
+                )
+
+        iterable = resolver(root, info, **args)
+        if iterable is None:
+            iterable = default_manager
+        queryset = queryset_resolver(connection, iterable, info, args)
+
+        model = queryset.model
+        fields = [model._meta.get_field(name.lstrip("-")) for name in ordering]
+        # The cursor is built from the ordering columns, so they must be loaded
+        only_fields, deferring = queryset.query.deferred_loading
+        if not deferring:
+            queryset = queryset.only(*only_fields, *(f.name for f in fields))
+
+        forward = last is None
+        page_size = (first if forward else last)
+        if page_size is None:
+            page_size = max_limit
+        cursor = after if forward else before
+
+        page = queryset.order_by(*ordering) if forward else queryset.order_by(
+            *(name[1:] if name.startswith("-") else f"-{name}" for name in ordering)
+        )
+        if cursor:
+            page = page.filter(keyset_filter(ordering, decode_keyset_cursor(cursor, fields), forward))
+        if page_size is not None:
+            rows = list(page[:page_size + 1])
+            has_more = len(rows) > page_size
+            rows = rows[:page_size]
+        else:
+            rows, has_more = list(page), False
+        if not forward:
+            rows.reverse()
+
+        edges = [
+            connection.Edge(
+                node=row,
+                cursor=encode_keyset_cursor([f.value_to_string(row) for f in fields]),
+            )
+            for row in rows
+        ]
+        result = connection(
+            edges=edges,
+            page_info=PageInfo(
+                start_cursor=edges[0].cursor if edges else None,
+                end_cursor=edges[-1].cursor if edges else None,
+                has_previous_page=has_more if not forward else bool(after),
+                has_next_page=has_more if forward else bool(before),
+            ),
+        )
+        result.iterable = queryset
+        result.length = None
+        return result
+
+    def wrap_resolve(self, parent_resolver):
+        return partial(
+            super().wrap_resolve(parent_resolver), keyset_ordering=self.keyset_ordering
+        )
+
+
+@lru_cache(maxsize=None)
+def sync_only_fields(schema):
+    """
+    (type name, GraphQL field name) of every field resolved by
+    graphene-django's own connection or list code, such as reverse foreign
+    keys (``Customer.orderSet``). Those resolvers use the sync ORM.
+    """
+    fields = set()
+    for type_name, graphql_type in schema.graphql_schema.type_map.items():
+        graphene_type = getattr(graphql_type, "graphene_type", None)
+        if not (isinstance(graphene_type, type) and issubclass(graphene_type, DjangoObjectType)):
+            continue
+        for name, field in graphene_type._meta.fields.items():
+            if isinstance(field, graphene.Dynamic):
+                field = field.get_type()
+            if (isinstance(field, (DjangoConnectionField, DjangoListField))
+                    and not isinstance(field, BatchedFilterConnectionField)
+                    and not hasattr(graphene_type, f"resolve_{name}")):
+                # The schema may or may not camel-case field names
+                for graphql_name in (field.name, to_camel_case(name), name):
+                    if graphql_name in graphql_type.fields:
+                        fields.add((type_name, graphql_name))
+                        break
+    return frozenset(fields)
+
+
+class SyncOnlyFieldsMiddleware:
+    """
+    GraphQL middleware for the async view: resolves ``fields`` (see
+    sync_only_fields) in a worker thread when running on the event loop.
+    Their resolvers return fully loaded pages, so the fields below them
+    continue on the loop.
+    """
+
+    def __init__(self, fields):
+        self.fields = fields
+
+    def resolve(self, next, root, info, **args):
+        if (info.parent_type.name, info.field_name) in self.fields and running_async():
+            return sync_to_async(next)(root, info, **args)
+        return next(root, info, **args)
@@ -1,5 +1,36 @@
 import django_filters
+from django import forms
+from django.core.exceptions import ValidationError
+from graphene_django.filter import TypedFilter
+from graphql import GraphQLError
 from .models import Customer, Product, Order
+from .scalars import CustomerID
+
+
+class CustomerIDField(forms.Field):
+    """Form field decoding a global or raw customer ID, as CustomerID does."""
+
+    def to_python(self, value):
+        if value in self.empty_values:
+            return None
+        try:
+            return CustomerID.decode(value)
+        except GraphQLError as e:
+            raise ValidationError(e.message, code="invalid")
+
+
+class CustomerIDFilter(TypedFilter):
+    """
+    A CustomerID argument in GraphQL; plain query parameters (the export
+    views) are decoded and validated by the same rules in the form field.
+    """
+
+    field_class = CustomerIDField
+
+    def __init__(self, *args, **kwargs):
+        kwargs.setdefault("input_type", CustomerID)
+        super().__init__(*args, **kwargs)
+
 
 class CustomerFilter(django_filters.FilterSet):
     name = django_filters.CharFilter(field_name="name", lookup_expr="icontains")
@@ -7,10 +38,17 @@ class CustomerFilter(django_filters.FilterSet):
     createdAtGte = django_filters.DateFilter(field_name="created_at", lookup_expr="gte")
     createdAtLte = django_filters.DateFilter(field_name="created_at", lookup_expr="lte")
     phonePattern = django_filters.CharFilter(field_name="phone", lookup_expr="startswith")
+    totalSpentGte = django_filters.NumberFilter(field_name="total_spent", lookup_expr="gte")
+    totalSpentLte = django_filters.NumberFilter(field_name="total_spent", lookup_expr="lte")
+    orderCountGte = django_filters.NumberFilter(field_name="order_count", lookup_expr="gte")
+    lastOrderDateGte = django_filters.DateFilter(field_name="last_order_date", lookup_expr="gte")
+    lastOrderDateLte = django_filters.DateFilter(field_name="last_order_date", lookup_expr="lte")
 
     class Meta:
         model = Customer
-        fields = ['name', 'email', 'createdAtGte', 'createdAtLte', 'phonePattern']
+        fields = ['name', 'email', 'createdAtGte', 'createdAtLte', 'phonePattern',
+                  'totalSpentGte', 'totalSpentLte', 'orderCountGte',
+                  'lastOrderDateGte', 'lastOrderDateLte']
 
 class ProductFilter(django_filters.FilterSet):
     price_gte = django_filters.NumberFilter(field_name="price", lookup_expr='gte')
@@ -29,7 +67,11 @@ class OrderFilter(django_filters.FilterSet):
     order_date_lte = django_filters.DateFilter(field_name="order_date", lookup_expr='lte')
     customer_name = django_filters.CharFilter(field_name="customer__name", lookup_expr='icontains')
     product_name = django_filters.CharFilter(field_name="products__name", lookup_expr='icontains')
+    reminder_pending = django_filters.BooleanFilter(field_name="reminder_sent_at", lookup_expr='isnull')
+    # A global or raw customer ID, decoded to the primary key before filtering
+    customer_id = CustomerIDFilter(field_name="customer_id")
 
     class Meta:
         model = Order
-        fields = ['total_amount_gte', 'total_amount_lte', 'order_date_gte', 'order_date_lte', 'customer_name', 'product_name']
\ No newline at end of file
+        fields = ['total_amount_gte', 'total_amount_lte', 'order_date_gte', 'order_date_lte', 'customer_name', 'product_name',
+                  'reminder_pending', 'customer_id']
\ No newline at end of file
@@ -0,0 +1,225 @@
+"""
+crm/graphql_client.py
+Pooled HTTP client the cron jobs and Celery tasks use to reach a running
+GraphQL server (crm.executor.HttpExecutor).
+
+* One ``requests.Session`` per endpoint and process keeps its connections
+  alive between jobs, so a worker pays the TCP (and TLS) handshake once,
+  not on every run. Forked children (Celery's prefork pool) start with a
+  fresh pool instead of sharing the parent's sockets.
+* Documents are parsed once: the crm/queries.py ones at import, others on
+  first use. Only their hash is sent at first (the persisted queries of
+  crm/persisted.py); the full text follows only when the server asks.
+* Timeouts and retries with exponential backoff are set from the
+  environment, because this path is used when Django is not available:
+
+      CRM_GRAPHQL_CONNECT_TIMEOUT=3.05  seconds to open a connection
+      CRM_GRAPHQL_READ_TIMEOUT=30       seconds to wait for a response
+      CRM_GRAPHQL_RETRIES=3             extra attempts after a failure
+      CRM_GRAPHQL_BACKOFF=0.5           first delay, doubled each attempt
+      CRM_GRAPHQL_POOL_SIZE=4           connections kept per endpoint
+      CRM_GRAPHQL_PERSISTED=1           send hashes first; 0 to turn off
+
+Queries are retried on connection errors, timeouts and 502/503/504.
+Mutations are only retried when no connection could be opened, so a
+request the server may have run is never sent twice.
+"""
+
+import logging
+import os
+import random
+import threading
+import time
+from functools import lru_cache
+
+import requests
+from graphql import OperationType, parse
+from requests.adapters import HTTPAdapter
+from urllib3.exceptions import NewConnectionError
+
+from .executor import GraphQLExecutionError
+from .queries import DOCUMENTS, query_hash
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_SETTINGS = {
+    "CONNECT_TIMEOUT": 3.05,
+    "READ_TIMEOUT": 30.0,
+    "RETRIES": 3,
+    "BACKOFF": 0.5,
+    "MAX_BACKOFF": 10.0,
+    "POOL_SIZE": 4,
+    "PERSISTED": True,
+}
+
+RETRY_STATUSES = (502, 503, 504)
+
+
+def get_client_settings():
+    config = dict(DEFAULT_SETTINGS)
+    for name, default in DEFAULT_SETTINGS.items():
+        value = os.environ.get(f"CRM_GRAPHQL_{name}")
+        if value is None:
+            continue
+        if isinstance(default, bool):
+            config[name] = value.lower() not in ("0", "false", "no", "")
+        else:
+            config[name] = type(default)(value)
+    return config
+
+
+class CompiledDocument:
+    """A document's text with what the client needs to know about it."""
+
+    __slots__ = ("text", "sha256", "operation_name", "is_mutation")
+
+    def __init__(self, text):
+        operations = [
+            definition for definition in parse(text).definitions
+            if hasattr(definition, "operation")
+        ]
+        self.text = text
+        self.sha256 = query_hash(text)
+        names = [op.name.value for op in operations if op.name is not None]
+        self.operation_name = names[0] if len(operations) == 1 and names else None
+        self.is_mutation = any(op.operation == OperationType.MUTATION for op in operations)
+
+
+@lru_cache(maxsize=256)
+def compile_document(text):
+    return CompiledDocument(text)
+
+
+# The job documents, parsed once per process
+COMPILED_DOCUMENTS = {name: compile_document(text) for name, text in DOCUMENTS.items()}
+
+
+def persisted_query_not_found(body):
+    return any(
+        (error.get("extensions") or {}).get("code") == "PERSISTED_QUERY_NOT_FOUND"
+        or error.get("message") == "PersistedQueryNotFound"
+        for error in body.get("errors") or ()
+        if isinstance(error, dict)
+    )
+
+
+def connection_refused(error):
+    # No connection was opened, so nothing reached the server
+    reason = getattr(error.args[0], "reason", None) if error.args else None
+    return isinstance(error, requests.ConnectTimeout) or isinstance(reason, NewConnectionError)
+
+
+class GraphQLClient:
+    """Keep-alive GraphQL-over-HTTP client for one endpoint."""
+
+    def __init__(self, endpoint, connect_timeout=3.05, read_timeout=30.0, retries=3,
+                 backoff=0.5, max_backoff=10.0, pool_size=4, persisted=True):
+        self.endpoint = endpoint
+        self.timeout = (connect_timeout, read_timeout)
+        self.retries = retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.persisted = persisted
+        self.session = requests.Session()
+        # Retries are handled here, where queries and mutations are told apart
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=0)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self.session.headers.update({"Accept": "application/json"})
+
+    def execute(self, document, variables=None, operation_name=None):
+        compiled = compile_document(document) if isinstance(document, str) else document
+        payload = {
+            "variables": variables or {},
+            "operationName": operation_name or compiled.operation_name,
+        }
+        if self.persisted:
+            payload["extensions"] = {
+                "persistedQuery": {"version": 1, "sha256Hash": compiled.sha256},
+            }
+            response = self.post(payload, compiled.is_mutation)
+            body = self.decode(response)
+            if not persisted_query_not_found(body):
+                return self.result(response, body)
+
+        payload["query"] = compiled.text
+        response = self.post(payload, compiled.is_mutation)
+        return self.result(response, self.decode(response))
+
+    def post(self, payload, is_mutation):
+        attempt = 0
+        while True:
+            try:
+                response = self.session.post(self.endpoint, json=payload, timeout=self.timeout)
+            except (requests.ConnectionError, requests.Timeout) as e:
+                if attempt >= self.retries or (is_mutation and not connection_refused(e)):
+                    raise
+                error = e
+            else:
+                if (response.status_code not in RETRY_STATUSES or is_mutation
+                        or attempt >= self.retries):
+                    return response
+                error = f"HTTP {response.status_code}"
+            delay = random.uniform(0, min(self.max_backoff, self.backoff * 2 ** attempt))
+            attempt += 1
+            logger.warning("GraphQL request to %s failed (%s), retry %d in %.2fs",
+                           self.endpoint, error, attempt, delay)
+            time.sleep(delay)
+
+    def decode(self, response):
+        try:
+            body = response.json()
+        except ValueError:
+            response.raise_for_status()
+            raise GraphQLExecutionError([f"Invalid JSON response ({response.status_code})"])
+        return body if isinstance(body, dict) else {}
+
+    def result(self, response, body):
+        if body.get("errors"):
+            raise GraphQLExecutionError([
+                error.get("message", error) if isinstance(error, dict) else error
+                for error in body["errors"]
+            ])
+        response.raise_for_status()
+        return body.get("data")
+
+    def close(self):
+        self.session.close()
+
+
+_clients = {}
+_clients_lock = threading.Lock()
+
+
+def get_client(endpoint):
+    """Return this process's shared client for ``endpoint``."""
+    client = _clients.get(endpoint)
+    if client is None:
+        with _clients_lock:
+            client = _clients.get(endpoint)
+            if client is None:
+                config = get_client_settings()
+                client = _clients[endpoint] = GraphQLClient(
+                    endpoint,
+                    connect_timeout=config["CONNECT_TIMEOUT"],
+                    read_timeout=config["READ_TIMEOUT"],
+                    retries=config["RETRIES"],
+                    backoff=config["BACKOFF"],
+                    max_backoff=config["MAX_BACKOFF"],
+                    pool_size=config["POOL_SIZE"],
+                    persisted=config["PERSISTED"],
+                )
+    return client
+
+
+def reset_clients():
+    """Close every shared client so the next call opens new connections."""
+    with _clients_lock:
+        for client in _clients.values():
+            client.close()
+        _clients.clear()
+
+
+if hasattr(os, "register_at_fork"):
+    # A forked worker must not read from its parent's sockets
+    os.register_at_fork(after_in_child=_clients.clear)
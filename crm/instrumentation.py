@@ -0,0 +1,305 @@
+"""
+crm/instrumentation.py
+Per-operation timing and SQL instrumentation for the GraphQL views.
+
+While CRMGraphQLView executes an operation (see ``instrument``):
+
+* ResolverTimingMiddleware times every resolver that does work, keyed by
+  the schema field it resolves (``OrderType.customer``), never by
+  client-chosen aliases, so the ``path`` label is bounded by the schema.
+  Fields read with graphene's default attribute resolver are only timed
+  with TRACING on;
+* ``record_sql``, installed on every database connection, counts queries and
+  their time and charges each one to the resolver that was running;
+* an operation issuing more than N_PLUS_ONE_THRESHOLD queries is logged as a
+  likely N+1, with its most repeated statements and the fields behind them.
+
+Totals are kept per process and served in the Prometheus text format by
+``crm.views.metrics_view``. With TRACING on, responses also carry an
+Apollo-style ``extensions.tracing`` block. Configure it with:
+
+    CRM_INSTRUMENTATION = {
+        "ENABLED": True,
+        "TRACING": False,
+        "N_PLUS_ONE_THRESHOLD": 20,
+        "METRICS_ALLOWED_IPS": ("127.0.0.1", "::1"),
+        "METRICS_TOKEN": None,
+    }
+
+``METRICS_ALLOWED_IPS`` is checked against REMOTE_ADDR. Behind a reverse
+proxy every request comes from the proxy's address, so a loopback
+allowlist lets anyone through; set ``METRICS_TOKEN`` and have the scraper
+send ``Authorization: Bearer <token>``.
+"""
+
+import logging
+import re
+import threading
+import time
+from collections import Counter, defaultdict
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import datetime, timezone
+from functools import lru_cache, partial
+from inspect import isawaitable
+
+from django.conf import settings
+from graphene.types.resolver import attr_resolver, dict_or_attr_resolver, dict_resolver
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_SETTINGS = {
+    "ENABLED": True,
+    "TRACING": False,
+    # SQL queries one operation may run before it is logged as a likely N+1
+    "N_PLUS_ONE_THRESHOLD": 20,
+    "METRICS_ALLOWED_IPS": ("127.0.0.1", "::1"),
+    # Bearer token /metrics/ also requires when set
+    "METRICS_TOKEN": None,
+}
+
+# Collapses "IN (%s, %s, ...)" so batches of any size share a fingerprint
+IN_LIST_RE = re.compile(r"\(\s*%s(?:\s*,\s*%s)*\s*\)")
+
+current_operation = ContextVar("crm_current_operation", default=None)
+current_path = ContextVar("crm_current_path", default=None)
+
+
+# Distinct operation names exported before the rest are grouped as "other"
+MAX_OPERATION_LABELS = 200
+
+
+def get_instrumentation_settings():
+    return {**DEFAULT_SETTINGS, **getattr(settings, "CRM_INSTRUMENTATION", {})}
+
+
+def operation_label(operation_ast, operation_name=None):
+    if operation_ast is not None and operation_ast.name is not None:
+        return operation_ast.name.value
+    return operation_name or "anonymous"
+
+
+def field_path(info):
+    return f"{info.parent_type.name}.{info.field_name}"
+
+
+DEFAULT_RESOLVERS = (attr_resolver, dict_resolver, dict_or_attr_resolver)
+
+
+@lru_cache(maxsize=None)
+def resolver_does_work(parent_type, field_name):
+    """False for fields read by graphene's (or graphql-core's) default resolver."""
+    resolve = parent_type.fields[field_name].resolve
+    if isinstance(resolve, partial):
+        resolve = resolve.func
+    return resolve is not None and resolve not in DEFAULT_RESOLVERS
+
+
+class OperationMetrics:
+    """Timings and SQL statistics of one GraphQL operation."""
+
+    def __init__(self, operation_name, tracing=False):
+        self.operation_name = operation_name or "anonymous"
+        self.tracing = tracing
+        self.start_time = datetime.now(timezone.utc)
+        self.started = time.perf_counter()
+        self.duration = None
+        self.resolver_time = defaultdict(float)
+        self.resolver_calls = Counter()
+        self.resolver_traces = []
+        self.sql_count = 0
+        self.sql_time = 0.0
+        self.sql_statements = Counter()
+        self.sql_paths = defaultdict(Counter)
+
+    def record_resolver(self, info, started, duration):
+        path = field_path(info)
+        self.resolver_time[path] += duration
+        self.resolver_calls[path] += 1
+        if self.tracing:
+            self.resolver_traces.append({
+                "path": info.path.as_list(),
+                "parentType": info.parent_type.name,
+                "fieldName": info.field_name,
+                "returnType": str(info.return_type),
+                "startOffset": int((started - self.started) * 1e9),
+                "duration": int(duration * 1e9),
+            })
+
+    def record_sql(self, sql, duration, path):
+        fingerprint = IN_LIST_RE.sub("(...)", sql)
+        self.sql_count += 1
+        self.sql_time += duration
+        self.sql_statements[fingerprint] += 1
+        self.sql_paths[fingerprint][path or "<operation>"] += 1
+
+    def finish(self):
+        self.duration = time.perf_counter() - self.started
+
+    def tracing_extension(self):
+        return {
+            "version": 1,
+            "startTime": self.start_time.isoformat(),
+            "endTime": datetime.now(timezone.utc).isoformat(),
+            "duration": int(self.duration * 1e9),
+            "execution": {"resolvers": self.resolver_traces},
+            "sql": {"count": self.sql_count, "duration": int(self.sql_time * 1e9)},
+        }
+
+    def n_plus_one_report(self, limit=3):
+        lines = [f"{self.sql_count} SQL queries in GraphQL operation {self.operation_name}"]
+        for statement, count in self.sql_statements.most_common(limit):
+            paths = ", ".join(path for path, _ in self.sql_paths[statement].most_common(3))
+            lines.append(f"  {count}x from {paths}: {statement[:200]}")
+        return "\n".join(lines)
+
+
+class ResolverTimingMiddleware:
+    """Graphene middleware timing each resolver of an instrumented operation."""
+
+    def resolve(self, next, root, info, **args):
+        metrics = current_operation.get()
+        if metrics is None or not (metrics.tracing or resolver_does_work(info.parent_type, info.field_name)):
+            return next(root, info, **args)
+
+        token = current_path.set(field_path(info))
+        started = time.perf_counter()
+        try:
+            result = next(root, info, **args)
+        finally:
+            current_path.reset(token)
+        if isawaitable(result):
+            return self.await_result(result, metrics, info, started)
+        metrics.record_resolver(info, started, time.perf_counter() - started)
+        return result
+
+    async def await_result(self, result, metrics, info, started):
+        try:
+            return await result
+        finally:
+            metrics.record_resolver(info, started, time.perf_counter() - started)
+
+
+RESOLVER_TIMING = ResolverTimingMiddleware()
+
+
+def record_sql(execute, sql, params, many, context):
+    """Database execute wrapper charging each query to the running operation."""
+    metrics = current_operation.get()
+    if metrics is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        metrics.record_sql(sql, time.perf_counter() - started, current_path.get())
+
+
+def install_sql_recorder(sender, connection, **kwargs):
+    """connection_created receiver adding ``record_sql`` to the connection."""
+    if record_sql not in connection.execute_wrappers:
+        connection.execute_wrappers.append(record_sql)
+
+
+class MetricsRegistry:
+    """Process-wide totals rendered in the Prometheus text format."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.clear()
+
+    def clear(self):
+        self.operations = Counter()
+        self.operation_seconds = defaultdict(float)
+        self.sql_queries = Counter()
+        self.sql_seconds = defaultdict(float)
+        self.n_plus_one = Counter()
+        self.resolver_calls = Counter()
+        self.resolver_seconds = defaultdict(float)
+        self.cache_hits = Counter()
+
+    def label(self, name):
+        # Operation names come from clients; keep the label set bounded
+        if name in self.operations or len(self.operations) < MAX_OPERATION_LABELS:
+            return name
+        return "other"
+
+    def observe(self, metrics, n_plus_one=False):
+        with self._lock:
+            name = self.label(metrics.operation_name)
+            self.operations[name] += 1
+            self.operation_seconds[name] += metrics.duration
+            self.sql_queries[name] += metrics.sql_count
+            self.sql_seconds[name] += metrics.sql_time
+            if n_plus_one:
+                self.n_plus_one[name] += 1
+            for path, calls in metrics.resolver_calls.items():
+                self.resolver_calls[path] += calls
+                self.resolver_seconds[path] += metrics.resolver_time[path]
+
+    def observe_cache_hit(self, operation_name):
+        with self._lock:
+            self.cache_hits[self.label(operation_name)] += 1
+
+    def render(self):
+        families = [
+            ("crm_graphql_operations_total", "counter", "Executed GraphQL operations.",
+             "operation", self.operations),
+            ("crm_graphql_operation_seconds_total", "counter", "Time spent executing operations.",
+             "operation", self.operation_seconds),
+            ("crm_graphql_sql_queries_total", "counter", "SQL queries run by operations.",
+             "operation", self.sql_queries),
+            ("crm_graphql_sql_seconds_total", "counter", "Time spent in SQL by operations.",
+             "operation", self.sql_seconds),
+            ("crm_graphql_n_plus_one_total", "counter", "Operations over the N+1 query threshold.",
+             "operation", self.n_plus_one),
+            ("crm_graphql_response_cache_hits_total", "counter", "Operations served from the response cache.",
+             "operation", self.cache_hits),
+            ("crm_graphql_resolver_calls_total", "counter", "Resolver calls per schema field.",
+             "path", self.resolver_calls),
+            ("crm_graphql_resolver_seconds_total", "counter", "Resolver time per schema field.",
+             "path", self.resolver_seconds),
+        ]
+        lines = []
+        with self._lock:
+            for name, kind, help_text, label, values in families:
+                lines.append(f"# HELP {name} {help_text}")
+                lines.append(f"# TYPE {name} {kind}")
+                for key, value in sorted(values.items()):
+                    escaped = key.replace("\\", "\\\\").replace('"', '\\"')
+                    lines.append(f'{name}{{{label}="{escaped}"}} {value:g}')
+        return "\n".join(lines) + "\n"
+
+
+registry = MetricsRegistry()
+
+
+def attach_tracing(result, metrics):
+    """Add the ``tracing`` extension to ``result`` when tracing is on."""
+    if metrics is not None and metrics.tracing:
+        result.extensions = {**(result.extensions or {}), "tracing": metrics.tracing_extension()}
+    return result
+
+
+@contextmanager
+def instrument(operation_name):
+    """
+    Collect metrics for the operation executed inside the block. Yields the
+    OperationMetrics, or None when instrumentation is off.
+    """
+    config = get_instrumentation_settings()
+    if not config["ENABLED"]:
+        yield None
+        return
+
+    metrics = OperationMetrics(operation_name, tracing=config["TRACING"])
+    token = current_operation.set(metrics)
+    try:
+        yield metrics
+    finally:
+        current_operation.reset(token)
+        metrics.finish()
+        n_plus_one = metrics.sql_count > config["N_PLUS_ONE_THRESHOLD"]
+        if n_plus_one:
+            logger.warning("Possible N+1 query pattern: %s", metrics.n_plus_one_report())
+        registry.observe(metrics, n_plus_one)
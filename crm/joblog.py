@@ -0,0 +1,206 @@
+"""
+crm/joblog.py
+Buffered JSON-lines log shared by the cron jobs and Celery tasks.
+
+Each record is one JSON object per line:
+
+    {"time": "2025-01-02T06:00:00+00:00", "job": "crm_report", "level": "info",
+     "message": "Report: 3 customers, 5 orders, 42.5 revenue", "customers": 3, ...}
+
+Records are buffered in memory and appended in one write per flush, so a job
+logging thousands of orders costs a handful of syscalls, not one per line.
+Jobs flush when they finish; the buffer is also flushed when it is full and
+at exit.
+
+Several processes (Celery's prefork workers, cron) can share a file: each
+flush holds an exclusive lock on ``<path>.lock`` while it rotates and
+appends. Where file locks are not available each process writes to its own
+``<path>.<pid>`` file instead.
+
+Files are rotated to ``<path>.1`` ... ``<path>.N`` when they would grow past
+a size, or when the last write was in an earlier time period. Like
+crm/graphql_client.py this module is used where Django may not be set up,
+so it is configured from the environment:
+
+    CRM_JOB_LOG_MAX_BYTES=10485760    rotate before a file grows past this; 0 to turn off
+    CRM_JOB_LOG_ROTATE_INTERVAL=0     also rotate every this many seconds (86400: daily)
+    CRM_JOB_LOG_BACKUPS=5             rotated files kept
+    CRM_JOB_LOG_COMPRESS=0            gzip rotated files
+    CRM_JOB_LOG_BUFFER=1000           records held before a flush
+"""
+
+import atexit
+import gzip
+import json
+import os
+import shutil
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime, timezone
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - Windows
+    fcntl = None
+
+DEFAULT_SETTINGS = {
+    "MAX_BYTES": 10 * 1024 * 1024,
+    "ROTATE_INTERVAL": 0,
+    "BACKUPS": 5,
+    "COMPRESS": False,
+    "BUFFER": 1000,
+}
+
+
+def get_job_log_settings():
+    config = dict(DEFAULT_SETTINGS)
+    for name, default in DEFAULT_SETTINGS.items():
+        value = os.environ.get(f"CRM_JOB_LOG_{name}")
+        if value is None:
+            continue
+        if isinstance(default, bool):
+            config[name] = value.lower() not in ("0", "false", "no", "")
+        else:
+            config[name] = type(default)(value)
+    return config
+
+
+class JobLog:
+    """Buffered, rotating JSON-lines writer for one log file."""
+
+    def __init__(self, path, max_bytes=10 * 1024 * 1024, rotate_interval=0, backups=5,
+                 compress=False, buffer=1000):
+        # Without file locks, processes must not share (or rotate) one file
+        self.path = path if fcntl is not None else f"{path}.{os.getpid()}"
+        self.max_bytes = max_bytes
+        self.rotate_interval = rotate_interval
+        self.backups = backups
+        self.compress = compress
+        self.buffer = buffer
+        self._records = []
+        self._lock = threading.Lock()
+
+    def write(self, job, message, level="info", **fields):
+        record = {
+            "time": datetime.now(timezone.utc).isoformat(),
+            "job": job,
+            "level": level,
+            "message": message,
+            **fields,
+        }
+        line = json.dumps(record, default=str, separators=(",", ":")) + "\n"
+        with self._lock:
+            self._records.append(line)
+            full = len(self._records) >= self.buffer
+        if full:
+            self.flush()
+
+    def error(self, job, message, **fields):
+        self.write(job, message, level="error", **fields)
+
+    def flush(self):
+        """Append the buffered records in one write."""
+        with self._lock:
+            if not self._records:
+                return
+            data = "".join(self._records).encode()
+            with self.file_lock():
+                if self.should_rotate(len(data)):
+                    self.rotate()
+                fd = os.open(self.path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+                try:
+                    view = memoryview(data)
+                    while view:
+                        view = view[os.write(fd, view):]
+                finally:
+                    os.close(fd)
+            # Only dropped once written, so a failed flush is retried
+            self._records.clear()
+
+    @contextmanager
+    def file_lock(self):
+        if fcntl is None:
+            yield
+            return
+        fd = os.open(f"{self.path}.lock", os.O_WRONLY | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX)
+            yield
+        finally:
+            os.close(fd)
+
+    def should_rotate(self, incoming):
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            return False
+        if stat.st_size == 0:
+            return False
+        if self.max_bytes and stat.st_size + incoming > self.max_bytes:
+            return True
+        interval = self.rotate_interval
+        return bool(interval) and stat.st_mtime // interval != time.time() // interval
+
+    def backup_name(self, index):
+        return f"{self.path}.{index}" + (".gz" if self.compress else "")
+
+    def rotate(self):
+        """Shift <path>.1..N up by one and move the current file to <path>.1."""
+        if self.backups < 1:
+            os.remove(self.path)
+            return
+        for index in range(self.backups - 1, 0, -1):
+            if os.path.exists(self.backup_name(index)):
+                os.replace(self.backup_name(index), self.backup_name(index + 1))
+        if not self.compress:
+            os.replace(self.path, self.backup_name(1))
+            return
+        partial = self.backup_name(1) + ".tmp"
+        with open(self.path, "rb") as src, gzip.open(partial, "wb") as dst:
+            shutil.copyfileobj(src, dst)
+        os.replace(partial, self.backup_name(1))
+        os.remove(self.path)
+
+
+_logs = {}
+_logs_lock = threading.Lock()
+
+
+def get_job_log(path):
+    """Return this process's shared log for ``path``."""
+    log = _logs.get(path)
+    if log is None:
+        with _logs_lock:
+            log = _logs.get(path)
+            if log is None:
+                config = get_job_log_settings()
+                log = _logs[path] = JobLog(
+                    path,
+                    max_bytes=config["MAX_BYTES"],
+                    rotate_interval=config["ROTATE_INTERVAL"],
+                    backups=config["BACKUPS"],
+                    compress=config["COMPRESS"],
+                    buffer=config["BUFFER"],
+                )
+    return log
+
+
+def flush_job_logs():
+    for log in list(_logs.values()):
+        log.flush()
+
+
+def reset_job_logs():
+    """Flush and forget every shared log so the next call rereads the settings."""
+    with _logs_lock:
+        for log in _logs.values():
+            log.flush()
+        _logs.clear()
+
+
+atexit.register(flush_job_logs)
+
+if hasattr(os, "register_at_fork"):
+    # The parent flushes its own buffers; a child must not write them again
+    os.register_at_fork(after_in_child=_logs.clear)
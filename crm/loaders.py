@@ -0,0 +1,233 @@
+"""
+crm/loaders.py
+Per-request batch loaders used by the CRM GraphQL types.
+
+Under the sync views a loader cannot wait for the end of a tick to collect
+keys like the classic async DataLoader does. Instead the list/connection
+resolvers prime the loader with every row of the page they return, and the
+first field resolver that asks for a key loads all pending keys at once.
+That keeps it at one ``IN (...)`` query per field per request, whatever the
+page size.
+
+Under the async view (crm.views.AsyncCRMGraphQLView) resolvers call
+``aload`` instead: keys requested in the same event loop tick are fetched
+together with the async ORM once the tick ends.
+"""
+
+import asyncio
+from collections import defaultdict
+
+from asgiref.sync import sync_to_async
+
+from .catalog import get_product_catalog, get_products
+from .models import Customer, Order, Product
+
+
+def running_async():
+    """True when called from the event loop, where the sync ORM is off limits."""
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        return False
+    return True
+
+
+class BatchLoader:
+    """
+    Caches values by key and resolves pending keys in a single batch.
+    ``batch_load_fn`` takes a list of keys and returns a dict of key -> value;
+    ``async_batch_load_fn`` is its coroutine version used by ``aload``.
+    """
+
+    def __init__(self, batch_load_fn, default=None, async_batch_load_fn=None):
+        self.batch_load_fn = batch_load_fn
+        self.async_batch_load_fn = async_batch_load_fn or sync_to_async(batch_load_fn)
+        self.default = default
+        self._cache = {}
+        self._pending = {}
+        self._batch = None
+
+    def prime_many(self, keys):
+        """Queue keys to be fetched with the next batch."""
+        for key in keys:
+            if key not in self._cache:
+                self._pending[key] = None
+
+    def prime(self, key, value):
+        """Store an already known value so it is never fetched."""
+        self._cache[key] = value
+        self._pending.pop(key, None)
+
+    def load(self, key):
+        if key not in self._cache:
+            self._pending[key] = None
+            self.dispatch()
+        return self._cache[key]
+
+    def load_many(self, keys):
+        self.prime_many(keys)
+        return [self.load(key) for key in keys]
+
+    def dispatch(self):
+        if not self._pending:
+            return
+        keys = list(self._pending)
+        self._pending.clear()
+        self._store(keys, self.batch_load_fn(keys))
+
+    async def aload(self, key):
+        if key not in self._cache:
+            self._pending[key] = None
+            if self._batch is None:
+                loop = asyncio.get_running_loop()
+                self._batch = loop.create_future()
+                # Runs after every resolver already scheduled in this tick
+                loop.call_soon(lambda: asyncio.ensure_future(self.adispatch()))
+            await asyncio.shield(self._batch)
+        return self._cache[key]
+
+    async def adispatch(self):
+        batch, self._batch = self._batch, None
+        keys = list(self._pending)
+        self._pending.clear()
+        try:
+            self._store(keys, await self.async_batch_load_fn(keys))
+        except Exception as e:
+            batch.set_exception(e)
+        else:
+            batch.set_result(None)
+
+    def _store(self, keys, results):
+        for key in keys:
+            value = results.get(key, self.default)
+            self._cache[key] = list(value) if isinstance(value, list) else value
+
+    def clear(self, key=None):
+        if key is None:
+            self._cache.clear()
+        else:
+            self._cache.pop(key, None)
+
+
+def load_customers(customer_ids):
+    return Customer.objects.in_bulk(customer_ids)
+
+
+async def aload_customers(customer_ids):
+    return await Customer.objects.ain_bulk(customer_ids)
+
+
+def order_product_links(order_ids):
+    return (
+        Order.products.through.objects
+        .filter(order_id__in=order_ids)
+        .select_related("product")
+        .order_by("order_id", "product_id")
+    )
+
+
+def order_product_ids(order_ids):
+    return (
+        Order.products.through.objects
+        .filter(order_id__in=order_ids)
+        .order_by("order_id", "product_id")
+        .values_list("order_id", "product_id")
+    )
+
+
+def group_products(pairs, products):
+    products_by_order = defaultdict(list)
+    for order_id, product_id in pairs:
+        if product_id in products:
+            products_by_order[order_id].append(products[product_id])
+    return products_by_order
+
+
+def load_order_products(order_ids):
+    # With the product catalog only the link rows come from the database
+    if get_product_catalog() is not None:
+        pairs = list(order_product_ids(order_ids))
+        return group_products(pairs, get_products({product_id for _, product_id in pairs}))
+    products_by_order = defaultdict(list)
+    for link in order_product_links(order_ids):
+        products_by_order[link.order_id].append(link.product)
+    return products_by_order
+
+
+async def aload_order_products(order_ids):
+    if get_product_catalog() is not None:
+        pairs = [pair async for pair in order_product_ids(order_ids)]
+        products = await sync_to_async(get_products)({product_id for _, product_id in pairs})
+        return group_products(pairs, products)
+    products_by_order = defaultdict(list)
+    async for link in order_product_links(order_ids):
+        products_by_order[link.order_id].append(link.product)
+    return products_by_order
+
+
+def load_product_stock(product_ids):
+    return dict(Product.objects.filter(id__in=product_ids).values_list("id", "stock"))
+
+
+async def aload_product_stock(product_ids):
+    return {pid: stock async for pid, stock in
+            Product.objects.filter(id__in=product_ids).values_list("id", "stock")}
+
+
+class Loaders:
+    """The set of loaders shared by one GraphQL request."""
+
+    def __init__(self):
+        self.customer = BatchLoader(load_customers, async_batch_load_fn=aload_customers)
+        self.order_products = BatchLoader(
+            self.load_order_products, default=[], async_batch_load_fn=self.aload_order_products
+        )
+        # Cached product records carry no stock; it is read in one batch on demand
+        self.product_stock = BatchLoader(load_product_stock, async_batch_load_fn=aload_product_stock)
+
+    def load_order_products(self, order_ids):
+        products_by_order = load_order_products(order_ids)
+        self.queue_product_stock(products_by_order.values())
+        return products_by_order
+
+    async def aload_order_products(self, order_ids):
+        products_by_order = await aload_order_products(order_ids)
+        self.queue_product_stock(products_by_order.values())
+        return products_by_order
+
+    def queue_product_stock(self, product_lists):
+        self.product_stock.prime_many(
+            product.pk for products in product_lists for product in products
+        )
+
+    def prime_order_products(self, order_id, products):
+        """Store the products of a just-created order."""
+        self.order_products.prime(order_id, products)
+        self.queue_product_stock([products])
+
+    def prime_orders(self, orders):
+        """Queue the related rows of a page of orders for batch loading."""
+        customer_ids = []
+        order_ids = []
+        for order in orders:
+            if Order.customer.is_cached(order):
+                self.customer.prime(order.customer_id, order.customer)
+            elif "customer_id" not in order.get_deferred_fields():
+                customer_ids.append(order.customer_id)
+            if "products" not in getattr(order, "_prefetched_objects_cache", {}):
+                order_ids.append(order.pk)
+        self.customer.prime_many(customer_ids)
+        self.order_products.prime_many(order_ids)
+
+
+def get_loaders(context):
+    """
+    Return the loaders attached to the GraphQL context, creating them on
+    first use so plain ``schema.execute`` calls get batching too.
+    """
+    loaders = getattr(context, "loaders", None)
+    if loaders is None:
+        loaders = Loaders()
+        if context is not None:
+            context.loaders = loaders
+    return loaders
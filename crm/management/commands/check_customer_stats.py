@@ -0,0 +1,30 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from crm.customer_stats import STATS_BATCH_SIZE, check_customer_stats, refresh_customer_stats
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare each customer's stored order statistics with their orders. "
+        "Exits with an error when any are stale."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--chunk-size", type=int, default=STATS_BATCH_SIZE)
+        parser.add_argument("--fix", action="store_true",
+                            help="Recompute the statistics of stale customers.")
+
+    def handle(self, *args, chunk_size, fix, **options):
+        stale = set()
+        for customer_id, field, stored, actual in check_customer_stats(chunk_size):
+            stale.add(customer_id)
+            self.stdout.write(f"Customer {customer_id}: {field} is {stored}, expected {actual}")
+
+        if not stale:
+            self.stdout.write(self.style.SUCCESS("Customer statistics are consistent."))
+            return
+        if fix:
+            refresh_customer_stats(sorted(stale))
+            self.stdout.write(self.style.SUCCESS(f"Fixed statistics for {len(stale)} customers."))
+            return
+        raise CommandError(f"{len(stale)} customers have stale statistics.")
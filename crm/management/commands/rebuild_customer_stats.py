@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+
+from crm.customer_stats import STATS_BATCH_SIZE, rebuild_customer_stats
+
+
+class Command(BaseCommand):
+    help = (
+        "Recompute every customer's order_count, total_spent and last_order_date "
+        "from their orders, one chunk of customers at a time."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--chunk-size", type=int, default=STATS_BATCH_SIZE)
+
+    def handle(self, *args, chunk_size, **options):
+        updated = rebuild_customer_stats(chunk_size)
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt statistics for {updated} customers."))
@@ -0,0 +1,39 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from crm.benchmarks.seed import seed as seed_data
+
+
+class Command(BaseCommand):
+    help = (
+        "Bulk-insert synthetic customers, products and orders (with their product "
+        "links and customer statistics) for benchmarking and local testing."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--customers", type=int, default=1000)
+        parser.add_argument("--products", type=int, default=100)
+        parser.add_argument("--orders", type=int, default=5000)
+        parser.add_argument("--products-per-order", type=int, default=3)
+        parser.add_argument("--days", type=int, default=365,
+                            help="Spread creation and order dates over this many past days.")
+        parser.add_argument("--batch-size", type=int, default=5000)
+        parser.add_argument("--seed", type=int, default=0, help="Random seed, for repeatable data.")
+
+    def handle(self, *args, customers, products, orders, products_per_order, days,
+               batch_size, seed, **options):
+        for name, value in (("customers", customers), ("products", products), ("orders", orders),
+                            ("products-per-order", products_per_order)):
+            if value < 0:
+                raise CommandError(f"--{name} cannot be negative")
+        if days < 1 or batch_size < 1:
+            raise CommandError("--days and --batch-size must be positive")
+
+        counts = seed_data(
+            customers=customers, products=products, orders=orders,
+            products_per_order=products_per_order, days=days,
+            batch_size=batch_size, random_seed=seed,
+        )
+        self.stdout.write(self.style.SUCCESS(
+            f"Seeded {counts['customers']} customers, {counts['products']} products "
+            f"and {counts['orders']} orders."
+        ))
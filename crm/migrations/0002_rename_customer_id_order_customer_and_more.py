@@ -0,0 +1,46 @@
+# Generated by Django 5.0.1 on 2026-10-18 02:03
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('crm', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.RenameField(
+            model_name='order',
+            old_name='customer_id',
+            new_name='customer',
+        ),
+        migrations.RenameField(
+            model_name='order',
+            old_name='product_ids',
+            new_name='products',
+        ),
+        migrations.AddField(
+            model_name='customer',
+            name='created_at',
+            field=models.DateTimeField(auto_now_add=True, default=django.utils.timezone.now),
+            preserve_default=False,
+        ),
+        migrations.AddField(
+            model_name='order',
+            name='total_amount',
+            field=models.DecimalField(decimal_places=2, default=0, max_digits=10),
+            preserve_default=False,
+        ),
+        migrations.AlterField(
+            model_name='customer',
+            name='phone',
+            field=models.CharField(blank=True, max_length=20, null=True),
+        ),
+        migrations.AlterField(
+            model_name='product',
+            name='stock',
+            field=models.PositiveIntegerField(default=0),
+        ),
+    ]
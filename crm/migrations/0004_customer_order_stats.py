@@ -0,0 +1,64 @@
+# Generated by Django 5.0.1 on 2026-10-18 03:02
+
+from decimal import Decimal
+
+from django.db import migrations, models
+from django.db.models import Count, Max, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+
+BACKFILL_CHUNK_SIZE = 1000
+
+
+def backfill_customer_stats(apps, schema_editor):
+    Customer = apps.get_model("crm", "Customer")
+    Order = apps.get_model("crm", "Order")
+    orders = Order.objects.filter(customer=OuterRef("pk")).order_by().values("customer")
+    stats = {
+        "order_count": Coalesce(Subquery(orders.annotate(value=Count("pk")).values("value")), 0),
+        "total_spent": Coalesce(
+            Subquery(orders.annotate(value=Sum("total_amount")).values("value")),
+            Value(Decimal("0")),
+            output_field=models.DecimalField(max_digits=12, decimal_places=2),
+        ),
+        "last_order_date": Subquery(orders.annotate(value=Max("order_date")).values("value")),
+    }
+    last_pk = 0
+    while True:
+        chunk = list(
+            Customer.objects.filter(pk__gt=last_pk).order_by("pk")
+            .values_list("pk", flat=True)[:BACKFILL_CHUNK_SIZE]
+        )
+        if not chunk:
+            return
+        Customer.objects.filter(pk__in=chunk).update(**stats)
+        last_pk = chunk[-1]
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('crm', '0003_filter_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='customer',
+            name='last_order_date',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='customer',
+            name='order_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='customer',
+            name='total_spent',
+            field=models.DecimalField(decimal_places=2, default=0, max_digits=12),
+        ),
+        migrations.AddIndex(
+            model_name='customer',
+            index=models.Index(fields=['total_spent'], name='crm_customer_spent_idx'),
+        ),
+        migrations.RunPython(backfill_customer_stats, migrations.RunPython.noop),
+    ]
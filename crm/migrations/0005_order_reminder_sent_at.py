@@ -0,0 +1,48 @@
+# Generated by Django 5.0.1 on 2026-10-18 02:38
+
+from datetime import timedelta
+
+from django.db import migrations, models
+from django.db.models import F
+from django.utils import timezone
+
+BACKFILL_CHUNK_SIZE = 1000
+# send_order_reminders.py only looks back this far
+REMINDER_WINDOW_DAYS = 7
+
+
+def mark_old_orders_reminded(apps, schema_editor):
+    # Orders past the window will never be picked up again; marking them
+    # keeps them out of the partial index
+    Order = apps.get_model("crm", "Order")
+    cutoff = timezone.now() - timedelta(days=REMINDER_WINDOW_DAYS)
+    last_pk = 0
+    while True:
+        chunk = list(
+            Order.objects.filter(pk__gt=last_pk, order_date__lt=cutoff).order_by("pk")
+            .values_list("pk", flat=True)[:BACKFILL_CHUNK_SIZE]
+        )
+        if not chunk:
+            return
+        Order.objects.filter(pk__in=chunk).update(reminder_sent_at=F("order_date"))
+        last_pk = chunk[-1]
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('crm', '0004_customer_order_stats'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='order',
+            name='reminder_sent_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.RunPython(mark_old_orders_reminded, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(condition=models.Q(('reminder_sent_at__isnull', True)), fields=['order_date', 'id'], name='crm_order_reminder_due_idx'),
+        ),
+    ]
@@ -6,6 +6,20 @@ class Customer(models.Model):
     phone = models.CharField(max_length=20, blank=True, null=True)
     created_at = models.DateTimeField(auto_now_add=True)
 
+    # Denormalized from Order, kept up to date by crm/customer_stats.py
+    order_count = models.PositiveIntegerField(default=0)
+    total_spent = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    last_order_date = models.DateTimeField(blank=True, null=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["created_at"], name="crm_customer_created_idx"),
+            models.Index(fields=["total_spent"], name="crm_customer_spent_idx"),
+            # Pattern ops let Postgres use the index for startswith (phonePattern)
+            models.Index(fields=["phone"], name="crm_customer_phone_idx",
+                         opclasses=["varchar_pattern_ops"]),
+        ]
+
     def __str__(self):
         return self.name
 
@@ -14,6 +28,13 @@ class Product(models.Model):
     price = models.DecimalField(max_digits=10, decimal_places=2)
     stock = models.PositiveIntegerField(default=0)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=["name"], name="crm_product_name_idx"),
+            models.Index(fields=["price"], name="crm_product_price_idx"),
+            models.Index(fields=["stock"], name="crm_product_stock_idx"),
+        ]
+
     def __str__(self):
         return self.name
 
@@ -22,6 +43,17 @@ class Order(models.Model):
     products = models.ManyToManyField(Product)
     total_amount = models.DecimalField(max_digits=10, decimal_places=2)
     order_date = models.DateTimeField(auto_now_add=True)
+    # Set once send_order_reminders.py has logged the order
+    reminder_sent_at = models.DateTimeField(blank=True, null=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["order_date", "id"], name="crm_order_date_id_idx"),
+            models.Index(fields=["total_amount"], name="crm_order_total_idx"),
+            # Only orders still waiting for a reminder, so the scan stays O(new orders)
+            models.Index(fields=["order_date", "id"], name="crm_order_reminder_due_idx",
+                         condition=models.Q(reminder_sent_at__isnull=True)),
+        ]
 
     def __str__(self):
         return f"Order {self.id} - {self.customer.name}"
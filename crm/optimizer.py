@@ -0,0 +1,105 @@
+"""
+crm/optimizer.py
+Shapes querysets after the GraphQL selection set.
+
+Given the ``info`` of a list or connection resolver, ``optimize_queryset``
+walks the requested fields and applies ``select_related`` for foreign keys,
+``prefetch_related`` (with a pruned ``Prefetch`` queryset) for many-to-many
+fields, and ``.only()`` so each table loads just the columns it touches.
+"""
+
+from django.core.exceptions import FieldDoesNotExist
+from django.db.models import Prefetch
+from graphene.utils.str_converters import to_snake_case
+from graphql.language import FieldNode, FragmentSpreadNode, InlineFragmentNode
+
+from .catalog import catalog_serves
+
+
+def _iter_field_nodes(info, selections):
+    for selection in selections:
+        if isinstance(selection, FieldNode):
+            yield selection
+        elif isinstance(selection, InlineFragmentNode):
+            yield from _iter_field_nodes(info, selection.selection_set.selections)
+        elif isinstance(selection, FragmentSpreadNode):
+            fragment = info.fragments[selection.name.value]
+            yield from _iter_field_nodes(info, fragment.selection_set.selections)
+
+
+def selected_fields(info, field_nodes):
+    """Return ``{field name: [FieldNode, ...]}`` for the children of ``field_nodes``."""
+    fields = {}
+    for field_node in field_nodes:
+        if field_node.selection_set is None:
+            continue
+        for child in _iter_field_nodes(info, field_node.selection_set.selections):
+            fields.setdefault(child.name.value, []).append(child)
+    return fields
+
+
+def connection_node_fields(info, field_nodes):
+    """Unwrap ``edges { node { ... } }`` and return the node's field nodes."""
+    edges = selected_fields(info, field_nodes).get("edges", [])
+    return selected_fields(info, edges).get("node", [])
+
+
+class QueryPlan:
+    def __init__(self):
+        self.only = set()
+        self.select_related = set()
+        self.prefetch_related = []
+        # False once a selected field cannot be mapped to a column
+        self.can_prune = True
+
+
+def build_plan(model, info, field_nodes, plan=None, prefix=""):
+    plan = plan or QueryPlan()
+    plan.only.add(prefix + model._meta.pk.name)
+
+    for name, nodes in selected_fields(info, field_nodes).items():
+        if name.startswith("__"):
+            continue
+        try:
+            field = model._meta.get_field(to_snake_case(name))
+        except FieldDoesNotExist:
+            plan.can_prune = False
+            continue
+
+        path = prefix + field.name
+        if field.many_to_many and field.concrete:
+            if catalog_serves(field.related_model):
+                # The batch loader reads the link rows and takes the rest from memory
+                continue
+            related = optimize_queryset(
+                field.related_model._default_manager.all(), info, nodes
+            )
+            plan.prefetch_related.append(Prefetch(path, queryset=related))
+        elif field.is_relation and field.concrete:
+            plan.only.add(path)
+            plan.select_related.add(path)
+            build_plan(field.related_model, info, nodes, plan, prefix=path + "__")
+        elif field.concrete:
+            plan.only.add(path)
+        else:
+            # Reverse relations are left to their own resolvers
+            plan.can_prune = False
+    return plan
+
+
+def optimize_queryset(queryset, info, field_nodes=None):
+    """
+    Apply select_related/prefetch_related/only to ``queryset`` for the fields
+    requested under ``field_nodes`` (defaults to the current field).
+    """
+    if field_nodes is None:
+        field_nodes = info.field_nodes
+    plan = build_plan(queryset.model, info, field_nodes)
+
+    if plan.select_related:
+        queryset = queryset.select_related(*sorted(plan.select_related))
+    if plan.prefetch_related:
+        queryset = queryset.prefetch_related(*plan.prefetch_related)
+    if plan.can_prune:
+        queryset = queryset.only(*sorted(plan.only))
+    return queryset
@@ -0,0 +1,158 @@
+"""
+crm/persisted.py
+Persisted queries and a cache of parsed, validated documents.
+
+Every document that reaches CRMGraphQLView is looked up by the sha256 of its
+text in a bounded LRU of already parsed and validated DocumentNodes, so a
+repeated query skips parse and validate. Clients may also send only the hash
+in ``extensions.persistedQuery.sha256Hash`` (Apollo's protocol): known
+hashes run straight from the cache or from the crm/queries.py registry,
+unknown ones answer ``PersistedQueryNotFound`` so the client can retry with
+the full text once.
+
+Configure it with the CRM_PERSISTED_QUERIES setting:
+
+    CRM_PERSISTED_QUERIES = {
+        "MAX_ENTRIES": 512,       # parsed documents kept per schema
+        "ALLOWLIST_ONLY": False,  # reject documents not in crm/queries.py
+    }
+"""
+
+import json
+import threading
+from collections import OrderedDict
+
+from django.conf import settings
+from graphql import GraphQLError, parse, print_ast
+from graphql.validation import validate
+from graphene_django.settings import graphene_settings
+
+from .queries import PERSISTED_QUERIES, query_hash
+
+DEFAULT_SETTINGS = {
+    "MAX_ENTRIES": 512,
+    "ALLOWLIST_ONLY": False,
+}
+
+
+class DocumentEntry:
+    __slots__ = ("document", "normalized")
+
+    def __init__(self, document):
+        self.document = document
+        # Whitespace-insensitive text, used as the response cache key
+        self.normalized = print_ast(document)
+
+
+class DocumentRegistry:
+    """Bounded LRU of sha256 -> validated DocumentEntry for one schema."""
+
+    def __init__(self, schema, validation_rules, max_entries, allowlist_only,
+                 allowlist=PERSISTED_QUERIES):
+        self.schema = schema
+        self.validation_rules = validation_rules
+        self.max_entries = max_entries
+        self.allowlist_only = allowlist_only
+        # gql and most clients send the printed AST rather than the original
+        # text, so accept the hash of either form
+        self.allowlist = dict(allowlist)
+        for text in allowlist.values():
+            self.allowlist.setdefault(query_hash(print_ast(parse(text))), text)
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def resolve(self, query=None, sha256_hash=None):
+        """
+        Return ``(entry, errors)`` for the query text and/or its hash.
+        Raises GraphQLError for hash mismatches and unknown or disallowed
+        documents.
+        """
+        if query:
+            digest = query_hash(query)
+            if sha256_hash and sha256_hash != digest:
+                raise GraphQLError(
+                    "provided sha does not match query",
+                    extensions={"code": "PERSISTED_QUERY_HASH_MISMATCH"},
+                )
+        else:
+            digest = sha256_hash
+
+        if self.allowlist_only and digest not in self.allowlist:
+            raise GraphQLError(
+                "PersistedQueryNotAllowed",
+                extensions={"code": "PERSISTED_QUERY_NOT_ALLOWED"},
+            )
+
+        with self._lock:
+            entry = self._entries.get(digest)
+            if entry is not None:
+                self._entries.move_to_end(digest)
+                return entry, None
+
+        text = query or self.allowlist.get(digest)
+        if text is None:
+            raise GraphQLError(
+                "PersistedQueryNotFound",
+                extensions={"code": "PERSISTED_QUERY_NOT_FOUND"},
+            )
+
+        try:
+            document = parse(text)
+        except GraphQLError as e:
+            return None, [e]
+        errors = validate(
+            self.schema, document, self.validation_rules,
+            graphene_settings.MAX_VALIDATION_ERRORS,
+        )
+        if errors:
+            return None, errors
+
+        entry = DocumentEntry(document)
+        with self._lock:
+            self._entries[digest] = entry
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return entry, None
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+_registries = {}
+_registries_lock = threading.Lock()
+
+
+def get_document_registry(schema, validation_rules=None):
+    """Return the shared registry for a graphql-core schema and rule set."""
+    key = (id(schema), tuple(validation_rules or ()))
+    registry = _registries.get(key)
+    if registry is None:
+        config = {**DEFAULT_SETTINGS, **getattr(settings, "CRM_PERSISTED_QUERIES", {})}
+        with _registries_lock:
+            registry = _registries.setdefault(key, DocumentRegistry(
+                schema,
+                validation_rules,
+                config["MAX_ENTRIES"],
+                config["ALLOWLIST_ONLY"],
+            ))
+    return registry
+
+
+def reset_document_registries():
+    """Forget every registry so the next request rebuilds it from settings."""
+    _registries.clear()
+
+
+def get_persisted_query_hash(request, data):
+    """Read ``extensions.persistedQuery.sha256Hash`` from a GET or POST request."""
+    extensions = request.GET.get("extensions") or data.get("extensions")
+    if isinstance(extensions, str):
+        try:
+            extensions = json.loads(extensions)
+        except ValueError:
+            return None
+    if not isinstance(extensions, dict):
+        return None
+    persisted = extensions.get("persistedQuery") or {}
+    return persisted.get("sha256Hash")
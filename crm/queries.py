@@ -0,0 +1,83 @@
+"""
+crm/queries.py
+GraphQL documents sent by the CRM cron jobs and Celery tasks.
+
+They double as the persisted-query allowlist: the server knows these texts,
+so clients may send just their sha256 hash (see crm/persisted.py). Keep this
+module free of Django imports so the stand-alone cron scripts can load it.
+"""
+
+import hashlib
+
+HEARTBEAT = """
+query Heartbeat {
+    hello
+}
+"""
+
+UPDATE_LOW_STOCK = """
+mutation UpdateLowStock {
+    updateLowStockProducts {
+        success
+        message
+        updatedProducts {
+            id
+            name
+            price
+            stock
+        }
+    }
+}
+"""
+
+CRM_REPORT = """
+query CrmReport {
+    crmStats {
+        totalCustomers
+        totalOrders
+        totalRevenue
+    }
+}
+"""
+
+# One page of orders in the window that have not been reminded yet; the
+# page size is inlined so the cost limit does not price it at the maximum
+PENDING_REMINDERS = """
+query PendingReminders($since: Date) {
+    allOrders(orderDateGte: $since, reminderPending: true, first: 100) {
+        edges {
+            node {
+                id
+                orderDate
+                customer {
+                    email
+                }
+            }
+        }
+    }
+}
+"""
+
+MARK_REMINDERS_SENT = """
+mutation MarkRemindersSent($orderIds: [OrderID!]!) {
+    markOrderRemindersSent(orderIds: $orderIds) {
+        marked
+    }
+}
+"""
+
+DOCUMENTS = {
+    "Heartbeat": HEARTBEAT,
+    "UpdateLowStock": UPDATE_LOW_STOCK,
+    "CrmReport": CRM_REPORT,
+    "PendingReminders": PENDING_REMINDERS,
+    "MarkRemindersSent": MARK_REMINDERS_SENT,
+}
+
+
+def query_hash(query):
+    return hashlib.sha256(query.encode("utf-8")).hexdigest()
+
+
+# sha256 hash -> document text, for hash-only requests
+PERSISTED_QUERIES = {query_hash(query): query for query in DOCUMENTS.values()}
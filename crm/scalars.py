@@ -0,0 +1,91 @@
+"""
+crm/scalars.py
+Typed object ID scalars for mutation arguments and filters.
+
+Clients may send an object either as its Relay global ID
+(``base64("OrderType:42")``) or as the raw database id (``"42"`` or
+``42``). ``GlobalOrRawID`` accepts both and turns them into the integer
+primary key while GraphQL coerces the arguments, so resolvers and filters
+receive ints and never parse IDs themselves. A global ID of another node
+type (a product's ID passed as ``customerId``) is rejected before the
+resolver runs. Decoded strings are cached, so the same product IDs across
+many orders are only decoded once.
+
+The order inputs keep plain ``ID`` fields and call ``decode`` per order
+instead, so one bad ID in a bulk request fails only its own order.
+"""
+
+from functools import lru_cache
+
+import graphene
+from graphql import GraphQLError, IntValueNode, StringValueNode, Undefined
+from graphql_relay import from_global_id, to_global_id
+
+
+@lru_cache(maxsize=4096)
+def decode_id(value):
+    """
+    (node type, pk) for a global or raw ID string. The node type is None
+    for raw ids; pk is None when ``value`` is neither.
+    """
+    if value.isascii() and value.isdigit():
+        return None, int(value)
+    node_type, raw_id = from_global_id(value)
+    if node_type and raw_id.isascii() and raw_id.isdigit():
+        return node_type, int(raw_id)
+    return None, None
+
+
+class GlobalOrRawID(graphene.Scalar):
+    """
+    Base for the typed ID scalars below; ``node_type`` is the name of the
+    graphene type whose global IDs are accepted.
+    """
+
+    node_type = None
+
+    @classmethod
+    def decode(cls, value):
+        if isinstance(value, int) and not isinstance(value, bool):
+            return value
+        if isinstance(value, str):
+            node_type, pk = decode_id(value)
+            if pk is not None and node_type in (None, cls.node_type):
+                return pk
+            if node_type is not None:
+                raise GraphQLError(f"Expected a {cls.node_type} ID, got a {node_type} ID: {value}")
+        raise GraphQLError(f"Invalid {cls.node_type} ID: {value!r}")
+
+    @classmethod
+    def serialize(cls, value):
+        return to_global_id(cls.node_type, value)
+
+    @classmethod
+    def parse_value(cls, value):
+        return cls.decode(value)
+
+    @classmethod
+    def parse_literal(cls, node, _variables=None):
+        if isinstance(node, StringValueNode):
+            return cls.decode(node.value)
+        if isinstance(node, IntValueNode):
+            return cls.decode(int(node.value))
+        return Undefined
+
+
+class CustomerID(GlobalOrRawID):
+    """A customer's Relay global ID or database id."""
+
+    node_type = "CustomerType"
+
+
+class ProductID(GlobalOrRawID):
+    """A product's Relay global ID or database id."""
+
+    node_type = "ProductType"
+
+
+class OrderID(GlobalOrRawID):
+    """An order's Relay global ID or database id."""
+
+    node_type = "OrderType"
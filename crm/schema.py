@@ -1,20 +1,37 @@
 import re
 import graphene
+from collections import Counter
 from graphene_django import DjangoObjectType
 from .models import Customer, Product, Order
 from django.core.exceptions import ValidationError
-from django.db import transaction
+from django.db import connection, transaction
+from django.db.models import F
 from decimal import Decimal
 from datetime import datetime
 from django.utils import timezone
+from graphql import GraphQLError
 from .filters import CustomerFilter, ProductFilter, OrderFilter
-from graphene_django.filter import DjangoFilterConnectionField
+from .fields import BatchedFilterConnectionField, CountableConnection, alist
+from .cache import invalidate_response_cache
+from .catalog import ProductRecord, get_products, price_as_float
+from .customer_stats import record_orders
+from .loaders import get_loaders, running_async
+from .optimizer import optimize_queryset
+from .scalars import CustomerID, OrderID, ProductID
+from .stats import CrmStats
+from .validation import paginate_list
 from crm.models import Product
 
 class CustomerType(DjangoObjectType):
+    total_spent = graphene.Float()
+
     class Meta:
         model = Customer
         interfaces = (graphene.relay.Node,)  # Relay node for DjangoFilterConnectionField
+        connection_class = CountableConnection
+
+    def resolve_total_spent(self, info):
+        return float(self.total_spent)
 
 class ProductType(DjangoObjectType):
     price = graphene.Float() 
@@ -22,10 +39,24 @@ class ProductType(DjangoObjectType):
     class Meta:
         model = Product
         interfaces = (graphene.relay.Node,)
+        connection_class = CountableConnection
         fields = ("id", "name", "price", "stock")
-        
+
+    @classmethod
+    def is_type_of(cls, root, info):
+        # Order products may come from the in-memory catalog (crm/catalog.py)
+        return isinstance(root, ProductRecord) or super().is_type_of(root, info)
+
     def resolve_price(self, info):
-        return float(self.price)
+        return price_as_float(self)
+
+    def resolve_stock(self, info):
+        if not isinstance(self, ProductRecord):
+            return self.stock
+        loader = get_loaders(info.context).product_stock
+        if running_async():
+            return loader.aload(self.id)
+        return loader.load(self.id)
 
 class OrderType(DjangoObjectType):
     totalAmount = graphene.Float()
@@ -34,17 +65,54 @@ class OrderType(DjangoObjectType):
     
     class Meta:
         model = Order
-        # Remove relay interface to avoid connection issues
-        # interfaces = (graphene.relay.Node,)
-        
+        interfaces = (graphene.relay.Node,)
+        connection_class = CountableConnection
+
+    @classmethod
+    def prime_loaders(cls, orders, info):
+        # Queue the whole page so customer/products load in one query each
+        get_loaders(info.context).prime_orders(orders)
+
     def resolve_totalAmount(self, info):
         return float(self.total_amount)
         
     def resolve_orderDate(self, info):
         return self.order_date
-        
+
+    def resolve_customer(self, info):
+        if Order.customer.is_cached(self):
+            return self.customer
+        loader = get_loaders(info.context).customer
+        if running_async():
+            return loader.aload(self.customer_id)
+        return loader.load(self.customer_id)
+
     def resolve_products(self, info):
-        return self.products.all()
+        if "products" in getattr(self, "_prefetched_objects_cache", {}):
+            return self.products.all()
+        loader = get_loaders(info.context).order_products
+        if running_async():
+            return loader.aload(self.pk)
+        return loader.load(self.pk)
+
+
+class StatsGroupBy(graphene.Enum):
+    DAY = "day"
+    WEEK = "week"
+
+
+class CrmStatsBucketType(graphene.ObjectType):
+    period = graphene.DateTime()
+    orders = graphene.Int()
+    revenue = graphene.Float()
+    customers = graphene.Int()
+
+
+class CrmStatsType(graphene.ObjectType):
+    total_customers = graphene.Int()
+    total_orders = graphene.Int()
+    total_revenue = graphene.Float()
+    buckets = graphene.List(CrmStatsBucketType)
 
 
 # Define input types
@@ -64,11 +132,17 @@ class CreateProductInput(graphene.InputObjectType):
     stock = graphene.Int()
 
 class CreateOrderInput(graphene.InputObjectType):
+    # Global or raw IDs, decoded per order with CustomerID/ProductID.decode so
+    # a bad ID in a bulk request fails only its own order
     customerId = graphene.ID(required=True)
     productIds = graphene.List(graphene.ID, required=True)
     orderDate = graphene.DateTime()
 
 
+PHONE_RE = re.compile(r'^(\+\d{10,15}|\d{3}-\d{3}-\d{4})$')
+BULK_CREATE_BATCH_SIZE = 1000
+
+
 # CreateCustomer Mutation
 class CreateCustomer(graphene.Mutation):
     class Arguments:
@@ -81,7 +155,7 @@ class CreateCustomer(graphene.Mutation):
         if Customer.objects.filter(email=input.email).exists():
             raise ValidationError("Email already exists")
 
-        if input.phone and not re.match(r'^(\+\d{10,15}|\d{3}-\d{3}-\d{4})$', input.phone):
+        if input.phone and not PHONE_RE.match(input.phone):
             raise ValidationError("Invalid phone number format")
 
         customer = Customer.objects.create(
@@ -101,34 +175,52 @@ class BulkCreateCustomers(graphene.Mutation):
     errors = graphene.List(graphene.String)
 
     def mutate(self, info, input):
-        created_customers = []
-        errors = []
+        errors = {}
+        # One query for every email that is already taken
+        existing_emails = set(
+            Customer.objects
+            .filter(email__in={data.email for data in input})
+            .values_list("email", flat=True)
+        )
 
-        # Process each customer individually to support partial success
+        # Validate in memory; each row keeps its position for error reporting
+        pending = []
         for i, data in enumerate(input):
-            try:
-                # Check for duplicate email
-                if Customer.objects.filter(email=data.email).exists():
-                    errors.append(f"Customer {i+1}: Email already exists: {data.email}")
-                    continue
-
-                # Validate phone format
-                if data.phone and not re.match(r'^(\+\d{10,15}|\d{3}-\d{3}-\d{4})$', data.phone):
-                    errors.append(f"Customer {i+1}: Invalid phone format: {data.phone}")
-                    continue
-
-                # Create customer
-                customer = Customer.objects.create(
-                    name=data.name,
-                    email=data.email,
-                    phone=data.phone
-                )
-                created_customers.append(customer)
+            if data.email in existing_emails:
+                errors[i] = f"Customer {i+1}: Email already exists: {data.email}"
+                continue
+            if data.phone and not PHONE_RE.match(data.phone):
+                errors[i] = f"Customer {i+1}: Invalid phone format: {data.phone}"
+                continue
+            # Later rows with the same email are duplicates within the batch
+            existing_emails.add(data.email)
+            pending.append((i, Customer(name=data.name, email=data.email, phone=data.phone)))
 
-            except Exception as e:
-                errors.append(f"Customer {i+1}: {str(e)}")
-
-        return BulkCreateCustomers(customers=created_customers, errors=errors)
+        created_customers = []
+        for start in range(0, len(pending), BULK_CREATE_BATCH_SIZE):
+            chunk = pending[start:start + BULK_CREATE_BATCH_SIZE]
+            try:
+                with transaction.atomic():
+                    Customer.objects.bulk_create([customer for _, customer in chunk])
+                created_customers.extend(customer for _, customer in chunk)
+            except Exception:
+                # Fall back to row by row so one bad row doesn't sink the chunk
+                for i, customer in chunk:
+                    try:
+                        with transaction.atomic():
+                            customer.save()
+                        created_customers.append(customer)
+                    except Exception as e:
+                        errors[i] = f"Customer {i+1}: {str(e)}"
+
+        if created_customers:
+            # bulk_create sends no post_save signals
+            invalidate_response_cache()
+
+        return BulkCreateCustomers(
+            customers=created_customers,
+            errors=[errors[i] for i in sorted(errors)]
+        )
 
 
 # CreateProduct Mutation
@@ -152,24 +244,36 @@ class CreateProduct(graphene.Mutation):
         return CreateProduct(product=product)
     
 
-#update low stoc products (stock < 10)
+#update low stock products (stock <= threshold) in one UPDATE
 class UpdateLowStockProducts(graphene.Mutation):
     class Arguments:
-        pass
+        threshold = graphene.Int(default_value=10)
+        increment = graphene.Int(default_value=10)
 
     success = graphene.Boolean()
     message = graphene.String()
     updated_products = graphene.List(ProductType)
 
     @classmethod
-    def mutate(cls, root, info):
-        low_stock_products = Product.objects.filter(stock_lte=10)
-
-        updated_products = []
-        for product in low_stock_products:
-            product.stock +=10
-            product.save()
-            updated_products.append(product)
+    def mutate(cls, root, info, threshold=10, increment=10):
+        if threshold < 0:
+            raise ValidationError("Threshold cannot be negative")
+        if increment <= 0:
+            raise ValidationError("Increment must be positive")
+
+        with transaction.atomic():
+            low_stock_products = Product.objects.filter(stock__lte=threshold)
+            if connection.features.has_select_for_update:
+                # Lock the rows so concurrent orders wait instead of racing
+                low_stock_products = low_stock_products.select_for_update()
+            product_ids = list(low_stock_products.values_list("id", flat=True))
+
+            if product_ids:
+                Product.objects.filter(id__in=product_ids).update(stock=F("stock") + increment)
+                invalidate_response_cache()
+                updated_products = list(Product.objects.filter(id__in=product_ids).order_by("id"))
+            else:
+                updated_products = []
 
         success = True
 
@@ -184,6 +288,80 @@ class UpdateLowStockProducts(graphene.Mutation):
             updated_products=updated_products
         )
 
+
+def locked_products(product_ids):
+    """
+    The products in id order, locked until the transaction ends where the
+    database supports it. A fixed lock order keeps orders sharing products
+    from deadlocking; SQLite serialises writers instead.
+    """
+    products = Product.objects.filter(id__in=product_ids).order_by("id")
+    if connection.features.has_select_for_update:
+        products = products.select_for_update()
+    return products
+
+
+def reserve_stock(product_ids):
+    """
+    Take one unit of stock from each product. The rows are first locked in
+    id order (locked_products), so orders sharing products queue up instead of
+    deadlocking, then one conditional UPDATE takes the stock only where
+    some is left, so concurrent orders never oversell. Must run inside
+    transaction.atomic(): the locks are held, and a short reservation
+    rolled back, when it ends.
+    """
+    product_ids = sorted(set(product_ids))
+    if connection.features.has_select_for_update:
+        list(locked_products(product_ids).values_list("id", flat=True))
+    reserved = (
+        Product.objects
+        .filter(id__in=product_ids, stock__gte=1)
+        .update(stock=F("stock") - 1)
+    )
+    if reserved != len(product_ids):
+        raise ValidationError("Some products are out of stock")
+
+
+RESERVE_ATTEMPTS = 3
+
+
+def reserve_bulk_stock(orders_product_ids):
+    """
+    Take one unit of each product for every order (a list of product id
+    lists) that the stock allows, first come first served. The products
+    are read and locked in id order, orders are allocated against that
+    read, then each product's total is taken with a conditional UPDATE, in
+    id order too, so the statements do not grow with the batch and batches
+    sharing products cannot deadlock. Where the database does not lock on
+    read (SQLite) another order may take stock in between; the UPDATEs are
+    then rolled back to a savepoint and the allocation is redone. Returns
+    the indexes of the orders that could not be reserved. Must run inside
+    transaction.atomic(), which holds the locks until it ends.
+    """
+    all_ids = {pid for product_ids in orders_product_ids for pid in product_ids}
+    for _ in range(RESERVE_ATTEMPTS):
+        left = dict(locked_products(all_ids).values_list("id", "stock"))
+        quantities = Counter()
+        rejected = set()
+        for index, product_ids in enumerate(orders_product_ids):
+            if all(left.get(pid, 0) >= 1 for pid in product_ids):
+                for pid in product_ids:
+                    left[pid] -= 1
+                    quantities[pid] += 1
+            else:
+                rejected.add(index)
+
+        savepoint = transaction.savepoint()
+        for pid, quantity in sorted(quantities.items()):
+            if not Product.objects.filter(id=pid, stock__gte=quantity).update(stock=F("stock") - quantity):
+                transaction.savepoint_rollback(savepoint)
+                break
+        else:
+            transaction.savepoint_commit(savepoint)
+            return rejected
+    raise ValidationError("Stock changed while reserving; please retry")
+
+
 # CreateOrder Mutation
 class CreateOrder(graphene.Mutation):
     class Arguments:
@@ -192,76 +370,205 @@ class CreateOrder(graphene.Mutation):
     order = graphene.Field(OrderType)
 
     def mutate(self, info, input):
-        # Helper function to extract database ID from Node ID
-        def get_database_id(node_id):
-            try:
-                # Try to decode as Node ID first
-                from graphql_relay import from_global_id
-                _, db_id = from_global_id(node_id)
-                return int(db_id)
-            except:
-                # If that fails, assume it's already a database ID
-                try:
-                    return int(node_id)
-                except ValueError:
-                    raise ValidationError(f"Invalid ID format: {node_id}")
-        
         # Validate customer ID
         try:
-            customer_db_id = get_database_id(input.customerId)
-            customer = Customer.objects.get(id=customer_db_id)
+            customer = Customer.objects.get(id=CustomerID.decode(input.customerId))
         except Customer.DoesNotExist:
             raise ValidationError("Invalid customer ID")
-        except Exception as e:
-            raise ValidationError(f"Invalid customer ID format: {str(e)}")
+        except GraphQLError as e:
+            raise ValidationError(f"Invalid customer ID format: {e.message}")
 
         # Validate product IDs
         if not input.productIds:
             raise ValidationError("At least one product must be selected")
-        
         try:
-            product_db_ids = [get_database_id(pid) for pid in input.productIds]
-        except Exception as e:
-            raise ValidationError(f"Invalid product ID format: {str(e)}")
-            
-        products = Product.objects.filter(id__in=product_db_ids)
-        if not products.exists():
+            product_db_ids = [ProductID.decode(pid) for pid in input.productIds]
+        except GraphQLError as e:
+            raise ValidationError(f"Invalid product ID format: {e.message}")
+
+        # Prices come from the in-memory catalog; stock is checked by reserve_stock
+        products = list(get_products(product_db_ids).values())
+        if not products:
             raise ValidationError("No valid products found")
-        if products.count() != len(input.productIds):
+        if len(products) != len(input.productIds):
             raise ValidationError("Some product IDs are invalid")
 
         # Calculate total amount accurately
         total_amount = sum(p.price for p in products)
 
-        # Create order with proper datetime handling
-        order = Order.objects.create(
-            customer=customer,
-            total_amount=total_amount,
-            order_date=input.orderDate or timezone.now()
-        )
-        order.products.set(products)
+        with transaction.atomic():
+            reserve_stock(product_db_ids)
+
+            # Create order with proper datetime handling
+            order = Order.objects.create(
+                customer=customer,
+                total_amount=total_amount,
+                order_date=input.orderDate or timezone.now()
+            )
+            order.products.add(*[p.pk for p in products])
+            record_orders([order])
 
         return CreateOrder(order=order)
 
 
-# Query
-class Query(graphene.ObjectType):
-    all_customers = DjangoFilterConnectionField(CustomerType, filterset_class=CustomerFilter)
-    all_products = DjangoFilterConnectionField(ProductType, filterset_class=ProductFilter)
-    all_orders = DjangoFilterConnectionField(OrderType, filterset_class=OrderFilter)
+# BulkCreateOrders Mutation
+class BulkCreateOrders(graphene.Mutation):
+    class Arguments:
+        input = graphene.List(graphene.NonNull(CreateOrderInput), required=True)
 
-    customers = graphene.List(CustomerType)
-    products = graphene.List(ProductType)
     orders = graphene.List(OrderType)
+    errors = graphene.List(graphene.String)
 
-    def resolve_customers(self, info):
-        return Customer.objects.all()
+    def mutate(self, info, input):
+        errors = {}
 
-    def resolve_products(self, info):
-        return Product.objects.all()
+        # Decode every ID up front so customers and products load in one query each
+        decoded = []
+        for i, data in enumerate(input):
+            try:
+                customer_id = CustomerID.decode(data.customerId)
+            except GraphQLError as e:
+                errors[i] = f"Order {i+1}: Invalid customer ID format: {e.message}"
+                continue
+            if not data.productIds:
+                errors[i] = f"Order {i+1}: At least one product must be selected"
+                continue
+            try:
+                product_ids = list(dict.fromkeys(ProductID.decode(pid) for pid in data.productIds))
+            except GraphQLError as e:
+                errors[i] = f"Order {i+1}: Invalid product ID format: {e.message}"
+                continue
+            decoded.append((i, data, customer_id, product_ids))
+
+        customers = Customer.objects.in_bulk({customer_id for _, _, customer_id, _ in decoded})
+        products = get_products({pid for _, _, _, product_ids in decoded for pid in product_ids})
+
+        # Validate and total every order in memory
+        pending = []
+        for i, data, customer_id, product_ids in decoded:
+            customer = customers.get(customer_id)
+            if customer is None:
+                errors[i] = f"Order {i+1}: Invalid customer ID"
+                continue
+            order_products = [products[pid] for pid in product_ids if pid in products]
+            if len(order_products) != len(product_ids):
+                errors[i] = f"Order {i+1}: Some product IDs are invalid"
+                continue
+            order = Order(
+                customer=customer,
+                total_amount=sum(p.price for p in order_products),
+                order_date=data.orderDate or timezone.now()
+            )
+            pending.append((i, order, order_products))
+
+        OrderProduct = Order.products.through
+        with transaction.atomic():
+            out_of_stock = reserve_bulk_stock([[p.pk for p in products] for _, _, products in pending])
+            for index in sorted(out_of_stock):
+                i = pending[index][0]
+                errors[i] = f"Order {i+1}: Some products are out of stock"
+            pending = [
+                (order, order_products)
+                for index, (_, order, order_products) in enumerate(pending)
+                if index not in out_of_stock
+            ]
+            for start in range(0, len(pending), BULK_CREATE_BATCH_SIZE):
+                chunk = pending[start:start + BULK_CREATE_BATCH_SIZE]
+                Order.objects.bulk_create([order for order, _ in chunk])
+                OrderProduct.objects.bulk_create([
+                    OrderProduct(order_id=order.pk, product_id=product.pk)
+                    for order, order_products in chunk
+                    for product in order_products
+                ], batch_size=BULK_CREATE_BATCH_SIZE)
+            if pending:
+                record_orders([order for order, _ in pending])
+                invalidate_response_cache()
+
+        # Everything needed to resolve the payload is already in memory
+        loaders = get_loaders(info.context)
+        for order, order_products in pending:
+            loaders.prime_order_products(order.pk, order_products)
+
+        return BulkCreateOrders(
+            orders=[order for order, _ in pending],
+            errors=[errors[i] for i in sorted(errors)]
+        )
+
+
+# MarkOrderRemindersSent Mutation
+class MarkOrderRemindersSent(graphene.Mutation):
+    class Arguments:
+        order_ids = graphene.List(graphene.NonNull(OrderID), required=True)
+
+    marked = graphene.Int()
+
+    def mutate(self, info, order_ids):
+        # Orders marked before keep their first timestamp, so a replayed call is harmless
+        marked = (
+            Order.objects
+            .filter(id__in=order_ids, reminder_sent_at__isnull=True)
+            .update(reminder_sent_at=timezone.now())
+        )
+        if marked:
+            invalidate_response_cache()
+        return MarkOrderRemindersSent(marked=marked)
 
-    def resolve_orders(self, info):
-        return Order.objects.all()
+
+# Query
+class Query(graphene.ObjectType):
+    # keyset_ordering enables the opt-in `keyset: true` cursor mode
+    all_customers = BatchedFilterConnectionField(
+        CustomerType, filterset_class=CustomerFilter, keyset_ordering=("id",)
+    )
+    all_products = BatchedFilterConnectionField(
+        ProductType, filterset_class=ProductFilter, keyset_ordering=("id",)
+    )
+    all_orders = BatchedFilterConnectionField(
+        OrderType, filterset_class=OrderFilter, keyset_ordering=("-order_date", "-id")
+    )
+
+    # Plain lists are capped at CRM_QUERY_LIMITS' page size (crm/validation.py)
+    customers = graphene.List(CustomerType, limit=graphene.Int(), offset=graphene.Int())
+    products = graphene.List(ProductType, limit=graphene.Int(), offset=graphene.Int())
+    orders = graphene.List(OrderType, limit=graphene.Int(), offset=graphene.Int())
+
+    crm_stats = graphene.Field(
+        CrmStatsType,
+        order_date_gte=graphene.DateTime(),
+        order_date_lte=graphene.DateTime(),
+        group_by=StatsGroupBy(),
+    )
+
+    def resolve_crm_stats(self, info, order_date_gte=None, order_date_lte=None, group_by=None):
+        stats = CrmStats(
+            order_date_gte=order_date_gte,
+            order_date_lte=order_date_lte,
+            group_by=group_by.value if group_by is not None else None,
+        )
+        if running_async():
+            return stats.aload()
+        return stats
+
+    # Under the async view the lists are read with the async ORM
+    def resolve_customers(self, info, limit=None, offset=None):
+        customers = paginate_list(optimize_queryset(Customer.objects.all(), info), limit, offset)
+        if running_async():
+            return alist(customers)
+        return customers
+
+    def resolve_products(self, info, limit=None, offset=None):
+        products = paginate_list(optimize_queryset(Product.objects.all(), info), limit, offset)
+        if running_async():
+            return alist(products)
+        return products
+
+    def resolve_orders(self, info, limit=None, offset=None):
+        orders = paginate_list(optimize_queryset(Order.objects.all(), info), limit, offset)
+        if running_async():
+            return alist(orders, lambda rows: OrderType.prime_loaders(rows, info))
+        orders = list(orders)
+        OrderType.prime_loaders(orders, info)
+        return orders
 
 # Mutation
 class Mutation(graphene.ObjectType):
@@ -269,12 +576,16 @@ class Mutation(graphene.ObjectType):
     bulk_create_customers = BulkCreateCustomers.Field() 
     create_product = CreateProduct.Field()
     create_order = CreateOrder.Field()
+    bulk_create_orders = BulkCreateOrders.Field()
     update_low_stock_products = UpdateLowStockProducts.Field()
+    mark_order_reminders_sent = MarkOrderRemindersSent.Field()
     
     # Also provide camelCase aliases for GraphQL compatibility
     createCustomer = CreateCustomer.Field()
     bulkCreateCustomers = BulkCreateCustomers.Field()
     createProduct = CreateProduct.Field()
     createOrder = CreateOrder.Field()
+    bulkCreateOrders = BulkCreateOrders.Field()
     updateLowStockProducts = UpdateLowStockProducts.Field()
+    markOrderRemindersSent = MarkOrderRemindersSent.Field()
 
@@ -0,0 +1,43 @@
+"""
+crm/signals.py
+Drops cached GraphQL responses whenever CRM data changes, refreshes changed
+products in the product catalog, keeps the customer order statistics right
+when orders are deleted, and adds the SQL recorder of
+crm/instrumentation.py to new database connections.
+"""
+
+from django.db.backends.signals import connection_created
+from django.db.models import QuerySet
+from django.db.models.signals import m2m_changed, post_delete, post_save
+
+from .cache import invalidate_response_cache
+from .catalog import product_changed
+from .customer_stats import refresh_customer_stats
+from .instrumentation import install_sql_recorder
+from .models import Customer, Product, Order
+
+for model in (Customer, Product, Order):
+    post_save.connect(invalidate_response_cache, sender=model,
+                      dispatch_uid=f"crm_cache_save_{model.__name__}")
+    post_delete.connect(invalidate_response_cache, sender=model,
+                        dispatch_uid=f"crm_cache_delete_{model.__name__}")
+
+m2m_changed.connect(invalidate_response_cache, sender=Order.products.through,
+                    dispatch_uid="crm_cache_order_products")
+
+post_save.connect(product_changed, sender=Product, dispatch_uid="crm_catalog_save")
+post_delete.connect(product_changed, sender=Product, dispatch_uid="crm_catalog_delete")
+
+
+def refresh_stats_after_order_delete(sender, instance, origin=None, **kwargs):
+    # Orders removed with their customer leave no statistics to refresh
+    if isinstance(origin, Customer) or (isinstance(origin, QuerySet) and origin.model is Customer):
+        return
+    # The last order date may move back, so recompute rather than subtract
+    refresh_customer_stats([instance.customer_id])
+
+
+post_delete.connect(refresh_stats_after_order_delete, sender=Order,
+                    dispatch_uid="crm_customer_stats_order_delete")
+
+connection_created.connect(install_sql_recorder, dispatch_uid="crm_sql_recorder")
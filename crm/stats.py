@@ -0,0 +1,115 @@
+"""
+crm/stats.py
+Aggregate CRM figures computed in the database.
+"""
+
+from django.db.models import Count, Q, Sum
+from django.utils.functional import cached_property
+from django.db.models.functions import TruncDay, TruncWeek
+
+from .models import Customer, Order
+
+TRUNCATE_BY = {
+    "day": TruncDay,
+    "week": TruncWeek,
+}
+
+
+def order_date_filter(prefix="", order_date_gte=None, order_date_lte=None):
+    condition = Q()
+    if order_date_gte is not None:
+        condition &= Q(**{f"{prefix}order_date__gte": order_date_gte})
+    if order_date_lte is not None:
+        condition &= Q(**{f"{prefix}order_date__lte": order_date_lte})
+    return condition
+
+
+def totals_aggregates(order_date_gte=None, order_date_lte=None):
+    in_range = order_date_filter("order__", order_date_gte, order_date_lte)
+    return {
+        "total_customers": Count("id", distinct=True),
+        "total_orders": Count("order", filter=in_range),
+        "total_revenue": Sum("order__total_amount", filter=in_range),
+    }
+
+
+def crm_totals(order_date_gte=None, order_date_lte=None):
+    """
+    Customer count plus order count and revenue in the date range, as one
+    aggregate over customers LEFT JOIN orders.
+    """
+    totals = Customer.objects.aggregate(**totals_aggregates(order_date_gte, order_date_lte))
+    totals["total_revenue"] = float(totals["total_revenue"] or 0)
+    return totals
+
+
+async def acrm_totals(order_date_gte=None, order_date_lte=None):
+    totals = await Customer.objects.aaggregate(**totals_aggregates(order_date_gte, order_date_lte))
+    totals["total_revenue"] = float(totals["total_revenue"] or 0)
+    return totals
+
+
+def buckets_queryset(group_by, order_date_gte=None, order_date_lte=None):
+    return (
+        Order.objects
+        .filter(order_date_filter("", order_date_gte, order_date_lte))
+        .annotate(period=TRUNCATE_BY[group_by]("order_date"))
+        .values("period")
+        .annotate(
+            orders=Count("id"),
+            revenue=Sum("total_amount"),
+            customers=Count("customer", distinct=True),
+        )
+        .order_by("period")
+    )
+
+
+def crm_buckets(group_by, order_date_gte=None, order_date_lte=None):
+    """Order count, revenue and distinct customers per day or week."""
+    rows = buckets_queryset(group_by, order_date_gte, order_date_lte)
+    return [dict(row, revenue=float(row["revenue"] or 0)) for row in rows]
+
+
+async def acrm_buckets(group_by, order_date_gte=None, order_date_lte=None):
+    rows = buckets_queryset(group_by, order_date_gte, order_date_lte)
+    return [dict(row, revenue=float(row["revenue"] or 0)) async for row in rows]
+
+
+class CrmStats:
+    """
+    Root value for the crmStats query. The totals share one aggregate query
+    and the buckets only run when they are selected.
+    """
+
+    def __init__(self, order_date_gte=None, order_date_lte=None, group_by=None):
+        self.date_range = {"order_date_gte": order_date_gte, "order_date_lte": order_date_lte}
+        self.group_by = group_by
+
+    @cached_property
+    def totals(self):
+        return crm_totals(**self.date_range)
+
+    @property
+    def total_customers(self):
+        return self.totals["total_customers"]
+
+    @property
+    def total_orders(self):
+        return self.totals["total_orders"]
+
+    @property
+    def total_revenue(self):
+        return self.totals["total_revenue"]
+
+    @cached_property
+    def buckets(self):
+        if self.group_by is None:
+            return []
+        return crm_buckets(self.group_by, **self.date_range)
+
+    async def aload(self):
+        """Fill in the totals and buckets with the async ORM and return self."""
+        self.totals = await acrm_totals(**self.date_range)
+        if self.group_by is not None:
+            self.buckets = await acrm_buckets(self.group_by, **self.date_range)
+        return self
@@ -2,61 +2,177 @@
 """
 crm/tasks.py
 Defines cron job helpers for the CRM app.
+
+The ``*_parallel`` tasks split the customer or order id space into ranges
+and process them as a chord: one task per range runs on whichever worker is
+free, and a callback merges their results once all of them are done.
 """
 
-from datetime import datetime
-from gql import gql, Client
-from gql.transport.requests import RequestsHTTPTransport
-from celery import shared_task
-import requests
+import logging
+from datetime import datetime, time, timedelta
+from datetime import timezone as dt_timezone
+from decimal import Decimal
+
+from celery import chord, shared_task
+from django.db.models import Max, Min
+from django.utils import timezone
+from graphql_relay import to_global_id
+
+from crm.cache import invalidate_response_cache
+from crm.executor import execute
+from crm.joblog import get_job_log
+from crm.models import Customer, Order
+from crm.queries import CRM_REPORT
+from crm.stats import totals_aggregates
+
+logger = logging.getLogger(__name__)
 
 LOG_FILE = "/tmp/crm_report_log.txt"
-GRAPHQL_ENDPOINT = "http://localhost:8000/graphql"
+REMINDERS_LOG_FILE = "/tmp/order_reminders_log.txt"
+
+# Ids per range task; large enough that a task outweighs its messaging
+DEFAULT_CHUNK_SIZE = 5000
+
+
+def log_report(total_customers, total_orders, total_amount):
+    log = get_job_log(LOG_FILE)
+    log.write(
+        "crm_report",
+        f"Report: {total_customers} customers, {total_orders} orders, {total_amount} revenue",
+        customers=total_customers,
+        orders=total_orders,
+        revenue=total_amount,
+    )
+    log.flush()
 
 
 @shared_task
 def generate_crm_report():
     try:
-        transport = RequestsHTTPTransport(
-            url=GRAPHQL_ENDPOINT,
-            verify=True,
-            retries=3,
-        )
+        # Totals are aggregated by the database in a single query
+        result = execute(CRM_REPORT)
 
-        client = Client(transport=transport, fetch_schema_from_transport=False)
-
-        query = gql(
-            """
-            query {
-                allCustomers {
-                    id
-                }
-                allOrders {
-                    id
-                    totalAmount
-                }
-            }
-            """
-        )
-        result = client.execute(query)
-        
-        total_customers = len(result["allCustomers"])
-        total_orders = len(result["allOrders"])
-        total_amount = sum(float(order["totalAmount"]) for order in result["allOrders"])
-
-        timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        message = (
-            f"{timestamp} - Report: "
-            f"{total_customers} customers, "
-            f"{total_orders} orders, "
-            f"{total_amount} revenue"
+        stats = result["crmStats"]
+        log_report(stats["totalCustomers"], stats["totalOrders"], stats["totalRevenue"])
+
+    except Exception as e:
+        log = get_job_log(LOG_FILE)
+        log.error("crm_report", f"Error generating CRM report: {e}")
+        log.flush()
+
+
+def id_ranges(queryset, chunk_size=DEFAULT_CHUNK_SIZE):
+    """
+    Split the primary keys of ``queryset`` into [low, high) ranges of at
+    most ``chunk_size`` ids, from one MIN/MAX query.
+    """
+    bounds = queryset.aggregate(low=Min("pk"), high=Max("pk"))
+    if bounds["low"] is None:
+        return []
+    end = bounds["high"] + 1
+    return [(low, min(low + chunk_size, end)) for low in range(bounds["low"], end, chunk_size)]
+
+
+def fan_out(ranges, task, callback, *args):
+    """Run ``task(low, high, *args)`` for every range in a chord ending in ``callback``."""
+    if not ranges:
+        return callback.delay([])
+    return chord(task.s(low, high, *args) for low, high in ranges)(callback.s())
+
+
+@shared_task
+def crm_report_range(low, high):
+    """Report totals for the customers with ids in [low, high)."""
+    totals = Customer.objects.filter(pk__gte=low, pk__lt=high).aggregate(**totals_aggregates())
+    return {
+        "customers": totals["total_customers"],
+        "orders": totals["total_orders"],
+        # Summed exactly in the callback; JSON has no decimal type
+        "revenue": str(totals["total_revenue"] or 0),
+    }
+
+
+@shared_task
+def merge_crm_report(partials):
+    """Chord callback: add up the range totals and log the report."""
+    customers = sum(partial["customers"] for partial in partials)
+    orders = sum(partial["orders"] for partial in partials)
+    revenue = sum((Decimal(partial["revenue"]) for partial in partials), Decimal(0))
+    # SQLite sums decimals as floats; keep cents so the split does not show
+    revenue = float(round(revenue, 2))
+    log_report(customers, orders, revenue)
+    return {"customers": customers, "orders": orders, "revenue": revenue}
+
+
+def fan_out_crm_report(chunk_size=DEFAULT_CHUNK_SIZE):
+    """Start the range-partitioned report; returns the callback's AsyncResult."""
+    ranges = id_ranges(Customer.objects.all(), chunk_size)
+    return fan_out(ranges, crm_report_range, merge_crm_report)
+
+
+@shared_task
+def generate_crm_report_parallel(chunk_size=DEFAULT_CHUNK_SIZE):
+    """generate_crm_report, with the customers split across workers."""
+    fan_out_crm_report(chunk_size)
+
+
+def pending_reminders(since):
+    return Order.objects.filter(order_date__gte=since, reminder_sent_at__isnull=True)
+
+
+@shared_task
+def send_order_reminders_range(low, high, since):
+    """
+    Log and mark the unreminded orders with ids in [low, high) placed since
+    ``since`` (an ISO timestamp). Returns how many were marked.
+    """
+    pending = pending_reminders(datetime.fromisoformat(since)).filter(pk__gte=low, pk__lt=high)
+    orders = list(pending.values_list("pk", "customer__email"))
+    if not orders:
+        return 0
+
+    log = get_job_log(REMINDERS_LOG_FILE)
+    for pk, email in orders:
+        order_id = to_global_id("OrderType", pk)
+        log.write(
+            "order_reminders",
+            f"Order ID: {order_id}, Customer Email: {email}",
+            order_id=order_id,
+            email=email,
         )
+    log.flush()
 
-        with open(LOG_FILE, "a") as f:
-            f.write(message + "\n")
+    # Log before marking, as send_order_reminders.py does
+    marked = (
+        pending
+        .filter(pk__in=[pk for pk, _ in orders])
+        .update(reminder_sent_at=timezone.now())
+    )
+    if marked:
+        invalidate_response_cache()
+    return marked
 
-    except Exception as e:
-        timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        error_msg = f"{timestamp} - Error generating CRM report: {e}"
-        with open(LOG_FILE, "a") as f:
-            f.write(error_msg + "\n")
+
+@shared_task
+def merge_order_reminders(counts):
+    """Chord callback: the number of orders reminded across every range."""
+    total = sum(counts)
+    logger.info("Sent %d order reminders in %d ranges", total, len(counts))
+    return total
+
+
+def fan_out_order_reminders(chunk_size=DEFAULT_CHUNK_SIZE, days=7):
+    """
+    Start the range-partitioned order reminders for the last ``days`` days;
+    returns the callback's AsyncResult.
+    """
+    start = (timezone.now() - timedelta(days=days)).date()
+    since = datetime.combine(start, time.min, tzinfo=dt_timezone.utc)
+    ranges = id_ranges(pending_reminders(since), chunk_size)
+    return fan_out(ranges, send_order_reminders_range, merge_order_reminders, since.isoformat())
+
+
+@shared_task
+def send_order_reminders_parallel(chunk_size=DEFAULT_CHUNK_SIZE, days=7):
+    """crm/cron_jobs/send_order_reminders.py, with the orders split across workers."""
+    fan_out_order_reminders(chunk_size, days)
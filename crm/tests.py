@@ -1,3 +1,1368 @@
-from django.test import TestCase
+import asyncio
+import contextlib
+import gzip
+import io
+import json
+import os
+import tempfile
+import threading
+from unittest import mock
+from datetime import timedelta
+from decimal import Decimal
+from types import SimpleNamespace
 
-# Create your tests here.
+from django.conf import settings
+from django.db import connection, transaction
+from django.http import Http404
+from django.test import (
+    AsyncRequestFactory, RequestFactory, SimpleTestCase, TestCase, TransactionTestCase, override_settings,
+)
+from asgiref.sync import async_to_sync, sync_to_async
+from django.core.management import call_command
+from django.core.exceptions import ImproperlyConfigured
+from django.core.management.base import CommandError
+from django.test.utils import CaptureQueriesContext
+from graphql import parse, print_ast
+from graphql_relay import from_global_id, to_global_id
+
+from alx_backend_graphql.schema import schema
+from . import cron, executor, tasks
+from .customer_stats import check_customer_stats
+from .joblog import JobLog
+from .instrumentation import current_path, instrument, registry
+from .loaders import BatchLoader, Loaders
+from .cache import get_response_cache, reset_response_cache
+from .catalog import ProductCatalog, ProductRecord, get_product_catalog, reset_product_catalog
+from .persisted import reset_document_registries
+from .graphql_client import GraphQLClient, get_client, reset_clients
+from .queries import CRM_REPORT, HEARTBEAT, UPDATE_LOW_STOCK, query_hash
+from .models import Customer, Product, Order
+from .views import AsyncCRMGraphQLView, CRMGraphQLView, ExportView, metrics_view
+
+
+def seed_orders(count, products_per_order=2, start=0):
+    products = [
+        Product.objects.create(name=f"Product {i}", price=Decimal("10.00"), stock=50)
+        for i in range(products_per_order + 1)
+    ]
+    for i in range(start, start + count):
+        customer = Customer.objects.create(name=f"Customer {i}", email=f"c{i}@example.com")
+        order = Order.objects.create(customer=customer, total_amount=Decimal("20.00"))
+        order.products.set(products[i % 2:i % 2 + products_per_order])
+
+
+def run_query(query, variables=None):
+    result = schema.execute(query, variable_values=variables, context_value=SimpleNamespace())
+    assert result.errors is None, result.errors
+    return result.data
+
+
+class OrderBatchLoadingTests(TestCase):
+    ALL_ORDERS = """
+        query ($first: Int) {
+          allOrders(first: $first) {
+            edges { node { id customer { email } products { name } } }
+          }
+        }
+    """
+    ORDERS = "{ orders { id customer { email } products { name } } }"
+
+    def count_queries(self, query, variables=None):
+        with CaptureQueriesContext(connection) as ctx:
+            data = run_query(query, variables)
+        return len(ctx.captured_queries), data
+
+    def test_all_orders_query_count_is_independent_of_page_size(self):
+        seed_orders(12)
+        # Fill the product catalog first so both runs read it from memory
+        run_query(self.ALL_ORDERS, {"first": 12})
+        small, data = self.count_queries(self.ALL_ORDERS, {"first": 2})
+        self.assertEqual(len(data["allOrders"]["edges"]), 2)
+        large, data = self.count_queries(self.ALL_ORDERS, {"first": 12})
+        self.assertEqual(len(data["allOrders"]["edges"]), 12)
+        self.assertEqual(small, large)
+
+    def test_orders_list_loads_related_rows_in_batches(self):
+        seed_orders(3)
+        few, _ = self.count_queries(self.ORDERS)
+        seed_orders(9, start=3)
+        many, data = self.count_queries(self.ORDERS)
+        self.assertEqual(few, many)
+        self.assertEqual(len(data["orders"]), 12)
+        first = data["orders"][0]
+        self.assertEqual(first["customer"]["email"], "c0@example.com")
+        self.assertEqual([p["name"] for p in first["products"]], ["Product 0", "Product 1"])
+
+
+class QueryOptimizerTests(TestCase):
+    def test_all_orders_customer_email_uses_one_joined_select(self):
+        seed_orders(5)
+        query = "{ allOrders { edges { node { customer { email } } } } }"
+        with CaptureQueriesContext(connection) as ctx:
+            data = run_query(query)
+        self.assertEqual(len(data["allOrders"]["edges"]), 5)
+        # COUNT(*) for the connection plus one joined SELECT
+        self.assertEqual(len(ctx.captured_queries), 2)
+        select_sql = ctx.captured_queries[1]["sql"]
+        self.assertIn('"crm_customer"."email"', select_sql)
+        self.assertNotIn('"crm_customer"."name"', select_sql)
+        self.assertNotIn('"crm_order"."total_amount"', select_sql)
+
+    @override_settings(CRM_PRODUCT_CATALOG=None)
+    def test_nested_products_are_prefetched_with_pruned_columns(self):
+        seed_orders(4)
+        query = "{ orders { totalAmount products { name } } }"
+        with CaptureQueriesContext(connection) as ctx:
+            data = run_query(query)
+        self.assertEqual(len(ctx.captured_queries), 2)
+        self.assertEqual(len(data["orders"][0]["products"]), 2)
+        self.assertNotIn('"crm_product"."price"', ctx.captured_queries[1]["sql"])
+
+
+class BulkCreateCustomersTests(TestCase):
+    MUTATION = """
+        mutation ($input: [CustomerInput!]!) {
+          bulkCreateCustomers(input: $input) { customers { email } errors }
+        }
+    """
+
+    def test_reports_errors_per_row_and_creates_the_rest(self):
+        Customer.objects.create(name="Existing", email="taken@example.com")
+        rows = [
+            {"name": "A", "email": "a@example.com", "phone": "+254700000000"},
+            {"name": "B", "email": "taken@example.com"},
+            {"name": "C", "email": "c@example.com", "phone": "12345"},
+            {"name": "D", "email": "a@example.com"},
+            {"name": "E", "email": "e@example.com", "phone": "123-456-7890"},
+        ]
+        data = run_query(self.MUTATION, {"input": rows})["bulkCreateCustomers"]
+        self.assertEqual(
+            [c["email"] for c in data["customers"]], ["a@example.com", "e@example.com"]
+        )
+        self.assertEqual(data["errors"], [
+            "Customer 2: Email already exists: taken@example.com",
+            "Customer 3: Invalid phone format: 12345",
+            "Customer 4: Email already exists: a@example.com",
+        ])
+        self.assertEqual(Customer.objects.count(), 3)
+
+    def test_query_count_does_not_grow_with_batch_size(self):
+        rows = [{"name": f"N{i}", "email": f"n{i}@example.com"} for i in range(50)]
+        with CaptureQueriesContext(connection) as ctx:
+            data = run_query(self.MUTATION, {"input": rows})["bulkCreateCustomers"]
+        self.assertEqual(len(data["customers"]), 50)
+        self.assertLessEqual(len(ctx.captured_queries), 4)
+
+
+class UpdateLowStockProductsTests(TestCase):
+    def test_restocks_low_stock_products_with_one_update(self):
+        low = Product.objects.create(name="Low", price=Decimal("1.00"), stock=3)
+        edge = Product.objects.create(name="Edge", price=Decimal("1.00"), stock=5)
+        Product.objects.create(name="Plenty", price=Decimal("1.00"), stock=50)
+        mutation = """
+            mutation {
+              updateLowStockProducts(threshold: 5, increment: 20) {
+                success message updatedProducts { name stock }
+              }
+            }
+        """
+        with CaptureQueriesContext(connection) as ctx:
+            data = run_query(mutation)["updateLowStockProducts"]
+        updates = [q for q in ctx.captured_queries if q["sql"].startswith("UPDATE")]
+        self.assertEqual(len(updates), 1)
+        self.assertEqual(
+            data["updatedProducts"], [{"name": "Low", "stock": 23}, {"name": "Edge", "stock": 25}]
+        )
+        self.assertEqual(data["message"], "Restocked 2 low-stock products.")
+        low.refresh_from_db()
+        edge.refresh_from_db()
+        self.assertEqual((low.stock, edge.stock), (23, 25))
+
+
+class BulkCreateOrdersTests(TestCase):
+    MUTATION = """
+        mutation ($input: [CreateOrderInput!]!) {
+          bulkCreateOrders(input: $input) {
+            orders { totalAmount customer { email } products { name } }
+            errors
+          }
+        }
+    """
+
+    def test_creates_valid_orders_and_reports_the_rest(self):
+        customer = Customer.objects.create(name="Ann", email="ann@example.com")
+        p1 = Product.objects.create(name="Pen", price=Decimal("2.50"), stock=10)
+        p2 = Product.objects.create(name="Ink", price=Decimal("4.00"), stock=10)
+        rows = [
+            {"customerId": str(customer.pk), "productIds": [str(p1.pk), str(p2.pk)]},
+            {"customerId": "999", "productIds": [str(p1.pk)]},
+            {"customerId": str(customer.pk), "productIds": [str(p1.pk), "999"]},
+            {"customerId": str(customer.pk), "productIds": [str(p2.pk)]},
+        ]
+        data = run_query(self.MUTATION, {"input": rows})["bulkCreateOrders"]
+        self.assertEqual(data["errors"], [
+            "Order 2: Invalid customer ID",
+            "Order 3: Some product IDs are invalid",
+        ])
+        self.assertEqual([o["totalAmount"] for o in data["orders"]], [6.5, 4.0])
+        self.assertEqual([p["name"] for p in data["orders"][0]["products"]], ["Pen", "Ink"])
+        self.assertEqual(Order.objects.count(), 2)
+        self.assertEqual(Order.products.through.objects.count(), 3)
+
+    def test_malformed_ids_fail_only_their_order(self):
+        customer = Customer.objects.create(name="Ann", email="ann@example.com")
+        pen = Product.objects.create(name="Pen", price=Decimal("2.50"), stock=10)
+        rows = [
+            {"customerId": to_global_id("CustomerType", customer.pk), "productIds": [str(pen.pk)]},
+            {"customerId": "garbage", "productIds": [str(pen.pk)]},
+            {"customerId": str(customer.pk), "productIds": [to_global_id("CustomerType", pen.pk)]},
+            {"customerId": str(customer.pk), "productIds": [to_global_id("ProductType", pen.pk)]},
+        ]
+        data = run_query(self.MUTATION, {"input": rows})["bulkCreateOrders"]
+        self.assertEqual(data["errors"], [
+            "Order 2: Invalid customer ID format: Invalid CustomerType ID: 'garbage'",
+            "Order 3: Invalid product ID format: Expected a ProductType ID, got a CustomerType ID: "
+            + to_global_id("CustomerType", pen.pk),
+        ])
+        self.assertEqual(len(data["orders"]), 2)
+
+    def test_query_count_does_not_grow_with_batch_size(self):
+        customer = Customer.objects.create(name="Ann", email="ann@example.com")
+        product = Product.objects.create(name="Pen", price=Decimal("2.50"), stock=40)
+        rows = [{"customerId": str(customer.pk), "productIds": [str(product.pk)]}] * 40
+        with CaptureQueriesContext(connection) as ctx:
+            data = run_query(self.MUTATION, {"input": rows})["bulkCreateOrders"]
+        self.assertEqual(len(data["orders"]), 40)
+        # Includes the single customer statistics UPDATE, and the stock read
+        # plus one reservation UPDATE per product inside a savepoint
+        self.assertLessEqual(len(ctx.captured_queries), 11)
+
+
+CREATE_ORDER = """
+    mutation ($customerId: ID!, $productIds: [ID!]!) {
+      createOrder(input: {customerId: $customerId, productIds: $productIds}) {
+        order { id }
+      }
+    }
+"""
+
+
+class CreateOrderStockTests(TestCase):
+    def test_order_reserves_stock(self):
+        customer = Customer.objects.create(name="Ann", email="ann@example.com")
+        pen = Product.objects.create(name="Pen", price=Decimal("2.50"), stock=2)
+        ink = Product.objects.create(name="Ink", price=Decimal("4.00"), stock=1)
+        variables = {"customerId": str(customer.pk), "productIds": [str(pen.pk), str(ink.pk)]}
+        run_query(CREATE_ORDER, variables)
+        pen.refresh_from_db()
+        ink.refresh_from_db()
+        self.assertEqual((pen.stock, ink.stock), (1, 0))
+
+    def test_out_of_stock_order_is_rejected_and_rolled_back(self):
+        customer = Customer.objects.create(name="Ann", email="ann@example.com")
+        pen = Product.objects.create(name="Pen", price=Decimal("2.50"), stock=5)
+        ink = Product.objects.create(name="Ink", price=Decimal("4.00"), stock=0)
+        variables = {"customerId": str(customer.pk), "productIds": [str(pen.pk), str(ink.pk)]}
+        result = schema.execute(CREATE_ORDER, variable_values=variables, context_value=SimpleNamespace())
+        self.assertIn("out of stock", str(result.errors[0]))
+        pen.refresh_from_db()
+        self.assertEqual(pen.stock, 5)
+        self.assertFalse(Order.objects.exists())
+
+
+    def test_bulk_orders_reserve_stock_and_report_the_rest(self):
+        customer = Customer.objects.create(name="Ann", email="ann@example.com")
+        pen = Product.objects.create(name="Pen", price=Decimal("2.50"), stock=3)
+        ink = Product.objects.create(name="Ink", price=Decimal("4.00"), stock=1)
+        rows = [
+            {"customerId": str(customer.pk), "productIds": [str(pen.pk), str(ink.pk)]},
+            {"customerId": str(customer.pk), "productIds": [str(pen.pk), str(ink.pk)]},
+            {"customerId": str(customer.pk), "productIds": [str(pen.pk)]},
+            {"customerId": str(customer.pk), "productIds": [str(pen.pk)]},
+            {"customerId": str(customer.pk), "productIds": [str(pen.pk)]},
+        ]
+        data = run_query(BulkCreateOrdersTests.MUTATION, {"input": rows})["bulkCreateOrders"]
+        self.assertEqual(data["errors"], [
+            "Order 2: Some products are out of stock",
+            "Order 5: Some products are out of stock",
+        ])
+        self.assertEqual([o["totalAmount"] for o in data["orders"]], [6.5, 2.5, 2.5])
+        pen.refresh_from_db()
+        ink.refresh_from_db()
+        self.assertEqual((pen.stock, ink.stock), (0, 0))
+        self.assertEqual(Order.objects.count(), 3)
+
+    def test_bulk_reservation_is_redone_when_stock_changes(self):
+        from . import schema as crm_schema
+
+        customer = Customer.objects.create(name="Ann", email="ann@example.com")
+        pen = Product.objects.create(name="Pen", price=Decimal("2.50"), stock=2)
+        ink = Product.objects.create(name="Ink", price=Decimal("4.00"), stock=2)
+        reads = []
+        values_list = type(Product.objects.all()).values_list
+
+        def racing_values_list(queryset, *fields, **kwargs):
+            # Another order takes an ink between the first read and the UPDATEs
+            if fields == ("id", "stock") and not reads:
+                reads.append(1)
+                rows = list(values_list(queryset, *fields, **kwargs))
+                Product.objects.filter(pk=ink.pk).update(stock=1)
+                return rows
+            return values_list(queryset, *fields, **kwargs)
+
+        with mock.patch.object(type(Product.objects.all()), "values_list", racing_values_list), \
+                CaptureQueriesContext(connection) as ctx:
+            rejected = crm_schema.reserve_bulk_stock([[ink.pk, pen.pk], [ink.pk, pen.pk]])
+        self.assertEqual(rejected, {1})
+        pen.refresh_from_db()
+        ink.refresh_from_db()
+        # The pens taken before the ink UPDATE failed went back with the savepoint
+        self.assertEqual((pen.stock, ink.stock), (1, 0))
+        updates = [q["sql"] for q in ctx.captured_queries
+                   if q["sql"].startswith("UPDATE") and '"stock" >=' in q["sql"]]
+        # Rows are always updated in id order, whatever order the client sent
+        self.assertEqual([f'"id" = {pen.pk}' in sql for sql in updates], [True, False, True, False])
+        self.assertEqual(sum("SAVEPOINT" in q["sql"] and "ROLLBACK" in q["sql"] for q in ctx.captured_queries), 1)
+
+
+class GlobalOrRawIDTests(TestCase):
+    def setUp(self):
+        self.customer = Customer.objects.create(name="Ann", email="ann@example.com")
+        self.pen = Product.objects.create(name="Pen", price=Decimal("2.50"), stock=5)
+
+    def create_order(self, customer_id, product_ids):
+        return schema.execute(
+            CREATE_ORDER,
+            variable_values={"customerId": customer_id, "productIds": product_ids},
+            context_value=SimpleNamespace(),
+        )
+
+    def test_global_and_raw_ids_are_decoded(self):
+        result = self.create_order(to_global_id("CustomerType", self.customer.pk), [self.pen.pk])
+        self.assertIsNone(result.errors)
+        order = Order.objects.get()
+        self.assertEqual(order.customer, self.customer)
+        self.assertEqual(list(order.products.all()), [self.pen])
+
+        data = run_query("""
+            mutation {{ createOrder(input: {{customerId: {}, productIds: ["{}"]}}) {{ order {{ id }} }} }}
+        """.format(self.customer.pk, to_global_id("ProductType", self.pen.pk)))
+        self.assertIsNotNone(data["createOrder"]["order"]["id"])
+
+    def test_invalid_and_mistyped_ids_are_rejected_before_any_query(self):
+        wrong_type = to_global_id("ProductType", self.pen.pk)
+        for customer_id, message in (
+            (wrong_type, "Invalid customer ID format: Expected a CustomerType ID, got a ProductType ID"),
+            ("not-an-id", "Invalid customer ID format: Invalid CustomerType ID"),
+        ):
+            with self.assertNumQueries(0):
+                result = self.create_order(customer_id, [str(self.pen.pk)])
+            self.assertIn(message, str(result.errors[0]))
+        self.assertFalse(Order.objects.exists())
+
+    def test_filters_share_the_scalar(self):
+        seed_orders(2)
+        customer = Customer.objects.get(email="c1@example.com")
+        query = "query ($id: CustomerID) { allOrders(customerId: $id) { edges { node { customer { email } } } } }"
+        for value in (to_global_id("CustomerType", customer.pk), str(customer.pk)):
+            edges = run_query(query, {"id": value})["allOrders"]["edges"]
+            self.assertEqual([e["node"]["customer"]["email"] for e in edges], ["c1@example.com"])
+
+
+class ProductCatalogTests(TestCase):
+    ORDERS = "{ orders { totalAmount products { name price stock } } }"
+
+    def setUp(self):
+        # The catalog needs a cache every process sees; a directory will do
+        cache_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(cache_dir.cleanup)
+        shared_cache = override_settings(
+            CACHES={
+                "default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"},
+                "catalog": {"BACKEND": "django.core.cache.backends.filebased.FileBasedCache",
+                            "LOCATION": cache_dir.name},
+            },
+            CRM_PRODUCT_CATALOG={"CACHE_ALIAS": "catalog"},
+        )
+        shared_cache.enable()
+        self.addCleanup(shared_cache.disable)
+        reset_product_catalog()
+        self.addCleanup(reset_product_catalog)
+        self.customer = Customer.objects.create(name="Ann", email="ann@example.com")
+        self.pen = Product.objects.create(name="Pen", price=Decimal("2.50"), stock=10)
+        self.ink = Product.objects.create(name="Ink", price=Decimal("4.00"), stock=10)
+        self.variables = {"customerId": str(self.customer.pk),
+                          "productIds": [str(self.pen.pk), str(self.ink.pk)]}
+
+    def product_selects(self, queries):
+        return [q["sql"] for q in queries
+                if q["sql"].startswith("SELECT") and 'FROM "crm_product"' in q["sql"]]
+
+    def test_create_order_reads_prices_from_memory(self):
+        run_query(CREATE_ORDER, self.variables)
+        with CaptureQueriesContext(connection) as ctx:
+            run_query(CREATE_ORDER, self.variables)
+        self.assertEqual(self.product_selects(ctx.captured_queries), [])
+        self.assertEqual(Order.objects.latest("pk").total_amount, Decimal("6.50"))
+        self.pen.refresh_from_db()
+        self.assertEqual(self.pen.stock, 8)
+
+    def test_order_products_resolve_from_records_with_fresh_stock(self):
+        run_query(CREATE_ORDER, self.variables)
+        run_query(self.ORDERS)
+        with CaptureQueriesContext(connection) as ctx:
+            data = run_query(self.ORDERS)
+        # orders, their product links, and one batch of stock
+        self.assertEqual(len(ctx.captured_queries), 3)
+        self.assertEqual(data["orders"][0]["products"], [
+            {"name": "Pen", "price": 2.5, "stock": 9},
+            {"name": "Ink", "price": 4.0, "stock": 9},
+        ])
+
+    def test_local_save_is_seen_immediately(self):
+        run_query(CREATE_ORDER, self.variables)
+        self.pen.price = Decimal("3.00")
+        self.pen.save()
+        run_query(CREATE_ORDER, self.variables)
+        self.assertEqual(Order.objects.latest("pk").total_amount, Decimal("7.00"))
+
+    def test_other_processes_reload_only_changed_products(self):
+        other = ProductCatalog("catalog", change_ttl=60, max_changes=10)
+        ids = [self.pen.pk, self.ink.pk]
+        other.get_many(ids)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Product.objects.filter(pk=self.pen.pk).update(price=Decimal("3.00"))
+            get_product_catalog().forget([self.pen.pk])
+            get_product_catalog().publish([self.pen.pk])
+        with CaptureQueriesContext(connection) as ctx:
+            records = other.get_many(ids)
+        self.assertEqual(len(ctx.captured_queries), 1)
+        self.assertIn(f"IN ({self.pen.pk})", ctx.captured_queries[0]["sql"])
+        self.assertIsInstance(records[self.pen.pk], ProductRecord)
+        self.assertEqual(records[self.pen.pk].price, Decimal("3.00"))
+        self.assertEqual(records[self.ink.pk].price_float, 4.0)
+
+        # A gap in the change log drops the whole catalog
+        other.cache.incr(other.VERSION_KEY)
+        with CaptureQueriesContext(connection) as ctx:
+            other.get_many(ids)
+        self.assertIn(f"IN ({self.pen.pk}, {self.ink.pk})", ctx.captured_queries[0]["sql"])
+
+    def test_process_local_cache_is_refused(self):
+        with self.assertRaisesMessage(ImproperlyConfigured, "the 'default' cache is LocMemCache"):
+            ProductCatalog("default", change_ttl=60, max_changes=10)
+
+    @override_settings(CRM_PRODUCT_CATALOG=None)
+    def test_disabled_catalog_reads_the_database(self):
+        run_query(CREATE_ORDER, self.variables)
+        with CaptureQueriesContext(connection) as ctx:
+            run_query(CREATE_ORDER, self.variables)
+        self.assertEqual(len(self.product_selects(ctx.captured_queries)), 1)
+
+
+class CreateOrderConcurrencyTests(TransactionTestCase):
+    THREADS = 8
+    ATTEMPTS_PER_THREAD = 10
+    STOCK = 25
+
+    def test_concurrent_orders_never_oversell(self):
+        customer = Customer.objects.create(name="Ann", email="ann@example.com")
+        product = Product.objects.create(name="Pen", price=Decimal("2.50"), stock=self.STOCK)
+        variables = {"customerId": str(customer.pk), "productIds": [str(product.pk)]}
+        placed = []
+        errors = []
+
+        def place_orders():
+            try:
+                for _ in range(self.ATTEMPTS_PER_THREAD):
+                    result = schema.execute(
+                        CREATE_ORDER, variable_values=variables, context_value=SimpleNamespace()
+                    )
+                    if result.errors:
+                        errors.extend(error.message for error in result.errors)
+                    else:
+                        placed.append(result.data["createOrder"]["order"]["id"])
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=place_orders) for _ in range(self.THREADS)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        product.refresh_from_db()
+        # More attempts than stock: every unit is sold, and only running out fails
+        self.assertEqual(len(placed), self.STOCK)
+        self.assertEqual(set(errors), {"Some products are out of stock"})
+        self.assertEqual(Order.objects.count(), len(placed))
+        self.assertEqual(product.stock, self.STOCK - len(placed))
+
+
+class KeysetPaginationTests(TestCase):
+    QUERY = """
+        query ($after: String, $before: String, $first: Int, $last: Int) {
+          allOrders(keyset: true, first: $first, after: $after, last: $last, before: $before) {
+            pageInfo { hasNextPage hasPreviousPage endCursor startCursor }
+            edges { node { id } }
+          }
+        }
+    """
+
+    def setUp(self):
+        seed_orders(7)
+        self.expected = [
+            o.pk for o in Order.objects.order_by("-order_date", "-id")
+        ]
+
+    def node_ids(self, data):
+        return [int(from_global_id(e["node"]["id"])[1]) for e in data["edges"]]
+
+    def test_pages_walk_every_order_once_without_counting(self):
+        seen, after, counts = [], None, []
+        while True:
+            with CaptureQueriesContext(connection) as ctx:
+                data = run_query(self.QUERY, {"first": 3, "after": after})["allOrders"]
+            counts.append(len(ctx.captured_queries))
+            self.assertFalse(any("COUNT" in q["sql"] for q in ctx.captured_queries))
+            seen.extend(self.node_ids(data))
+            if not data["pageInfo"]["hasNextPage"]:
+                break
+            after = data["pageInfo"]["endCursor"]
+        self.assertEqual(seen, self.expected)
+        self.assertEqual(len(set(counts)), 1)
+
+    def test_last_before_pages_backwards(self):
+        first_page = run_query(self.QUERY, {"first": 4})["allOrders"]
+        data = run_query(self.QUERY, {"last": 2, "before": first_page["pageInfo"]["endCursor"]})
+        self.assertEqual(self.node_ids(data["allOrders"]), self.expected[1:3])
+        self.assertTrue(data["allOrders"]["pageInfo"]["hasPreviousPage"])
+
+    def test_total_count_is_only_computed_when_selected(self):
+        query = "{ allOrders(keyset: true, first: 2) { totalCount edges { node { id } } } }"
+        with CaptureQueriesContext(connection) as ctx:
+            data = run_query(query)["allOrders"]
+        self.assertEqual(data["totalCount"], 7)
+        self.assertEqual(sum("COUNT" in q["sql"] for q in ctx.captured_queries), 1)
+
+
+class CrmStatsTests(TestCase):
+    def test_totals_come_from_one_query(self):
+        seed_orders(4)
+        Customer.objects.create(name="No orders", email="none@example.com")
+        query = "{ crmStats { totalCustomers totalOrders totalRevenue } }"
+        with CaptureQueriesContext(connection) as ctx:
+            data = run_query(query)["crmStats"]
+        self.assertEqual(len(ctx.captured_queries), 1)
+        self.assertEqual(data, {"totalCustomers": 5, "totalOrders": 4, "totalRevenue": 80.0})
+
+    def test_date_range_and_daily_buckets(self):
+        seed_orders(3)
+        old = Order.objects.first()
+        Order.objects.filter(pk=old.pk).update(order_date="2020-01-01T10:00:00Z")
+        query = """
+            query ($since: DateTime) {
+              crmStats(orderDateGte: $since, groupBy: DAY) {
+                totalOrders
+                buckets { period orders revenue customers }
+              }
+            }
+        """
+        data = run_query(query, {"since": "2021-01-01T00:00:00+00:00"})["crmStats"]
+        self.assertEqual(data["totalOrders"], 2)
+        self.assertEqual(len(data["buckets"]), 1)
+        self.assertEqual(data["buckets"][0]["orders"], 2)
+        self.assertEqual(data["buckets"][0]["revenue"], 40.0)
+        self.assertEqual(data["buckets"][0]["customers"], 2)
+
+
+class ViewTestCase(TestCase):
+    def setUp(self):
+        for reset in (reset_response_cache, reset_document_registries):
+            reset()
+            self.addCleanup(reset)
+        self.view = CRMGraphQLView.as_view(schema=schema)
+
+    def post(self, query=None, variables=None, **body):
+        request = RequestFactory().post(
+            "/graphql", json.dumps({"query": query, "variables": variables, **body}),
+            content_type="application/json",
+        )
+        return json.loads(self.view(request).content)
+
+
+@override_settings(CRM_RESPONSE_CACHE={"BACKEND": "memory"})
+class ResponseCacheTests(ViewTestCase):
+    def setUp(self):
+        super().setUp()
+        self.product = Product.objects.create(name="Pen", price=Decimal("2.50"), stock=3)
+
+    def test_repeated_query_is_served_from_cache(self):
+        first = self.post("{ allProducts { edges { node { name stock } } } }")
+        with CaptureQueriesContext(connection) as ctx:
+            second = self.post("{\n  allProducts {\n edges { node { name stock } } } }")
+        self.assertEqual(first, second)
+        self.assertEqual(len(ctx.captured_queries), 0)
+
+    def test_variables_are_part_of_the_key(self):
+        query = "query ($n: Int) { allProducts(first: $n) { edges { node { name } } } }"
+        Product.objects.create(name="Ink", price=Decimal("4.00"), stock=3)
+        one = self.post(query, {"n": 1})
+        two = self.post(query, {"n": 2})
+        self.assertEqual(len(one["data"]["allProducts"]["edges"]), 1)
+        self.assertEqual(len(two["data"]["allProducts"]["edges"]), 2)
+
+    def test_writes_invalidate_cached_responses(self):
+        query = "{ products { name stock } }"
+        self.post(query)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.product.stock = 9
+            self.product.save()
+        self.assertEqual(self.post(query)["data"]["products"], [{"name": "Pen", "stock": 9}])
+
+    def test_bulk_mutations_invalidate_cached_responses(self):
+        query = "{ products { stock } }"
+        self.post(query)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.post("mutation { updateLowStockProducts { success } }")
+        self.assertEqual(self.post(query)["data"]["products"], [{"stock": 13}])
+
+    def test_off_unless_configured(self):
+        reset_response_cache()
+        with self.settings():
+            del settings.CRM_RESPONSE_CACHE
+            self.assertIsNone(get_response_cache())
+
+    @override_settings(CRM_RESPONSE_CACHE={"BACKEND": "django"})
+    def test_process_local_django_cache_is_refused(self):
+        reset_response_cache()
+        with self.assertRaisesMessage(ImproperlyConfigured, "the 'default' cache is LocMemCache"):
+            get_response_cache()
+
+
+@override_settings(CRM_RESPONSE_CACHE=None)
+class PersistedQueryTests(ViewTestCase):
+    def persisted(self, sha256_hash):
+        return {"persistedQuery": {"version": 1, "sha256Hash": sha256_hash}}
+
+    def test_registered_documents_run_by_hash_alone(self):
+        data = self.post(extensions=self.persisted(query_hash(CRM_REPORT)))
+        self.assertEqual(data["data"]["crmStats"]["totalOrders"], 0)
+
+    def test_unknown_hash_is_registered_by_a_full_text_retry(self):
+        query = "{ products { name } }"
+        digest = query_hash(query)
+        missing = self.post(extensions=self.persisted(digest))
+        self.assertEqual(missing["errors"][0]["message"], "PersistedQueryNotFound")
+        self.post(query, extensions=self.persisted(digest))
+        self.assertEqual(self.post(extensions=self.persisted(digest)), {"data": {"products": []}})
+
+    def test_hash_must_match_the_query(self):
+        data = self.post("{ hello }", extensions=self.persisted(query_hash("{ other }")))
+        self.assertEqual(data["errors"][0]["message"], "provided sha does not match query")
+
+    def test_repeated_documents_are_parsed_once(self):
+        self.post("{ hello }")
+        with mock.patch("crm.persisted.parse", wraps=parse) as parse_spy:
+            for _ in range(3):
+                self.assertEqual(self.post("{ hello }")["data"]["hello"], "Hello, GraphQL!")
+        self.assertEqual(parse_spy.call_count, 0)
+
+    @override_settings(CRM_PERSISTED_QUERIES={"ALLOWLIST_ONLY": True})
+    def test_allowlist_mode_rejects_unknown_documents(self):
+        data = self.post("{ products { name } }")
+        self.assertEqual(data["errors"][0]["message"], "PersistedQueryNotAllowed")
+        # Allowed documents pass in raw or printed form, as gql sends them
+        self.assertIn("data", self.post(CRM_REPORT))
+        self.assertIn("data", self.post(print_ast(parse(CRM_REPORT))))
+
+
+@override_settings(CRM_RESPONSE_CACHE=None)
+class QueryLimitTests(ViewTestCase):
+    def test_rejects_deep_query_before_running_it(self):
+        query = "{ orders { customer { email } } }"
+        with override_settings(CRM_QUERY_LIMITS={"MAX_DEPTH": 2}):
+            with self.assertNumQueries(0):
+                body = self.post(query)
+        self.assertIsNone(body.get("data"))
+        self.assertIn("exceeds the maximum depth of 2", body["errors"][0]["message"])
+
+    def test_rejects_costly_query_before_running_it(self):
+        # 100 orders x (1 + 10 products)
+        query = "{ orders { products { name } } }"
+        with override_settings(CRM_QUERY_LIMITS={"MAX_COST": 1000}):
+            with self.assertNumQueries(0):
+                body = self.post(query)
+        self.assertIn("Query cost 1100 exceeds", body["errors"][0]["message"])
+
+        with override_settings(CRM_QUERY_LIMITS={"MAX_COST": 1100}):
+            reset_document_registries()
+            self.assertNotIn("errors", self.post(query))
+
+    def test_connection_cost_uses_first(self):
+        query = "query%s { allOrders(first: %s) { edges { node { id } } } }"
+        with override_settings(CRM_QUERY_LIMITS={"MAX_COST": 50}):
+            self.assertNotIn("errors", self.post(query % ("", 50)))
+            self.assertIn("errors", self.post(query % ("", 51)))
+            # A variable counts as the largest page it could request
+            body = self.post(query % ("($n: Int = 5)", "$n"), {"n": 5})
+            self.assertIn("exceeds the maximum cost", body["errors"][0]["message"])
+
+    def test_list_fields_have_a_default_page_size(self):
+        Customer.objects.bulk_create(
+            Customer(name=f"C{i}", email=f"c{i}@example.com") for i in range(5)
+        )
+        with override_settings(CRM_QUERY_LIMITS={"DEFAULT_PAGE_SIZE": 3, "MAX_PAGE_SIZE": 4}):
+            body = self.post("{ customers { email } }")
+            self.assertEqual(
+                [c["email"] for c in body["data"]["customers"]],
+                ["c0@example.com", "c1@example.com", "c2@example.com"],
+            )
+            body = self.post("{ customers(limit: 2, offset: 3) { email } }")
+            self.assertEqual(len(body["data"]["customers"]), 2)
+            body = self.post("{ customers(limit: 5) { email } }")
+            self.assertIn("limit must be between 0 and 4", body["errors"][0]["message"])
+
+
+class LocalExecutorTests(TestCase):
+    def setUp(self):
+        self.log = os.path.join(tempfile.mkdtemp(), "job.log")
+
+    def read_log(self):
+        with open(self.log) as f:
+            return f.read()
+
+    @mock.patch.object(executor, "HttpExecutor")
+    def test_jobs_run_in_process(self, http_executor):
+        Customer.objects.create(name="Ann", email="ann@example.com")
+        Product.objects.create(name="Low", price=Decimal("1.00"), stock=2)
+
+        with mock.patch.object(cron, "LOG_FILE", self.log):
+            cron.log_crm_heartbeat()
+        self.assertIn("GraphQL hello: Hello, GraphQL!", self.read_log())
+
+        with mock.patch.object(cron, "LOG_LOW_PROD_FILE", self.log):
+            cron.update_low_stock()
+        self.assertIn("Low has 12 in stock", self.read_log())
+
+        with mock.patch.object(tasks, "LOG_FILE", self.log):
+            tasks.generate_crm_report()
+        self.assertIn("Report: 1 customers, 0 orders, 0.0 revenue", self.read_log())
+        http_executor.assert_not_called()
+
+    def test_errors_are_raised(self):
+        with self.assertRaises(executor.GraphQLExecutionError):
+            executor.execute("{ missingField }")
+
+    @mock.patch.dict(os.environ, {"CRM_GRAPHQL_EXECUTOR": "http"})
+    @mock.patch.object(executor, "HttpExecutor")
+    def test_http_fallback(self, http_executor):
+        http_executor.return_value.execute.return_value = {"hello": "remote"}
+        self.assertEqual(executor.execute("{ hello }"), {"hello": "remote"})
+        http_executor.assert_called_once_with(executor.GRAPHQL_ENDPOINT)
+
+
+class OrderReminderTests(TestCase):
+    MARK = """
+        mutation ($ids: [OrderID!]!) { markOrderRemindersSent(orderIds: $ids) { marked } }
+    """
+
+    def setUp(self):
+        from .benchmarks.suite import load_script
+
+        self.script = load_script(
+            os.path.join(os.path.dirname(__file__), "cron_jobs", "send_order_reminders.py"),
+            "crm_send_order_reminders_test",
+        )
+        self.script.LOG_FILE = os.path.join(tempfile.mkdtemp(), "reminders.log")
+
+    def run_job(self):
+        with contextlib.redirect_stdout(io.StringIO()) as out:
+            self.script.main()
+        self.assertEqual(out.getvalue(), "Order reminders processed!\n")
+        if not os.path.exists(self.script.LOG_FILE):
+            return []
+        with open(self.script.LOG_FILE) as f:
+            return [json.loads(line) for line in f]
+
+    def test_each_order_in_the_window_is_logged_once(self):
+        seed_orders(3)
+        old = Order.objects.latest("pk")
+        Order.objects.filter(pk=old.pk).update(order_date=old.order_date - timedelta(days=30))
+
+        self.assertEqual(len(self.run_job()), 2)
+        self.assertEqual(len(self.run_job()), 2)
+        seed_orders(2, start=3)
+        lines = self.run_job()
+        self.assertEqual(len(lines), 4)
+        self.assertEqual(lines[-1]["email"], "c4@example.com")
+        self.assertEqual(Order.objects.filter(reminder_sent_at__isnull=True).get(), old)
+
+    def test_scans_new_orders_page_by_page(self):
+        customer = Customer.objects.create(name="Ann", email="ann@example.com")
+        Order.objects.bulk_create(
+            Order(customer=customer, total_amount=Decimal("1.00")) for _ in range(205)
+        )
+        with mock.patch.object(self.script, "execute", wraps=self.script.execute) as execute:
+            self.assertEqual(len(self.run_job()), 205)
+        # Three pages and their marks, then the empty page that ends the scan
+        self.assertEqual(execute.call_count, 7)
+        self.assertFalse(Order.objects.filter(reminder_sent_at__isnull=True).exists())
+
+    def test_marking_is_idempotent(self):
+        seed_orders(1)
+        order = Order.objects.get()
+        data = run_query(self.MARK, {"ids": [str(order.pk)]})
+        self.assertEqual(data["markOrderRemindersSent"]["marked"], 1)
+        order.refresh_from_db()
+        sent_at = order.reminder_sent_at
+        data = run_query(self.MARK, {"ids": [str(order.pk)]})
+        self.assertEqual(data["markOrderRemindersSent"]["marked"], 0)
+        order.refresh_from_db()
+        self.assertEqual(order.reminder_sent_at, sent_at)
+
+
+class ParallelTaskTests(TestCase):
+    def setUp(self):
+        from .benchmarks.celery_fanout import memory_app
+
+        self.enterContext(memory_app(task_always_eager=True, task_eager_propagates=True))
+        log_dir = self.enterContext(tempfile.TemporaryDirectory())
+        self.enterContext(mock.patch.object(tasks, "LOG_FILE", os.path.join(log_dir, "report.log")))
+        self.enterContext(mock.patch.object(
+            tasks, "REMINDERS_LOG_FILE", os.path.join(log_dir, "reminders.log")
+        ))
+
+    def read_log(self, path):
+        with open(path) as f:
+            return [json.loads(line) for line in f]
+
+    def test_id_ranges_cover_every_row(self):
+        seed_orders(5)
+        first = Customer.objects.order_by("pk").first().pk
+        self.assertEqual(
+            tasks.id_ranges(Customer.objects.all(), 2),
+            [(first, first + 2), (first + 2, first + 4), (first + 4, first + 5)],
+        )
+        self.assertEqual(tasks.id_ranges(Customer.objects.none(), 2), [])
+
+    def test_report_ranges_are_merged(self):
+        seed_orders(5)
+        Customer.objects.create(name="No orders", email="none@example.com")
+
+        totals = tasks.fan_out_crm_report(chunk_size=2).get()
+        self.assertEqual(totals, {"customers": 6, "orders": 5, "revenue": 100.0})
+        tasks.generate_crm_report()
+        parallel, serial = self.read_log(tasks.LOG_FILE)
+        self.assertEqual(parallel["message"], serial["message"])
+
+        Customer.objects.all().delete()
+        self.assertEqual(tasks.fan_out_crm_report().get(), {"customers": 0, "orders": 0, "revenue": 0.0})
+
+    def test_reminder_ranges_mark_each_order_once(self):
+        seed_orders(5)
+        old = Order.objects.latest("pk")
+        Order.objects.filter(pk=old.pk).update(order_date=old.order_date - timedelta(days=30))
+
+        self.assertEqual(tasks.fan_out_order_reminders(chunk_size=2).get(), 4)
+        self.assertEqual(tasks.fan_out_order_reminders(chunk_size=2).get(), 0)
+        lines = self.read_log(tasks.REMINDERS_LOG_FILE)
+        self.assertEqual(len(lines), 4)
+        self.assertEqual(lines[0]["email"], "c0@example.com")
+        self.assertEqual(Order.objects.filter(reminder_sent_at__isnull=True).get(), old)
+
+
+def write_job_log(path, count, **options):
+    log = JobLog(path, **options)
+    for i in range(count):
+        log.write("test", f"record {i}", pid=os.getpid())
+    log.flush()
+
+
+class JobLogTests(SimpleTestCase):
+    def setUp(self):
+        self.path = os.path.join(self.enterContext(tempfile.TemporaryDirectory()), "job.log")
+
+    def read(self, path):
+        opener = gzip.open if path.endswith(".gz") else open
+        with opener(path, "rt") as f:
+            return [json.loads(line) for line in f]
+
+    def test_records_are_buffered_into_one_write(self):
+        log = JobLog(self.path, buffer=3)
+        log.write("test", "first", order_id=1)
+        log.error("test", "second")
+        self.assertFalse(os.path.exists(self.path))
+        with mock.patch("crm.joblog.os.write", wraps=os.write) as write:
+            log.write("test", "third")
+        self.assertEqual(write.call_count, 1)
+        records = self.read(self.path)
+        self.assertEqual([r["message"] for r in records], ["first", "second", "third"])
+        self.assertEqual(records[0]["order_id"], 1)
+        self.assertEqual(records[1]["level"], "error")
+
+    def test_rotates_by_size_and_compresses(self):
+        log = JobLog(self.path, max_bytes=300, backups=2, compress=True, buffer=100)
+        for i in range(4):
+            for j in range(3):
+                log.write("test", f"batch {i}")
+            log.flush()
+        self.assertEqual({r["message"] for r in self.read(self.path)}, {"batch 3"})
+        self.assertEqual({r["message"] for r in self.read(self.path + ".1.gz")}, {"batch 2"})
+        self.assertEqual({r["message"] for r in self.read(self.path + ".2.gz")}, {"batch 1"})
+        self.assertFalse(os.path.exists(self.path + ".3.gz"))
+
+    def test_rotates_by_time(self):
+        log = JobLog(self.path, rotate_interval=3600)
+        log.write("test", "yesterday")
+        log.flush()
+        old = os.stat(self.path).st_mtime - 86400
+        os.utime(self.path, (old, old))
+        log.write("test", "today")
+        log.flush()
+        self.assertEqual([r["message"] for r in self.read(self.path + ".1")], ["yesterday"])
+        self.assertEqual([r["message"] for r in self.read(self.path)], ["today"])
+
+    def test_processes_share_a_rotating_file(self):
+        import multiprocessing
+
+        if "fork" not in multiprocessing.get_all_start_methods():
+            self.skipTest("needs fork")
+        context = multiprocessing.get_context("fork")
+        options = {"max_bytes": 20000, "backups": 100, "buffer": 25}
+        workers = [
+            context.Process(target=write_job_log, args=(self.path, 300), kwargs=options)
+            for _ in range(4)
+        ]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+            self.assertEqual(worker.exitcode, 0)
+
+        paths = [self.path] + [f"{self.path}.{i}" for i in range(1, 101)]
+        records = [r for path in paths if os.path.exists(path) for r in self.read(path)]
+        self.assertTrue(os.path.exists(self.path + ".1"))
+        self.assertEqual(len(records), 1200)
+        self.assertEqual(len({(r["pid"], r["message"]) for r in records}), 1200)
+
+
+class GraphQLClientTests(SimpleTestCase):
+    def setUp(self):
+        from .benchmarks.graphql_client import StubServer
+
+        self.stub = StubServer()
+        self.stub.__enter__()
+        self.addCleanup(self.stub.__exit__, None, None, None)
+        self.client = GraphQLClient(self.stub.url, backoff=0)
+        self.addCleanup(self.client.close)
+
+    def test_reuses_one_connection_and_sends_hashes(self):
+        for _ in range(3):
+            self.assertEqual(self.client.execute(HEARTBEAT), {"hello": "Hello, GraphQL!"})
+        self.assertEqual(self.client.execute(CRM_REPORT)["crmStats"]["totalOrders"], 5)
+        self.assertEqual(self.stub.connections, 1)
+        self.assertTrue(all("query" not in payload for payload in self.stub.payloads))
+        self.assertEqual(self.stub.payloads[0]["operationName"], "Heartbeat")
+
+    def test_sends_the_text_when_the_hash_is_unknown(self):
+        self.stub.persisted = False
+        self.assertEqual(self.client.execute(HEARTBEAT), {"hello": "Hello, GraphQL!"})
+        self.assertEqual([("query" in payload) for payload in self.stub.payloads], [False, True])
+        self.assertEqual(
+            self.stub.payloads[1]["extensions"]["persistedQuery"]["sha256Hash"], query_hash(HEARTBEAT)
+        )
+
+    def test_retries_queries_but_not_mutations(self):
+        self.stub.statuses.extend([503, 502])
+        with self.assertLogs("crm.graphql_client", "WARNING") as logs:
+            self.assertEqual(self.client.execute(HEARTBEAT), {"hello": "Hello, GraphQL!"})
+        self.assertEqual(len(logs.records), 2)
+        self.assertEqual(len(self.stub.payloads), 3)
+
+        self.stub.statuses.append(503)
+        with self.assertRaises(executor.GraphQLExecutionError):
+            self.client.execute(UPDATE_LOW_STOCK)
+        self.assertEqual(len(self.stub.payloads), 4)
+
+    def test_http_executor_shares_the_process_client(self):
+        self.addCleanup(reset_clients)
+        first = executor.HttpExecutor(self.stub.url)
+        self.assertIs(first.client, executor.HttpExecutor(self.stub.url).client)
+        self.assertIs(first.client, get_client(self.stub.url))
+        first.execute(HEARTBEAT)
+        executor.HttpExecutor(self.stub.url).execute(CRM_REPORT)
+        self.assertEqual(self.stub.connections, 1)
+
+
+class ExportViewTests(TestCase):
+    def export(self, resource, **params):
+        request = RequestFactory().get(f"/export/{resource}/", params)
+        response = ExportView.as_view(chunk_size=2)(request, resource=resource)
+        if not response.streaming:
+            return response, None
+        return response, b"".join(response.streaming_content).decode()
+
+    def test_orders_stream_as_ndjson_with_customer_and_products(self):
+        seed_orders(5)
+        # One query for the orders and one products prefetch per chunk of 2
+        with self.assertNumQueries(4):
+            response, body = self.export("orders")
+        self.assertEqual(response["Content-Type"], "application/x-ndjson")
+        rows = [json.loads(line) for line in body.splitlines()]
+        self.assertEqual([row["id"] for row in rows], sorted(row["id"] for row in rows))
+        order = Order.objects.get(pk=rows[0]["id"])
+        self.assertEqual(rows[0]["customer_email"], order.customer.email)
+        self.assertEqual(rows[0]["product_names"], [p.name for p in order.products.order_by("pk")])
+        self.assertEqual(rows[0]["total_amount"], "20.00")
+
+    def test_customer_id_filter_is_decoded_and_validated(self):
+        seed_orders(3)
+        customer = Customer.objects.get(email="c1@example.com")
+        expected = sorted(customer.order_set.values_list("pk", flat=True))
+        for customer_id in (str(customer.pk), to_global_id("CustomerType", customer.pk)):
+            response, body = self.export("orders", customer_id=customer_id)
+            self.assertEqual(sorted(json.loads(line)["id"] for line in body.splitlines()), expected)
+
+        for customer_id in ("abc", to_global_id("ProductType", customer.pk)):
+            response, _ = self.export("orders", customer_id=customer_id)
+            self.assertEqual(response.status_code, 400)
+            self.assertIn("customer_id", json.loads(response.content)["errors"])
+
+    def test_filters_and_csv(self):
+        seed_orders(3)
+        Customer.objects.filter(email="c1@example.com").update(name="Zed")
+        response, body = self.export("customers", format="csv", name="zed")
+        self.assertEqual(response["Content-Type"], "text/csv")
+        header, *rows = body.splitlines()
+        self.assertEqual(header, "id,name,email,phone,created_at")
+        self.assertEqual(len(rows), 1)
+        self.assertIn("c1@example.com", rows[0])
+
+    def test_product_filter_does_not_duplicate_orders(self):
+        seed_orders(2)
+        _, body = self.export("orders", format="csv", product_name="product")
+        self.assertEqual(len(body.splitlines()), 3)
+
+    def test_rejects_bad_requests(self):
+        response, _ = self.export("orders", format="xml")
+        self.assertEqual(response.status_code, 400)
+        response, _ = self.export("orders", order_date_gte="not-a-date")
+        self.assertEqual(response.status_code, 400)
+        with self.assertRaises(Http404):
+            self.export("invoices")
+
+
+class CustomerStatsTests(TestCase):
+    def setUp(self):
+        self.ann = Customer.objects.create(name="Ann", email="ann@example.com")
+        self.bob = Customer.objects.create(name="Bob", email="bob@example.com")
+        self.pen = Product.objects.create(name="Pen", price=Decimal("2.50"), stock=50)
+        self.ink = Product.objects.create(name="Ink", price=Decimal("4.00"), stock=50)
+
+    def order(self, customer, *products):
+        run_query(CREATE_ORDER, {
+            "customerId": str(customer.pk),
+            "productIds": [str(p.pk) for p in products],
+        })
+
+    def test_mutations_update_stats_incrementally(self):
+        self.order(self.ann, self.pen, self.ink)
+        run_query(BulkCreateOrdersTests.MUTATION, {"input": [
+            {"customerId": str(self.ann.pk), "productIds": [str(self.pen.pk)]},
+            {"customerId": str(self.bob.pk), "productIds": [str(self.ink.pk)]},
+            {"customerId": str(self.bob.pk), "productIds": [str(self.ink.pk)]},
+        ]})
+        self.ann.refresh_from_db()
+        self.bob.refresh_from_db()
+        self.assertEqual((self.ann.order_count, self.ann.total_spent), (2, Decimal("9.00")))
+        self.assertEqual((self.bob.order_count, self.bob.total_spent), (2, Decimal("8.00")))
+        self.assertEqual(self.bob.last_order_date, Order.objects.filter(customer=self.bob).latest("order_date").order_date)
+        self.assertEqual(list(check_customer_stats()), [])
+
+    def test_exposed_and_filterable(self):
+        self.order(self.ann, self.pen, self.ink)
+        self.order(self.bob, self.pen)
+        data = run_query("""
+            { allCustomers(totalSpentGte: 5) { edges { node { name orderCount totalSpent lastOrderDate } } } }
+        """)
+        nodes = [edge["node"] for edge in data["allCustomers"]["edges"]]
+        self.assertEqual([(n["name"], n["orderCount"], n["totalSpent"]) for n in nodes], [("Ann", 1, 6.5)])
+        self.assertIsNotNone(nodes[0]["lastOrderDate"])
+
+    def test_deleting_an_order_refreshes_stats(self):
+        self.order(self.ann, self.pen)
+        self.order(self.ann, self.ink)
+        Order.objects.filter(customer=self.ann).order_by("pk").last().delete()
+        self.ann.refresh_from_db()
+        self.assertEqual((self.ann.order_count, self.ann.total_spent), (1, Decimal("2.50")))
+
+    def test_deleting_a_customer_skips_the_stats_refresh(self):
+        self.order(self.ann, self.pen)
+        self.order(self.ann, self.ink)
+        customers = Customer.objects.filter(pk=self.ann.pk)
+        # Deleting an instance and a queryset both cascade to the orders
+        for delete in (lambda: customers.get().delete(), customers.delete):
+            with transaction.atomic(), CaptureQueriesContext(connection) as ctx:
+                delete()
+                self.assertFalse(Order.objects.filter(customer_id=self.ann.pk).exists())
+                transaction.set_rollback(True)
+            updates = [q["sql"] for q in ctx.captured_queries if q["sql"].startswith('UPDATE "crm_customer"')]
+            self.assertEqual(updates, [])
+
+    def test_check_and_rebuild_commands(self):
+        seed_orders(3)
+        with self.assertRaises(CommandError):
+            call_command("check_customer_stats", stdout=io.StringIO())
+        call_command("rebuild_customer_stats", chunk_size=2, stdout=io.StringIO())
+        call_command("check_customer_stats", stdout=io.StringIO())
+
+        Customer.objects.filter(pk=self.ann.pk).update(order_count=7)
+        out = io.StringIO()
+        call_command("check_customer_stats", fix=True, stdout=out)
+        self.assertIn(f"Customer {self.ann.pk}: order_count is 7, expected 0", out.getvalue())
+        self.assertEqual(list(check_customer_stats()), [])
+
+
+class BenchmarkSuiteTests(TestCase):
+    def test_covers_every_operation_and_filter(self):
+        from graphene.utils.str_converters import to_camel_case
+        from .benchmarks import suite
+        from .filters import CustomerFilter, OrderFilter, ProductFilter
+
+        graphql_schema = schema.graphql_schema
+        self.assertLessEqual(set(graphql_schema.query_type.fields), set(suite.QUERIES))
+        self.assertEqual(set(graphql_schema.mutation_type.fields), set(suite.MUTATIONS))
+        covered = {(filterset, argument) for filterset, argument, _ in suite.filter_arguments()}
+        for filterset in (CustomerFilter, ProductFilter, OrderFilter):
+            for name in filterset.base_filters:
+                self.assertIn((filterset.__name__, to_camel_case(name)), covered)
+
+    def test_seed_command_and_every_case_runs(self):
+        from .benchmarks import suite
+
+        out = io.StringIO()
+        call_command("seed_crm", customers=20, products=10, orders=40, stdout=out)
+        self.assertIn("Seeded 20 customers, 10 products and 40 orders.", out.getvalue())
+        self.assertEqual(Order.objects.count(), 40)
+        self.assertEqual(list(check_customer_stats()), [])
+        Product.objects.update(stock=500)
+
+        with tempfile.TemporaryDirectory() as log_dir, \
+                mock.patch.object(cron, "LOG_FILE"), \
+                mock.patch.object(cron, "LOG_LOW_PROD_FILE"), \
+                mock.patch.object(tasks, "LOG_FILE"):
+            cases = suite.build_cases(executor.LocalExecutor(schema), log_dir)
+            results = {f"{group}:{name}": suite.measure(call, 1) for group, name, call in cases}
+
+        self.assertEqual(Order.objects.count(), 40)
+        self.assertEqual(results["query:hello"]["queries"], 0)
+        self.assertGreater(results["mutation:createOrder"]["queries"], 0)
+        baseline = {"cases": {key: dict(value, queries=value["queries"] - 1)
+                              for key, value in results.items()}}
+        regressions = suite.compare(baseline, {"cases": results}, 0.2, 1.0)
+        queries = results["query:orders"]["queries"]
+        self.assertIn(f"query:orders: {queries - 1} -> {queries} queries", regressions)
+
+
+@override_settings(CRM_RESPONSE_CACHE=None)
+class AsyncViewTests(ViewTestCase):
+    ORDERS = """
+        { orders { totalAmount customer { email } products { name } } }
+    """
+
+    async def apost(self, query, variables=None):
+        request = AsyncRequestFactory().post(
+            "/graphql/async", json.dumps({"query": query, "variables": variables}),
+            content_type="application/json",
+        )
+        response = await AsyncCRMGraphQLView.as_view(schema=schema)(request)
+        return json.loads(response.content)
+
+    def test_view_is_async(self):
+        self.assertTrue(asyncio.iscoroutinefunction(AsyncCRMGraphQLView.as_view(schema=schema)))
+
+    def test_lists_match_the_sync_view_with_batched_loads(self):
+        seed_orders(6)
+        expected = self.post(self.ORDERS)
+        with CaptureQueriesContext(connection) as ctx:
+            body = async_to_sync(self.apost)(self.ORDERS)
+        # orders joined to their customers, then one IN query for the product
+        # links; the products themselves come from the catalog the sync view filled
+        self.assertEqual(len(ctx.captured_queries), 2)
+        self.assertEqual(body, expected)
+
+    async def test_connection_and_stats(self):
+        await sync_to_async(seed_orders)(3)
+        body = await self.apost("""
+            {
+              allOrders(first: 2) { totalCount edges { node { customer { email } } } }
+              crmStats(groupBy: DAY) { totalOrders buckets { orders } }
+            }
+        """)
+        self.assertNotIn("errors", body)
+        self.assertEqual(body["data"]["allOrders"]["totalCount"], 3)
+        self.assertEqual(len(body["data"]["allOrders"]["edges"]), 2)
+        self.assertEqual(body["data"]["crmStats"]["totalOrders"], 3)
+        self.assertEqual(sum(b["orders"] for b in body["data"]["crmStats"]["buckets"]), 3)
+
+    def test_nested_django_connections_match_the_sync_view(self):
+        seed_orders(4)
+        query = """
+            {
+              allCustomers(first: 5) {
+                edges { node { email orderSet(first: 5) {
+                  totalCount edges { node { id totalAmount customer { email } products { name } } }
+                } } }
+              }
+            }
+        """
+        expected = self.post(query)
+        self.assertNotIn("errors", expected)
+        self.assertEqual(async_to_sync(self.apost)(query), expected)
+
+    async def test_mutations_run_in_a_worker_thread(self):
+        body = await self.apost("""
+            mutation { createCustomer(input: {name: "Ann", email: "ann@example.com"}) { customer { email } } }
+        """)
+        self.assertNotIn("errors", body)
+        self.assertTrue(await Customer.objects.filter(email="ann@example.com").aexists())
+
+    async def test_loader_batches_keys_requested_in_one_tick(self):
+        batches = []
+
+        async def load(keys):
+            batches.append(keys)
+            return {key: key * 10 for key in keys}
+
+        loader = BatchLoader(None, async_batch_load_fn=load)
+        loader.prime_many([4])
+        self.assertEqual(await asyncio.gather(*(loader.aload(key) for key in (1, 2, 1, 3))), [10, 20, 10, 30])
+        self.assertEqual(batches, [[4, 1, 2, 3]])
+        self.assertEqual(await loader.aload(4), 40)
+        self.assertEqual(len(batches), 1)
+
+
+class BatchedRequestTests(ViewTestCase):
+    def post_batch(self, operations):
+        request = RequestFactory().post(
+            "/graphql", json.dumps(operations), content_type="application/json"
+        )
+        response = self.view(request)
+        return response.status_code, json.loads(response.content)
+
+    def test_runs_every_operation_and_returns_an_array(self):
+        seed_orders(2)
+        status, body = self.post_batch([
+            {"id": "a", "query": "{ hello }"},
+            {"id": "b", "query": "query ($n: Int) { allOrders(first: $n) { totalCount } }",
+             "variables": {"n": 1}},
+        ])
+        self.assertEqual(status, 200)
+        self.assertEqual(body, [
+            {"data": {"hello": "Hello, GraphQL!"}, "id": "a", "status": 200},
+            {"data": {"allOrders": {"totalCount": 2}}, "id": "b", "status": 200},
+        ])
+
+    def test_operations_share_loaders_until_a_mutation(self):
+        with mock.patch("crm.views.Loaders", wraps=Loaders) as loaders:
+            self.post_batch([{"query": "{ hello }"}, {"query": "{ customers { id } }"}])
+            self.assertEqual(loaders.call_count, 1)
+
+            self.post_batch([
+                {"query": "{ hello }"},
+                {"query": 'mutation { createCustomer(input: {name: "A", email: "a@example.com"}) { message } }'},
+                {"query": "{ customers { email } }"},
+            ])
+            self.assertEqual(loaders.call_count, 3)
+
+    @override_settings(CRM_RESPONSE_CACHE={"BACKEND": "memory"})
+    def test_repeated_operations_hit_the_shared_response_cache(self):
+        seed_orders(3)
+        query = {"query": "{ orders { totalAmount } }"}
+        with self.assertNumQueries(1):
+            _, body = self.post_batch([query, query, query])
+        self.assertEqual(body[0]["data"], body[2]["data"])
+
+    def test_errors_and_batch_size_limit(self):
+        status, body = self.post_batch([{"query": "{ hello }"}, {"query": "{ nope }"}])
+        self.assertEqual(status, 400)
+        self.assertEqual([entry["status"] for entry in body], [200, 400])
+
+        with override_settings(CRM_QUERY_LIMITS={"MAX_BATCH_SIZE": 2}):
+            status, body = self.post_batch([{"query": "{ hello }"}] * 3)
+        self.assertEqual(status, 400)
+        self.assertIn("limited to 2 operations", body["errors"][0]["message"])
+
+
+@override_settings(CRM_RESPONSE_CACHE=None, CRM_PRODUCT_CATALOG=None)
+class InstrumentationTests(ViewTestCase):
+    QUERY = "query Dashboard { orders { totalAmount products { name } } }"
+
+    def setUp(self):
+        super().setUp()
+        registry.clear()
+        self.addCleanup(registry.clear)
+
+    def test_records_resolver_time_and_sql_per_operation(self):
+        seed_orders(3)
+        self.post(self.QUERY)
+        self.assertEqual(registry.operations["Dashboard"], 1)
+        # The orders query and the products prefetch
+        self.assertEqual(registry.sql_queries["Dashboard"], 2)
+        self.assertEqual(registry.resolver_calls["OrderType.products"], 3)
+        # Plain attribute reads are not wrapped outside tracing
+        self.assertNotIn("ProductType.name", registry.resolver_calls)
+
+        response = metrics_view(RequestFactory().get("/metrics/"))
+        text = response.content.decode()
+        self.assertIn('crm_graphql_operations_total{operation="Dashboard"} 1', text)
+        self.assertIn('crm_graphql_sql_queries_total{operation="Dashboard"} 2', text)
+        self.assertIn('crm_graphql_resolver_calls_total{path="OrderType.totalAmount"} 3', text)
+
+    def test_aliases_do_not_add_resolver_labels(self):
+        seed_orders(1)
+        self.post("{ orders { a: totalAmount } }")
+        self.post("{ mine: orders { b: totalAmount } }")
+        self.assertEqual(registry.resolver_calls["OrderType.totalAmount"], 2)
+        self.assertEqual(set(registry.resolver_calls), {"Query.orders", "OrderType.totalAmount"})
+
+    def test_metrics_endpoint_is_local_only(self):
+        request = RequestFactory().get("/metrics/", REMOTE_ADDR="10.0.0.7")
+        self.assertEqual(metrics_view(request).status_code, 403)
+
+    @override_settings(CRM_INSTRUMENTATION={"METRICS_TOKEN": "s3cret"})
+    def test_metrics_token(self):
+        # Behind a proxy every request is local; the token still has to match
+        request = RequestFactory().get("/metrics/")
+        self.assertEqual(metrics_view(request).status_code, 403)
+        request = RequestFactory().get("/metrics/", HTTP_AUTHORIZATION="Bearer wrong")
+        self.assertEqual(metrics_view(request).status_code, 403)
+        request = RequestFactory().get("/metrics/", HTTP_AUTHORIZATION="Bearer s3cret")
+        self.assertEqual(metrics_view(request).status_code, 200)
+
+    def test_tracing_extension(self):
+        seed_orders(1)
+        with override_settings(CRM_INSTRUMENTATION={"TRACING": True}):
+            body = self.post(self.QUERY)
+        tracing = body["extensions"]["tracing"]
+        self.assertEqual(tracing["sql"]["count"], 2)
+        paths = [resolver["path"] for resolver in tracing["execution"]["resolvers"]]
+        self.assertIn(["orders", 0, "products", 0, "name"], paths)
+        self.assertNotIn("extensions", self.post(self.QUERY))
+
+    def test_logs_likely_n_plus_one(self):
+        seed_orders(3)
+        with override_settings(CRM_INSTRUMENTATION={"N_PLUS_ONE_THRESHOLD": 3}), \
+                self.assertLogs("crm.instrumentation", "WARNING") as logs:
+            with instrument("Slow"):
+                orders = list(Order.objects.all())
+                # What a resolver bypassing the loaders would do
+                token = current_path.set("OrderType.customer")
+                for order in orders:
+                    order.customer
+                current_path.reset(token)
+        self.assertIn("4 SQL queries in GraphQL operation Slow", logs.output[0])
+        self.assertIn("3x from OrderType.customer", logs.output[0])
+        self.assertEqual(registry.n_plus_one["Slow"], 1)
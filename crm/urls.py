@@ -1,7 +1,10 @@
 from django.urls import path
-from graphene_django.views import GraphQLView
+from .views import AsyncCRMGraphQLView, CRMGraphQLView, ExportView, metrics_view
 from django.views.decorators.csrf import csrf_exempt
 
 urlpatterns = [
-    path("graphql", csrf_exempt(GraphQLView.as_view(graphiql=True))),
+    path("graphql", csrf_exempt(CRMGraphQLView.as_view(graphiql=True))),
+    path("graphql/async", csrf_exempt(AsyncCRMGraphQLView.as_view(graphiql=True))),
+    path("export/<slug:resource>", ExportView.as_view()),
+    path("metrics", metrics_view),
 ]
\ No newline at end of file
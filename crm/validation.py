@@ -0,0 +1,181 @@
+"""
+crm/validation.py
+Pre-execution cost and depth limits for GraphQL documents.
+
+QueryCostRule estimates how many objects a query can return before it runs.
+Every object field costs its weight (1 by default, 0 for scalars and for a
+connection's ``edges``/``node`` wrappers) times the number of rows its list
+can hold:
+
+* connections use ``first``/``last`` (or the relay max limit when missing),
+* the plain ``customers``/``products``/``orders`` lists use ``limit`` (or the
+  default page size),
+* other lists, like ``OrderType.products``, assume NESTED_LIST_SIZE rows.
+
+Arguments passed as variables count as the largest page allowed: documents
+are validated once and cached (crm/persisted.py) before any variables are
+seen.
+
+Configure it with the CRM_QUERY_LIMITS setting, e.g.
+
+    CRM_QUERY_LIMITS = {"MAX_COST": 20000, "MAX_DEPTH": 12}
+"""
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from graphene_django.settings import graphene_settings
+from graphql import (
+    FieldNode,
+    FragmentSpreadNode,
+    GraphQLError,
+    GraphQLList,
+    InlineFragmentNode,
+    IntValueNode,
+    ValidationRule,
+    get_named_type,
+    get_nullable_type,
+    is_leaf_type,
+)
+
+DEFAULT_SETTINGS = {
+    "MAX_COST": 10000,
+    "MAX_DEPTH": 10,
+    # Rows returned by the plain list fields when no limit is given
+    "DEFAULT_PAGE_SIZE": 100,
+    # Largest limit a plain list field accepts
+    "MAX_PAGE_SIZE": 1000,
+    # Rows assumed for nested lists without pagination arguments
+    "NESTED_LIST_SIZE": 10,
+    # "TypeName.fieldName" -> cost of one object of that field
+    "FIELD_WEIGHTS": {},
+    # Operations accepted in one batched request, each checked on its own
+    "MAX_BATCH_SIZE": 20,
+}
+
+PAGE_SIZE_ARGUMENTS = ("first", "last", "limit")
+
+
+def get_query_limits():
+    return {**DEFAULT_SETTINGS, **getattr(settings, "CRM_QUERY_LIMITS", {})}
+
+
+class QueryCostRule(ValidationRule):
+    """Rejects operations deeper than MAX_DEPTH or costlier than MAX_COST."""
+
+    def __init__(self, context):
+        super().__init__(context)
+        self.limits = get_query_limits()
+
+    def enter_operation_definition(self, node, *_):
+        root_type = self.context.schema.get_root_type(node.operation)
+        if root_type is None:
+            return
+        depth, cost = self.measure(root_type, node.selection_set, set())
+
+        if depth > self.limits["MAX_DEPTH"]:
+            self.report_error(GraphQLError(
+                f"Query depth {depth} exceeds the maximum depth of {self.limits['MAX_DEPTH']}.",
+                node,
+            ))
+        if cost > self.limits["MAX_COST"]:
+            self.report_error(GraphQLError(
+                f"Query cost {cost} exceeds the maximum cost of {self.limits['MAX_COST']}.",
+                node,
+            ))
+
+    def measure(self, parent_type, selection_set, fragments_seen):
+        """Return ``(depth, cost)`` of a selection set on ``parent_type``."""
+        depth = cost = 0
+        if selection_set is None:
+            return depth, cost
+
+        for selection in selection_set.selections:
+            if isinstance(selection, FieldNode):
+                field_depth, field_cost = self.measure_field(parent_type, selection, fragments_seen)
+                depth = max(depth, field_depth)
+                cost += field_cost
+                continue
+
+            if isinstance(selection, InlineFragmentNode):
+                fragment_type = parent_type
+                if selection.type_condition is not None:
+                    fragment_type = self.context.schema.get_type(selection.type_condition.name.value)
+                fragment_selection = selection.selection_set
+            elif isinstance(selection, FragmentSpreadNode):
+                name = selection.name.value
+                fragment = self.context.get_fragment(name)
+                # Unknown and cyclic fragments are reported by the standard rules
+                if fragment is None or name in fragments_seen:
+                    continue
+                fragments_seen = fragments_seen | {name}
+                fragment_type = self.context.schema.get_type(fragment.type_condition.name.value)
+                fragment_selection = fragment.selection_set
+            else:
+                continue
+
+            if fragment_type is None or not hasattr(fragment_type, "fields"):
+                continue
+            fragment_depth, fragment_cost = self.measure(fragment_type, fragment_selection, fragments_seen)
+            depth = max(depth, fragment_depth)
+            cost += fragment_cost
+        return depth, cost
+
+    def measure_field(self, parent_type, node, fragments_seen):
+        name = node.name.value
+        field_def = getattr(parent_type, "fields", {}).get(name)
+        if name.startswith("__") or field_def is None:
+            return 0, 0
+
+        named_type = get_named_type(field_def.type)
+        if is_leaf_type(named_type):
+            weight = self.limits["FIELD_WEIGHTS"].get(f"{parent_type.name}.{name}", 0)
+            return 1, weight
+
+        # edges/node only wrap the rows their connection already paid for
+        wrapper = (
+            (name == "edges" and "pageInfo" in parent_type.fields)
+            or (name == "node" and "cursor" in parent_type.fields)
+        )
+        weight = self.limits["FIELD_WEIGHTS"].get(f"{parent_type.name}.{name}", 0 if wrapper else 1)
+        child_depth, child_cost = self.measure(named_type, node.selection_set, fragments_seen)
+        return child_depth + 1, self.field_size(parent_type, node, field_def) * (weight + child_cost)
+
+    def field_size(self, parent_type, node, field_def):
+        """Number of rows ``node`` can return."""
+        if "edges" in getattr(get_named_type(field_def.type), "fields", {}):
+            default = graphene_settings.RELAY_CONNECTION_MAX_LIMIT or self.limits["MAX_PAGE_SIZE"]
+            return self.page_size_argument(node, default, default)
+        if "limit" in field_def.args:
+            return self.page_size_argument(
+                node, self.limits["DEFAULT_PAGE_SIZE"], self.limits["MAX_PAGE_SIZE"]
+            )
+        if isinstance(get_nullable_type(field_def.type), GraphQLList):
+            # A connection's edges list was already sized by its connection field
+            if node.name.value == "edges" and "pageInfo" in parent_type.fields:
+                return 1
+            return self.limits["NESTED_LIST_SIZE"]
+        return 1
+
+    def page_size_argument(self, node, default, largest):
+        for argument in node.arguments or ():
+            if argument.name.value not in PAGE_SIZE_ARGUMENTS:
+                continue
+            if isinstance(argument.value, IntValueNode):
+                return int(argument.value.value)
+            return largest
+        return default
+
+
+def paginate_list(queryset, limit=None, offset=None):
+    """Slice a plain list field to ``limit`` rows, capped at MAX_PAGE_SIZE."""
+    limits = get_query_limits()
+    if limit is None:
+        limit = limits["DEFAULT_PAGE_SIZE"]
+    if limit < 0 or limit > limits["MAX_PAGE_SIZE"]:
+        raise ValidationError(f"limit must be between 0 and {limits['MAX_PAGE_SIZE']}")
+    offset = offset or 0
+    if offset < 0:
+        raise ValidationError("offset cannot be negative")
+    if not queryset.ordered:
+        queryset = queryset.order_by("pk")
+    return queryset[offset:offset + limit]
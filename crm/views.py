@@ -1,3 +1,384 @@
-from django.shortcuts import render
+import hmac
+from inspect import isawaitable
 
-# Create your views here.
+from asgiref.sync import sync_to_async
+from django.db import connection, transaction
+from django.http import (
+    Http404, HttpResponse, HttpResponseForbidden, HttpResponseNotAllowed, JsonResponse,
+    StreamingHttpResponse,
+)
+from django.http.response import HttpResponseBadRequest
+from django.views import View
+from graphene_django.constants import MUTATION_ERRORS_FLAG
+from graphene_django.settings import graphene_settings
+from graphene_django.utils.utils import set_rollback
+from graphene_django.views import GraphQLView, HttpError
+from graphql import ExecutionResult, GraphQLError, OperationType, execute, get_operation_ast, validate_schema
+from graphql.execution.middleware import MiddlewareManager
+from graphql.validation import specified_rules
+
+from .cache import MemoryResponseCache, get_response_cache, response_cache_key
+from .exports import EXPORTS, FORMATS
+from .fields import SyncOnlyFieldsMiddleware, sync_only_fields
+from .instrumentation import (
+    RESOLVER_TIMING, attach_tracing, get_instrumentation_settings, instrument,
+    operation_label, registry,
+)
+from .loaders import Loaders
+from .persisted import get_document_registry, get_persisted_query_hash
+from .validation import QueryCostRule, get_query_limits
+
+
+class CRMGraphQLView(GraphQLView):
+    """
+    GraphQLView that gives every request its own set of batch loaders, takes
+    documents from the persisted-query registry (crm/persisted.py) instead
+    of parsing and validating them each time, and serves read-only
+    operations from the response cache (crm/cache.py). Documents over the
+    cost or depth budget are rejected before they run (crm/validation.py).
+
+    POSTing a JSON array runs each operation in turn with one shared context
+    and returns an array of results, each with its ``id`` and ``status``.
+
+    Each executed operation is timed and its SQL counted
+    (crm/instrumentation.py).
+    """
+
+    validation_rules = (*specified_rules, QueryCostRule)
+
+    def parse_body(self, request):
+        # A JSON array is a batch of operations; each request gets its own view
+        # instance, so switching it to batch mode here is safe
+        if self.get_content_type(request) == "application/json":
+            self.batch = request.body.lstrip().startswith(b"[")
+        data = super().parse_body(request)
+        if self.batch:
+            max_batch_size = get_query_limits()["MAX_BATCH_SIZE"]
+            if len(data) > max_batch_size:
+                raise HttpError(HttpResponseBadRequest(
+                    f"Batches are limited to {max_batch_size} operations."
+                ))
+        return data
+
+    def get_middleware(self, request):
+        middleware = super().get_middleware(request)
+        if not get_instrumentation_settings()["ENABLED"]:
+            return middleware
+        if isinstance(middleware, MiddlewareManager):
+            return MiddlewareManager(*middleware.middlewares, RESOLVER_TIMING)
+        return [*(middleware or ()), RESOLVER_TIMING]
+
+    def get_response(self, request, data, show_graphiql=False):
+        query, variables, operation_name, id = self.get_graphql_params(request, data)
+
+        execution_result = self.execute_graphql_request(
+            request, data, query, variables, operation_name, show_graphiql
+        )
+
+        if getattr(request, MUTATION_ERRORS_FLAG, False) is True:
+            set_rollback()
+
+        if execution_result is None:
+            return None, 200
+        if execution_result.errors:
+            set_rollback()
+        return self.format_response(request, execution_result, id, show_graphiql)
+
+    def format_response(self, request, execution_result, id=None, pretty=False):
+        """Return ``(json, status_code)``, keeping the result's extensions."""
+        status_code = 200
+        response = {}
+        if execution_result.errors:
+            response["errors"] = [self.format_error(e) for e in execution_result.errors]
+        if execution_result.errors and any(
+            not getattr(e, "path", None) for e in execution_result.errors
+        ):
+            status_code = 400
+        else:
+            response["data"] = execution_result.data
+        if execution_result.extensions:
+            response["extensions"] = execution_result.extensions
+
+        if self.batch:
+            response["id"] = id
+            response["status"] = status_code
+
+        return self.json_encode(request, response, pretty=pretty), status_code
+
+    def get_context(self, request):
+        # Every operation of a batch shares the request and its loaders
+        if getattr(request, "loaders", None) is None:
+            request.loaders = Loaders()
+        return request
+
+    def resolve_document(self, request, data, query, operation_name, show_graphiql=False):
+        """
+        Find the parsed, validated document for a request. Returns
+        ``(entry, operation_ast, None)``, or ``(None, None, result)`` when the
+        request ends early with ``result``.
+        """
+        sha256_hash = get_persisted_query_hash(request, data)
+        if not query and not sha256_hash:
+            if show_graphiql:
+                return None, None, None
+            raise HttpError(HttpResponseBadRequest("Must provide query string."))
+
+        schema = self.schema.graphql_schema
+
+        schema_validation_errors = validate_schema(schema)
+        if schema_validation_errors:
+            return None, None, ExecutionResult(data=None, errors=schema_validation_errors)
+
+        try:
+            entry, errors = get_document_registry(schema, self.validation_rules).resolve(
+                query, sha256_hash
+            )
+        except GraphQLError as e:
+            return None, None, ExecutionResult(errors=[e])
+        if errors:
+            return None, None, ExecutionResult(data=None, errors=errors)
+
+        operation_ast = get_operation_ast(entry.document, operation_name)
+
+        if (
+            request.method.lower() == "get"
+            and operation_ast is not None
+            and operation_ast.operation != OperationType.QUERY
+        ):
+            if show_graphiql:
+                return None, None, None
+
+            raise HttpError(
+                HttpResponseNotAllowed(
+                    ["POST"],
+                    "Can only perform a {} operation from a POST request.".format(
+                        operation_ast.operation.value
+                    ),
+                )
+            )
+
+        return entry, operation_ast, None
+
+    def execute_graphql_request(self, request, data, query, variables,
+                                operation_name, show_graphiql=False):
+        entry, operation_ast, result = self.resolve_document(
+            request, data, query, operation_name, show_graphiql
+        )
+        if entry is None:
+            return result
+
+        cache = get_response_cache()
+        if cache is None or operation_ast is None or operation_ast.operation != OperationType.QUERY:
+            return self.execute_document(request, entry.document, variables, operation_name, operation_ast)
+
+        key = response_cache_key(entry.normalized, variables, operation_name)
+        cached = cache.get(key)
+        if cached is not None:
+            registry.observe_cache_hit(operation_label(operation_ast, operation_name))
+            return ExecutionResult(data=cached)
+
+        generation = cache.generation()
+        result = self.execute_document(request, entry.document, variables, operation_name, operation_ast)
+        if not result.errors:
+            cache.set(key, result.data, generation)
+        return result
+
+    def get_execute_options(self, request, variables, operation_name):
+        execute_options = {
+            "root_value": self.get_root_value(request),
+            "context_value": self.get_context(request),
+            "variable_values": variables,
+            "operation_name": operation_name,
+            "middleware": self.get_middleware(request),
+        }
+        if self.execution_context_class:
+            execute_options["execution_context_class"] = self.execution_context_class
+        return execute_options
+
+    def execute_document(self, request, document, variables, operation_name, operation_ast):
+        with instrument(operation_label(operation_ast, operation_name)) as metrics:
+            result = self.run_document(request, document, variables, operation_name, operation_ast)
+        return attach_tracing(result, metrics)
+
+    def run_document(self, request, document, variables, operation_name, operation_ast):
+        try:
+            execute_options = self.get_execute_options(request, variables, operation_name)
+
+            if (
+                operation_ast is not None
+                and operation_ast.operation == OperationType.MUTATION
+                and (
+                    graphene_settings.ATOMIC_MUTATIONS is True
+                    or connection.settings_dict.get("ATOMIC_MUTATIONS", False) is True
+                )
+            ):
+                with transaction.atomic():
+                    result = execute(self.schema.graphql_schema, document, **execute_options)
+                    if getattr(request, MUTATION_ERRORS_FLAG, False) is True:
+                        transaction.set_rollback(True)
+                return result
+
+            return execute(self.schema.graphql_schema, document, **execute_options)
+        except Exception as e:
+            return ExecutionResult(errors=[e])
+        finally:
+            if operation_ast is not None and operation_ast.operation == OperationType.MUTATION:
+                # Later operations in the batch must not see rows loaded before the write
+                request.loaders = None
+
+
+class AsyncCRMGraphQLView(CRMGraphQLView):
+    """
+    CRMGraphQLView for ASGI. Queries run on the event loop: the list fields,
+    crmStats and the batch loaders use the async ORM. Only the connection
+    fields' filtering and slicing, and the reverse relations graphene-django
+    resolves itself (sync_only_fields), go through ``sync_to_async``.
+    Mutations keep their transactions and row locks by running whole in a
+    worker thread. GraphiQL is rendered by the sync view.
+    """
+
+    view_is_async = True
+
+    def get_middleware(self, request):
+        middleware = super().get_middleware(request)
+        # Reverse relations left to graphene-django still need the sync ORM
+        sync_fields = SyncOnlyFieldsMiddleware(sync_only_fields(self.schema))
+        if isinstance(middleware, MiddlewareManager):
+            return MiddlewareManager(*middleware.middlewares, sync_fields)
+        return [*(middleware or ()), sync_fields]
+
+    async def dispatch(self, request, *args, **kwargs):
+        try:
+            if request.method.lower() not in ("get", "post"):
+                raise HttpError(
+                    HttpResponseNotAllowed(
+                        ["GET", "POST"], "GraphQL only supports GET and POST requests."
+                    )
+                )
+
+            data = self.parse_body(request)
+            if self.graphiql and self.can_display_graphiql(request, data):
+                return await sync_to_async(super().dispatch)(request, *args, **kwargs)
+
+            if self.batch:
+                responses = [await self.aget_response(request, entry) for entry in data]
+                result = "[{}]".format(",".join(response[0] for response in responses))
+                status_code = max((response[1] for response in responses), default=200)
+            else:
+                result, status_code = await self.aget_response(request, data)
+
+            return HttpResponse(status=status_code, content=result, content_type="application/json")
+
+        except HttpError as e:
+            response = e.response
+            response["Content-Type"] = "application/json"
+            response.content = self.json_encode(request, {"errors": [self.format_error(e)]})
+            return response
+
+    async def aget_response(self, request, data):
+        query, variables, operation_name, id = self.get_graphql_params(request, data)
+        execution_result = await self.aexecute_graphql_request(
+            request, data, query, variables, operation_name
+        )
+        return self.format_response(request, execution_result, id)
+
+    async def aexecute_graphql_request(self, request, data, query, variables, operation_name):
+        entry, operation_ast, result = self.resolve_document(request, data, query, operation_name)
+        if entry is None:
+            return result
+
+        if operation_ast is None or operation_ast.operation != OperationType.QUERY:
+            return await sync_to_async(self.execute_document)(
+                request, entry.document, variables, operation_name, operation_ast
+            )
+
+        cache = get_response_cache()
+        if cache is None:
+            return await self.aexecute_document(
+                request, entry.document, variables, operation_name, operation_ast
+            )
+
+        key = response_cache_key(entry.normalized, variables, operation_name)
+        cached = await call_cache(cache, "get", key)
+        if cached is not None:
+            registry.observe_cache_hit(operation_label(operation_ast, operation_name))
+            return ExecutionResult(data=cached)
+
+        generation = await call_cache(cache, "generation")
+        result = await self.aexecute_document(
+            request, entry.document, variables, operation_name, operation_ast
+        )
+        if not result.errors:
+            await call_cache(cache, "set", key, result.data, generation)
+        return result
+
+    async def aexecute_document(self, request, document, variables, operation_name, operation_ast):
+        with instrument(operation_label(operation_ast, operation_name)) as metrics:
+            try:
+                result = execute(
+                    self.schema.graphql_schema, document,
+                    **self.get_execute_options(request, variables, operation_name)
+                )
+                if isawaitable(result):
+                    result = await result
+            except Exception as e:
+                result = ExecutionResult(errors=[e])
+        return attach_tracing(result, metrics)
+
+
+async def call_cache(cache, method, *args):
+    # The memory cache never blocks; other backends do network I/O
+    if isinstance(cache, MemoryResponseCache):
+        return getattr(cache, method)(*args)
+    return await sync_to_async(getattr(cache, method))(*args)
+
+
+class ExportView(View):
+    """
+    Streams every customer or order matching the CustomerFilter/OrderFilter
+    query parameters as NDJSON (default) or CSV (``?format=csv``), e.g.
+    ``/export/orders/?format=csv&order_date_gte=2025-01-01``.
+    """
+
+    chunk_size = 2000
+
+    def get(self, request, resource):
+        export = EXPORTS.get(resource)
+        if export is None:
+            raise Http404(f"Unknown export: {resource}")
+
+        export_format = request.GET.get("format", "ndjson")
+        if export_format not in FORMATS:
+            return HttpResponseBadRequest(
+                f"Unknown format {export_format!r}, use one of: {', '.join(FORMATS)}"
+            )
+        content_type, encode = FORMATS[export_format]
+
+        filterset = export.filterset_class(
+            request.GET, queryset=export.model._default_manager.all()
+        )
+        if not filterset.is_valid():
+            return JsonResponse({"errors": filterset.errors}, status=400)
+
+        response = StreamingHttpResponse(
+            encode(export, export.queryset(filterset), self.chunk_size),
+            content_type=content_type,
+        )
+        response["Content-Disposition"] = f'attachment; filename="{resource}.{export_format}"'
+        return response
+
+
+def metrics_view(request):
+    """
+    Prometheus text exposition of crm/instrumentation.py, for scrapers on
+    METRICS_ALLOWED_IPS that send METRICS_TOKEN when one is set.
+    """
+    config = get_instrumentation_settings()
+    if request.META.get("REMOTE_ADDR") not in config["METRICS_ALLOWED_IPS"]:
+        return HttpResponseForbidden()
+    token = config["METRICS_TOKEN"]
+    if token and not hmac.compare_digest(
+        request.META.get("HTTP_AUTHORIZATION", ""), f"Bearer {token}"
+    ):
+        return HttpResponseForbidden()
+    return HttpResponse(registry.render(), content_type="text/plain; version=0.0.4; charset=utf-8")